@@ -0,0 +1,207 @@
+"""
+Compare the evaluation throughput of sending cheap solutions to the pool one per task
+against sending them in chunks, through `EvaluationService.run` and `StemEvaluator`
+with evalplus' checks like `Evaluator.evaluate_solutions`:
+
+    single:  `max_chunk_size=1`, one solution per task
+    chunked: chunks sized to take about `--target-chunk-time` seconds at the runtime
+             observed so far, capped at `--max-chunk-size`
+
+Each corpus program is a problem with random inputs, its ground truth recorded by
+evalplus' `trusted_exec`. Solutions are sampled from the program's mutants and from
+variants with an operator flipped, so some of them fail. Both modes start from an
+empty verdict cache and must reach the same verdicts.
+
+Usage:
+    python benchmarks/batched_evaluation.py [--samples N] [--workers N] [--max-chunk-size N]
+"""
+import argparse
+import ast
+import random
+import re
+import sys
+import time
+from itertools import chain
+
+from corpus import load_corpus
+from evalplus.gen.util import trusted_exec
+from loguru import logger
+
+from inference.evaluation_service import EvaluationService
+from inference.stem_evaluator import StemEvaluator
+from inference.verdict_cache import VerdictCache
+from mutations import OneByOneTransformer, fused_transform
+from mutations.registry import MutationRegistry
+from shared.ast_utils import ParsedProgram
+from shared.structs import BenchmarkResult
+
+# Random arguments for the entry points of the builtin corpus
+INPUTS = {
+    "has_close_elements": lambda rng: [
+        [round(rng.uniform(0, 10), 2) for _ in range(rng.randint(2, 30))],
+        rng.choice([0.05, 0.3, 1.0]),
+    ],
+    "separate_paren_groups": lambda rng: [
+        "".join(rng.choice(["()", "(())", "((()))", "()()"]) for _ in range(8))
+    ],
+    "max_fill": lambda rng: [
+        [[rng.randint(0, 1) for _ in range(6)] for _ in range(rng.randint(1, 8))],
+        rng.randint(1, 5),
+    ],
+    "find_char_long": lambda rng: [
+        " ".join(
+            rng.choice(["stop", "word", "a", "longer", "abc1", "xyzzy"])
+            for _ in range(rng.randint(0, 20))
+        )
+    ],
+    "count_ways": lambda rng: [rng.randint(1, 60)],
+}
+
+
+class CorpusDatasetManager:
+    """
+    The parts of `DatasetManager` `StemEvaluator` uses, over corpus programs.
+    """
+
+    dataset_name = "mbpp"
+    dataset_hash = "corpus"
+
+    def __init__(self, programs: list[str], n_base: int, n_plus: int):
+        rng = random.Random(0)
+        self.problems = {}
+        self.correct = {}
+        for i, program in enumerate(programs):
+            entry_point = re.search(r"def (\w+)", program).group(1)
+            if entry_point not in INPUTS:
+                continue
+            problem_id = f"Corpus/{i}"
+            self.problems[problem_id] = problem = {
+                "task_id": problem_id,
+                "prompt": "",
+                "canonical_solution": program,
+                "entry_point": entry_point,
+                "atol": 0,
+                "base_input": [INPUTS[entry_point](rng) for _ in range(n_base)],
+                "plus_input": [INPUTS[entry_point](rng) for _ in range(n_plus)],
+            }
+            oracle = {}
+            for split in ("base", "plus"):
+                oracle[split], oracle[f"{split}_time"] = trusted_exec(
+                    program, problem[f"{split}_input"], entry_point, record_time=True
+                )
+            self.correct[problem_id] = oracle
+
+    def get_problem(self, problem_id):
+        return self.problems[problem_id]
+
+    def get_correct(self, problem_id):
+        return self.correct[problem_id]
+
+
+def variants(program: str, transformers) -> list[str]:
+    random.seed(0)
+    mutants = [
+        mutant for _, mutant in fused_transform(transformers, ParsedProgram(program))
+    ]
+    flipped = [
+        program[: match.start()] + " - " + program[match.end() :]
+        for match in re.finditer(r" \+ ", program)
+    ]
+    return [program] + mutants + flipped
+
+
+def solutions_of(program, transformers, n_samples, rng) -> dict[str, list[str]]:
+    pool = variants(program, transformers)
+    return {
+        "original": [rng.choice(pool) for _ in range(n_samples // 2)],
+        "mutated": [rng.choice(pool) for _ in range(n_samples - n_samples // 2)],
+    }
+
+
+def run(dataset_manager, solutions, args, max_chunk_size) -> tuple[float, int, dict]:
+    service = EvaluationService(
+        max_workers=args.workers,
+        max_tasks=args.max_tasks,
+        queue_factor=args.queue_factor,
+        max_chunk_size=max_chunk_size,
+        target_chunk_time=args.target_chunk_time,
+    )
+    verdict_cache = VerdictCache()
+    evaluations = []
+    for problem_id in dataset_manager.problems:
+        evaluation = StemEvaluator(
+            dataset_manager=dataset_manager,
+            problem_id=problem_id,
+            verdict_cache=verdict_cache,
+        )
+        result = BenchmarkResult(problem_id, "corpus", "0", "0", 0.8)
+        evaluation.start({problem_id: solutions[problem_id]}, {problem_id: result})
+        evaluations.append(evaluation)
+
+    start = time.perf_counter()
+    try:
+        finished = list(service.run(evaluations))
+    finally:
+        service.close()
+    elapsed = time.perf_counter() - start
+
+    n_evaluated = sum(evaluation.n_evaluated for evaluation in finished)
+    pass_stats = {
+        key: dict(stats)
+        for evaluation in finished
+        for key, stats in evaluation.pass_stats.items()
+    }
+    return elapsed, n_evaluated, pass_stats
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--corpus", default=None)
+    parser.add_argument("--samples", type=int, default=100)
+    parser.add_argument("--base-inputs", type=int, default=10)
+    parser.add_argument("--plus-inputs", type=int, default=30)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--queue-factor", type=int, default=2)
+    parser.add_argument("--max-tasks", type=int, default=15)
+    parser.add_argument("--max-chunk-size", type=int, default=32)
+    parser.add_argument("--target-chunk-time", type=float, default=0.5)
+    args = parser.parse_args()
+
+    # Every failing solution is logged as a warning
+    logger.remove()
+    logger.add(sys.stderr, level="ERROR")
+
+    programs = [ast.unparse(ast.parse(code)) for code in load_corpus(args.corpus)]
+    dataset_manager = CorpusDatasetManager(programs, args.base_inputs, args.plus_inputs)
+    transformers = [
+        transformer()
+        for transformer in chain.from_iterable(MutationRegistry.get())
+        if issubclass(transformer, OneByOneTransformer)
+    ]
+    rng = random.Random(0)
+    solutions = {
+        problem_id: solutions_of(
+            problem["canonical_solution"], transformers, args.samples, rng
+        )
+        for problem_id, problem in dataset_manager.problems.items()
+    }
+    print(
+        f"Problems: {len(dataset_manager.problems)}, samples: {args.samples} each, "
+        f"workers: {args.workers}"
+    )
+
+    results = {}
+    for label, max_chunk_size in (("single", 1), ("chunked", args.max_chunk_size)):
+        elapsed, n_evaluated, results[label] = run(
+            dataset_manager, solutions, args, max_chunk_size
+        )
+        print(
+            f"{label:>8}: {elapsed:6.2f}s, {n_evaluated} solutions evaluated, "
+            f"{n_evaluated / elapsed:8.1f} solutions/s"
+        )
+
+    print(f"Same verdicts: {results['single'] == results['chunked']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Small corpus of HumanEval/MBPP-sized programs used by the benchmark scripts.
+
+Pass `--corpus <dir>` to any benchmark to run it on your own `*.py` files instead
+(e.g. canonical solutions dumped from `.cache`).
+"""
+import os
+import pathlib
+import sys
+
+# Benchmarks import the package modules the same way the tests do
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../src")))
+
+PROGRAMS = [
+    '''
+def has_close_elements(numbers: list, threshold: float) -> bool:
+    """Check if in given list of numbers, are any two numbers closer to each other than threshold."""
+    for idx, elem in enumerate(numbers):
+        for idx2, elem2 in enumerate(numbers):
+            if idx != idx2:
+                distance = abs(elem - elem2)
+                if distance < threshold:
+                    return True
+    return False
+''',
+    '''
+def separate_paren_groups(paren_string: str) -> list:
+    result = []
+    current_string = []
+    current_depth = 0
+    for c in paren_string:
+        if c == '(':
+            current_depth += 1
+            current_string.append(c)
+        elif c == ')':
+            current_depth -= 1
+            current_string.append(c)
+            if current_depth == 0:
+                result.append(''.join(current_string))
+                current_string.clear()
+    return result
+''',
+    '''
+def max_fill(grid, capacity):
+    total = 0
+    counts = {}
+    for i in range(len(grid)):
+        row_sum = 0
+        for j in range(0, len(grid[i]), 1):
+            row_sum += grid[i][j] * 2
+        if row_sum > 0:
+            total += (row_sum + capacity - 1) // capacity
+        else:
+            total = total - 0
+        counts[i] = row_sum / 2
+    while total > 100 and not (total % 2 == 0 or total < 0):
+        total -= 1
+    return total
+''',
+    '''
+def find_char_long(text):
+    words = []
+    buffer = ""
+    idx = 0
+    while idx < len(text):
+        ch = text[idx]
+        if ch == " ":
+            if len(buffer) >= 4:
+                words.append(buffer)
+            buffer = ""
+        else:
+            buffer = buffer + ch
+        idx += 1
+    if len(buffer) >= 4 and buffer != "stop":
+        words.append("word: " + buffer)
+    flag = True
+    for w in words[::-1]:
+        flag = flag and w.isalpha()
+    return words if flag else [w for w in words if w.isalpha()]
+''',
+    '''
+def count_ways(n):
+    A = [0] * (n + 1)
+    B = [0] * (n + 1)
+    A[0] = 1
+    A[1] = 0
+    B[0] = 0
+    B[1] = 1
+    for i in range(2, n + 1):
+        A[i] = A[i - 2] + 2 * B[i - 1]
+        B[i] = A[i - 1] + B[i - 2]
+    scale = -1
+    if n % 2 == 1:
+        scale = 0x10 - 15
+    return A[n] * -scale
+''',
+]
+
+
+def load_corpus(directory: str = None, repeat: int = 1) -> list[str]:
+    """
+    Load `*.py` programs from `directory`, or the builtin corpus if none is given.
+
+    `repeat` concatenates each program with renamed copies of itself to emulate
+    longer canonical solutions.
+    """
+    if directory:
+        programs = [
+            path.read_text() for path in sorted(pathlib.Path(directory).glob("*.py"))
+        ]
+    else:
+        programs = [program.strip() + "\n" for program in PROGRAMS]
+
+    if repeat <= 1:
+        return programs
+
+    expanded = []
+    for program in programs:
+        copies = [program.replace("def ", f"def v{i}_", 1) for i in range(repeat)]
+        expanded.append("\n\n".join(copies))
+    return expanded
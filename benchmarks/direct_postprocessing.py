@@ -0,0 +1,152 @@
+"""
+Check that the fused direct-completion normalizer formats model outputs like the
+stepwise pipeline it replaces, and compare their speed:
+
+    stepwise: truncate, fix odd indents, autopep8 and strip comments one after another
+    fused:    `normalize_direct_completion`, falling back to stepwise if it returns None
+
+Both are followed by black like `Processors.postprocess_eval(direct=True)`. Model
+outputs are corpus programs with the kind of noise direct completions come with:
+trailing tests and prose, comments, two-space or tab indentation, stray odd indents
+and cut-off generations. Outputs only one of them formats, or that both format
+differently, are counted and the latter printed.
+
+Usage:
+    python benchmarks/direct_postprocessing.py [--corpus DIR] [--variants N]
+"""
+import argparse
+import random
+import re
+import time
+from collections import Counter
+
+import black
+from corpus import load_corpus
+
+from inference.processors import BLACK_MODE, Processors
+from shared.program_utils import normalize_direct_completion
+
+TRAILERS = [
+    "\n\n# Test cases\nprint({name}(1))\nassert {name}(2) is not None\n",
+    '\n\nif __name__ == "__main__":\n    print({name}(3))\n',
+    "\n```\n\nThis function handles the edge cases described above.\n",
+    "\n\n\n",
+]
+
+
+def reindent(code: str, width: str) -> str:
+    return re.sub(
+        r"^((?:    )+)",
+        lambda match: width * (len(match.group(1)) // 4),
+        code,
+        flags=re.MULTILINE,
+    )
+
+
+def model_output(code: str, rng: random.Random) -> str:
+    name = re.search(r"def (\w+)", code).group(1)
+    lines = code.splitlines()
+    body = [i for i, line in enumerate(lines) if line.startswith("    ")]
+    if body and rng.random() < 0.5:
+        i = rng.choice(body)
+        lines[i] = f"{lines[i]}  # {rng.choice(['update', 'edge case', 'done'])}"
+    if body and rng.random() < 0.3:
+        i = rng.choice(body)
+        indent = lines[i][: len(lines[i]) - len(lines[i].lstrip())]
+        lines.insert(i, f"{indent}# Step {i}")
+    if body and rng.random() < 0.1:
+        # A stray space the stepwise pipeline's odd-indent fix is there for
+        i = rng.choice(body)
+        lines[i] = " " + lines[i]
+    code = "\n".join(lines)
+
+    roll = rng.random()
+    if roll < 0.2:
+        code = reindent(code, "  ")
+    elif roll < 0.3:
+        code = reindent(code, "\t")
+    if rng.random() < 0.1:
+        code = code[: rng.randrange(len(code) // 2, len(code))]
+    return code + rng.choice(TRAILERS).format(name=name)
+
+
+def postprocess(code: str, normalize, timings: list[float]) -> str | None:
+    try:
+        start = time.perf_counter()
+        normalized = normalize(code.rstrip("\n"))
+        timings.append(time.perf_counter() - start)
+        return black.format_str(normalized, mode=BLACK_MODE)
+    except Exception:
+        return None
+
+
+def fused(code: str) -> str:
+    normalized = normalize_direct_completion(code)
+    if normalized is None:
+        return Processors.normalize_direct_stepwise(code)
+    return normalized
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--corpus", default=None)
+    parser.add_argument("--variants", type=int, default=100)
+    parser.add_argument("--show", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    outputs = [
+        model_output(code, rng)
+        for code in load_corpus(args.corpus)
+        for _ in range(args.variants)
+    ]
+
+    results = {}
+    for label, normalize in (
+        ("stepwise", Processors.normalize_direct_stepwise),
+        ("fused", fused),
+    ):
+        timings = []
+        start = time.perf_counter()
+        results[label] = [postprocess(code, normalize, timings) for code in outputs]
+        elapsed = time.perf_counter() - start
+        print(
+            f"{label:>8}: {elapsed * 1000 / len(outputs):6.2f} ms per output, "
+            f"{sum(timings) * 1000 / len(timings):6.2f} ms before black, "
+            f"{sum(result is not None for result in results[label])} of "
+            f"{len(outputs)} formatted"
+        )
+
+    fallbacks = sum(normalize_direct_completion(code) is None for code in outputs)
+    outcomes = Counter()
+    shown = 0
+    for code, stepwise_result, fused_result in zip(
+        outputs, results["stepwise"], results["fused"]
+    ):
+        if stepwise_result == fused_result:
+            outcomes["identical"] += 1
+        elif stepwise_result is None:
+            outcomes["only fused formatted"] += 1
+        elif fused_result is None:
+            outcomes["only stepwise formatted"] += 1
+        else:
+            outcomes["different"] += 1
+        if stepwise_result and fused_result and stepwise_result != fused_result:
+            if shown >= args.show:
+                continue
+            shown += 1
+            print(f"--- output\n{code}\n--- stepwise\n{stepwise_result}")
+            print(f"--- fused\n{fused_result}")
+
+    for outcome in (
+        "identical",
+        "different",
+        "only fused formatted",
+        "only stepwise formatted",
+    ):
+        print(f"{outcome:>24}: {outcomes[outcome]}")
+    print(f"Fused fell back to stepwise on {fallbacks} of {len(outputs)}")
+
+
+if __name__ == "__main__":
+    main()
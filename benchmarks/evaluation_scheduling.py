@@ -0,0 +1,92 @@
+"""
+Compare how `StemEvaluator` feeds its process pool, on a synthetic mix of fast
+solutions and solutions that run into their time limit:
+
+    barrier: submit `batch_size` tasks and wait for the whole batch to drain
+    window:  keep `queue_factor * workers` tasks in flight with `bounded_submit`
+
+Worker utilization is the total task time over `workers * wall time`.
+
+Usage:
+    python benchmarks/evaluation_scheduling.py [--tasks N] [--workers N] [--timeout-rate P]
+"""
+import argparse
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import partial
+
+import corpus  # noqa: F401 (puts the package modules on the path)
+
+from shared.pool_utils import bounded_submit
+
+
+def fake_check(duration: float) -> float:
+    time.sleep(duration)
+    return duration
+
+
+def run_barrier(executor, durations, batch_size, **_):
+    futures = []
+    for duration in durations:
+        futures.append(executor.submit(fake_check, duration))
+        if len(futures) >= batch_size:
+            for future in as_completed(futures):
+                future.result()
+            futures = []
+    for future in as_completed(futures):
+        future.result()
+
+
+def run_window(executor, durations, batch_size, workers, queue_factor):
+    tasks = ((i, {"duration": duration}) for i, duration in enumerate(durations))
+    max_in_flight = min(batch_size, queue_factor * workers)
+    for _, future in bounded_submit(
+        partial(executor.submit, fake_check), tasks, max_in_flight
+    ):
+        future.result()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tasks", type=int, default=400)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--queue-factor", type=int, default=2)
+    parser.add_argument("--fast", type=float, default=0.01)
+    parser.add_argument("--timeout", type=float, default=0.5)
+    parser.add_argument("--timeout-rate", type=float, default=0.05)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    durations = [
+        args.timeout if rng.random() < args.timeout_rate else args.fast
+        for _ in range(args.tasks)
+    ]
+    busy = sum(durations)
+
+    print(
+        f"Tasks: {args.tasks}, workers: {args.workers}, "
+        f"timeouts: {durations.count(args.timeout)}, ideal: {busy / args.workers:.2f}s"
+    )
+    for label, run in (("barrier", run_barrier), ("window", run_window)):
+        with ProcessPoolExecutor(max_workers=args.workers) as executor:
+            # Start the workers before timing
+            list(executor.map(fake_check, [0.0] * args.workers))
+            start = time.perf_counter()
+            run(
+                executor,
+                durations,
+                batch_size=args.batch_size,
+                workers=args.workers,
+                queue_factor=args.queue_factor,
+            )
+            elapsed = time.perf_counter() - start
+        print(
+            f"{label:>8}: {elapsed:6.2f}s, "
+            f"utilization {busy / (args.workers * elapsed):6.1%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
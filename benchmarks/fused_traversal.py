@@ -0,0 +1,121 @@
+"""
+Compare how the registered `OneByOneTransformer`s traverse a program:
+
+    scan:    each visitor checks `is_transformable` on every node of the tree
+    indexed: each visitor only walks the nodes matching its `node_types`
+    fused:   `fused_transform` walks the tree once and dispatches nodes by type
+
+All modes share one `ParsedProgram` per program, so only the traversal differs.
+
+Usage:
+    python benchmarks/fused_traversal.py [--corpus DIR] [--repeat N]
+"""
+import argparse
+import ast
+import random
+import time
+from collections import defaultdict
+from itertools import chain
+
+from corpus import load_corpus
+
+from mutations import OneByOneTransformer, fused_transform
+from mutations.registry import MutationRegistry
+from shared.ast_utils import ParsedProgram
+
+
+def scan(transformer, program):
+    visitor = transformer.visitor(program)
+    return [mutant for node in program.nodes for mutant in visitor.visit_node(node)]
+
+
+def run_scan(transformers, programs):
+    outputs = []
+    for program in programs:
+        # Some visitors draw random identifiers, seed them so all modes agree
+        random.seed(0)
+        outputs.append(
+            {transformer: scan(transformer, program) for transformer in transformers}
+        )
+    return outputs
+
+
+def run_indexed(transformers, programs):
+    outputs = []
+    for program in programs:
+        random.seed(0)
+        outputs.append(
+            {
+                transformer: transformer.attack_func(program)
+                for transformer in transformers
+            }
+        )
+    return outputs
+
+
+def run_fused(transformers, programs):
+    outputs = []
+    for program in programs:
+        random.seed(0)
+        mutants = defaultdict(list)
+        for transformer, mutant in fused_transform(transformers, program):
+            mutants[transformer].append(mutant)
+        outputs.append(
+            {transformer: mutants[transformer] for transformer in transformers}
+        )
+    return outputs
+
+
+def measure(run, transformers, programs):
+    start = time.perf_counter()
+    outputs = run(transformers, programs)
+    return outputs, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--corpus", default=None)
+    parser.add_argument("--repeat", type=int, default=2)
+    args = parser.parse_args()
+
+    programs = [
+        ParsedProgram(ast.unparse(ast.parse(program)))
+        for program in load_corpus(args.corpus, repeat=args.repeat)
+    ]
+    transformers = [
+        transformer()
+        for transformer in chain.from_iterable(MutationRegistry.get())
+        if issubclass(transformer, OneByOneTransformer)
+    ]
+
+    measurements = {
+        label: measure(run, transformers, programs)
+        for label, run in (
+            ("scan", run_scan),
+            ("indexed", run_indexed),
+            ("fused", run_fused),
+        )
+    }
+
+    baseline, baseline_time = measurements["scan"]
+    for label, (outputs, _) in measurements.items():
+        # Randomized visitors draw in a different order when fused, so only compare counts
+        for expected, actual in zip(baseline, outputs):
+            for transformer in transformers:
+                assert len(expected[transformer]) == len(actual[transformer]), label
+                if transformer.deterministic:
+                    assert expected[transformer] == actual[transformer], label
+
+    n_mutants = sum(len(mutants) for output in baseline for mutants in output.values())
+    print(
+        f"Programs: {len(programs)}, transformers: {len(transformers)}, mutants: {n_mutants}"
+    )
+    for label, (_, elapsed) in measurements.items():
+        print(
+            f"{label:>10}: {elapsed * 1000 / len(programs):8.3f} ms/program, "
+            f"speedup {baseline_time / elapsed:5.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Report the latency distribution of `Processors.format_eval` on model outputs with and
+without the fast path that skips black for code whose every logical line black is
+known to leave unchanged:
+
+    black:     every output is formatted by black
+    fast path: black only runs on outputs with a line it has not seen stay unchanged
+
+Outputs are noisy variants of the corpus programs like in `direct_postprocessing.py`,
+grouped per program like the completions of a stem, in chat and direct completion
+mode. The fast path leaves out the blank lines black inserts between statements, so
+its outputs are checked against black's with those removed.
+
+Usage:
+    python benchmarks/postprocess_latency.py [--corpus DIR] [--variants N]
+"""
+import argparse
+import random
+import statistics
+import time
+
+from corpus import load_corpus
+from direct_postprocessing import model_output
+
+from inference.processors import PostprocessingException, Processors
+from shared.program_utils import logical_lines
+
+
+def format_timed(code: str, direct: bool, fast_path: bool) -> tuple[str | None, float]:
+    start = time.perf_counter()
+    try:
+        formatted = Processors.format_eval(code, direct=direct, fast_path=fast_path)
+    except PostprocessingException:
+        formatted = None
+    return formatted, time.perf_counter() - start
+
+
+def describe(timings: list[float]) -> str:
+    quantiles = statistics.quantiles(timings, n=100)
+    return (
+        f"mean {statistics.mean(timings) * 1000:6.2f} ms, "
+        f"p50 {quantiles[49] * 1000:6.2f} ms, p90 {quantiles[89] * 1000:6.2f} ms, "
+        f"p99 {quantiles[98] * 1000:6.2f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--corpus", default=None)
+    parser.add_argument("--variants", type=int, default=100)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    outputs = [
+        model_output(code, rng)
+        for code in load_corpus(args.corpus)
+        for _ in range(args.variants)
+    ]
+
+    for direct in (False, True):
+        print(f"{'Direct' if direct else 'Chat'} completions: {len(outputs)}")
+        Processors.stable_lines.clear()
+        Processors.fast_path_stats.clear()
+        results = {}
+        for label, fast_path in (("black", False), ("fast path", True)):
+            results[label] = [format_timed(code, direct, fast_path) for code in outputs]
+            timings = [elapsed for _, elapsed in results[label]]
+            print(f"{label:>10}: {describe(timings)}")
+
+        mismatches = 0
+        for (formatted, _), (fast, _) in zip(results["black"], results["fast path"]):
+            if formatted is not None:
+                formatted = "\n".join(text for text, _ in logical_lines(formatted))
+                formatted += "\n"
+            mismatches += formatted != fast
+        print(
+            f"Black skipped for {Processors.fast_path_stats['skipped']} of "
+            f"{len(outputs)}, {mismatches} outputs differ from black's beyond blank "
+            "lines"
+        )
+
+
+if __name__ == "__main__":
+    main()
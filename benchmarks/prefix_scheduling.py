@@ -0,0 +1,116 @@
+"""
+Estimate how much of the prompt tokens of a problem's stem prompts vLLM's prefix cache
+can reuse, depending on how the prompts are ordered and split into generate calls:
+
+    submission: prompts in the order the sampler produces them
+    sorted:     prompts sorted as strings, cut into fixed-size calls
+    trie:       `PrefixScheduler` trie order, cut where the fewest cached blocks are lost
+
+Prompts wrap each stem in a chat-style instruction header like
+`InferenceEngine.make_stem_completion_prompt`, and are tokenized into words, spaces
+and punctuation as a stand-in for the model's tokenizer.
+
+Usage:
+    python benchmarks/prefix_scheduling.py [--corpus DIR] [--max-prompts-per-call N]
+"""
+import argparse
+import ast
+import re
+from itertools import chain
+
+from corpus import load_corpus
+
+from inference.prefix_scheduler import PrefixScheduler, PrefixStats
+from inference.processors import Processors
+from mutations import OneByOneTransformer, fused_transform
+from mutations.registry import MutationRegistry
+from shared.ast_utils import ParsedProgram
+
+HEADER = (
+    "<|user|>\nComplete the rest of the below function such that it is self-contained "
+    "and passes the corresponding tests. Write your code in a markdown code block, "
+    "ending your response with ```. The function does not execute any tests of its "
+    "logic. Don't include any testcases or evaluate your response.\n\n<|assistant|>\n"
+    "Below is the rest of the function body such that it passes the corresponding "
+    "tests:\n```python\n"
+)
+
+
+def tokenize(prompt: str) -> tuple[str, ...]:
+    return tuple(re.findall(r"\w+|\s+|[^\w\s]", prompt))
+
+
+def stem_prompts(code: str) -> dict[tuple[int, int, str], str]:
+    program = ParsedProgram(code)
+    transformers = [
+        transformer() for transformer in chain.from_iterable(MutationRegistry.get())
+    ]
+    fused_mutants = {
+        transformer: []
+        for transformer in transformers
+        if isinstance(transformer, OneByOneTransformer)
+    }
+    for transformer, mutant in fused_transform(list(fused_mutants), program):
+        fused_mutants[transformer].append(mutant)
+
+    prompts = {}
+    for mid, transformer in enumerate(transformers):
+        if transformer in fused_mutants:
+            stems = transformer.collect_stems(code, fused_mutants[transformer])
+        else:
+            stems = transformer.get_transformations(code, program=program)
+        for sid, stem in enumerate(stems):
+            for kind, text in (
+                ("original", stem.original_stem),
+                ("mutated", stem.mutated_stem),
+            ):
+                prompt = Processors.preprocess_stem(text).strip()
+                prompts[(mid, sid, kind)] = HEADER + prompt + "\n"
+    return prompts
+
+
+def fixed_calls(order, max_prompts_per_call):
+    return [
+        order[i : i + max_prompts_per_call]
+        for i in range(0, len(order), max_prompts_per_call)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--corpus", default=None)
+    parser.add_argument("--max-prompts-per-call", type=int, default=64)
+    parser.add_argument("--block-size", type=int, default=16)
+    args = parser.parse_args()
+
+    scheduler = PrefixScheduler(tokenize=tokenize, block_size=args.block_size)
+    totals = {label: PrefixStats() for label in ("submission", "sorted", "trie")}
+
+    for code in load_corpus(args.corpus):
+        prompts = stem_prompts(ast.unparse(ast.parse(code)))
+        tokens = {prompt_id: tokenize(prompt) for prompt_id, prompt in prompts.items()}
+        orders = {
+            "submission": list(prompts),
+            "sorted": sorted(prompts, key=prompts.get),
+        }
+        for label, order in orders.items():
+            calls = fixed_calls(order, args.max_prompts_per_call)
+            totals[label] += scheduler.stats(calls, tokens)
+
+        _, stats = scheduler.schedule(prompts, args.max_prompts_per_call)
+        totals["trie"] += stats
+
+    print(
+        f"Prompts: {totals['trie'].prompts}, "
+        f"prompt tokens: {totals['trie'].prompt_tokens}, "
+        f"max prompts per call: {args.max_prompts_per_call}"
+    )
+    for label, stats in totals.items():
+        print(
+            f"{label:>10}: {stats.cached_tokens:8d} cached tokens, "
+            f"hit rate {stats.hit_rate:6.1%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Compare the size of a `BenchmarkResult` that keeps every evaluated solution text with
+the compact one that keeps exact counts, content hashes and a sample of examples:
+
+    full:    every solution text per solution type and side
+    compact: `BenchmarkResult` as stored now
+
+Solutions are corpus programs with a varying trailing comment, spread over passed and
+failed like a typical stem, and sizes are of the pickle and the GCS JSON line.
+
+Usage:
+    python benchmarks/result_size.py [--corpus DIR] [--samples N]
+"""
+import argparse
+import json
+import pickle
+import random
+import time
+
+from corpus import load_corpus
+
+from shared.metrics import average_levenshtein_distance
+from shared.structs import BenchmarkResult, SolutionType, create_examples
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--corpus", default=None)
+    parser.add_argument("--samples", type=int, default=200)
+    parser.add_argument("--pass-rate", type=float, default=0.6)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    sizes = {label: [0, 0] for label in ("full", "compact")}
+    metric_time = {label: 0.0 for label in sizes}
+    for problem, code in enumerate(load_corpus(args.corpus)):
+        result = BenchmarkResult(
+            problem_id=f"P/{problem}",
+            mutation="A",
+            mutation_id="0",
+            stem_id="0",
+            temp=0.3,
+        )
+        # The fields a result had before it kept counts and hashes
+        full = {
+            key: value
+            for key, value in result.__dict__.items()
+            if key not in ("example_counts", "example_hashes")
+        }
+        full["examples"] = create_examples()
+        for mutated in (False, True):
+            side = "mutated" if mutated else "original"
+            for _ in range(args.samples):
+                solution = f"{code}\n# {rng.randrange(args.samples // 4)}\n"
+                solution_type = (
+                    SolutionType.PASSED
+                    if rng.random() < args.pass_rate
+                    else SolutionType.FAILED
+                )
+                result.add_example(solution, solution_type, mutated)
+                full["examples"][solution_type][side].append(solution)
+
+        for label, state, examples in (
+            ("full", full, full["examples"]),
+            ("compact", result.__dict__, result.examples),
+        ):
+            sizes[label][0] += len(pickle.dumps(state))
+            sizes[label][1] += len(json.dumps(state))
+            start = time.perf_counter()
+            average_levenshtein_distance(
+                examples["passed"]["original"], examples["passed"]["mutated"]
+            )
+            metric_time[label] += time.perf_counter() - start
+
+    print(f"Samples per side: {args.samples}")
+    for label, (pickled, json_size) in sizes.items():
+        print(
+            f"{label:>8}: pickle {pickled / 1024:8.1f} KiB, json {json_size / 1024:8.1f} "
+            f"KiB, levenshtein {metric_time[label] * 1000:8.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
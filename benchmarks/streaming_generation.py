@@ -0,0 +1,117 @@
+"""
+Compare the end-to-end latency of generating and postprocessing the completions of a
+problem's stem prompts when postprocessing starts after the generate call returns
+against when each prompt's completions are postprocessed as soon as they finish:
+
+    per call:  `LLM.generate`-like, every output is postprocessed once all are done
+    streaming: `stream_generate`, each output goes to the postprocessing pool as soon
+               as it finishes while the others are still decoding
+
+Generation runs on a stand-in for vLLM's engine that decodes one token of every
+running request per step, sleeping `--step-time` per step like a GPU would, with
+completion lengths drawn per prompt. Completions are noisy corpus programs like in
+`direct_postprocessing.py`, formatted by a `PostprocessPool`.
+
+Usage:
+    python benchmarks/streaming_generation.py [--prompts N] [--samples N] [--workers N]
+"""
+import argparse
+import random
+import time
+from types import SimpleNamespace
+
+from corpus import load_corpus
+from direct_postprocessing import model_output
+
+from inference.generation_stream import stream_generate
+from inference.postprocess_pool import PostprocessPool
+
+
+class SimulatedEngine:
+    def __init__(self, lengths: dict[str, int], step_time: float):
+        self.lengths = lengths
+        self.step_time = step_time
+        self.running = {}
+
+    def add_request(self, request_id, prompt, params):
+        self.running[request_id] = [prompt, self.lengths[prompt]]
+
+    def abort_request(self, request_id):
+        for rid in request_id:
+            self.running.pop(rid, None)
+
+    def has_unfinished_requests(self):
+        return bool(self.running)
+
+    def step(self):
+        time.sleep(self.step_time)
+        outputs = []
+        for request_id, request in list(self.running.items()):
+            request[1] -= 1
+            outputs.append(
+                SimpleNamespace(
+                    request_id=request_id, finished=request[1] == 0, prompt=request[0]
+                )
+            )
+            if request[1] == 0:
+                del self.running[request_id]
+        return outputs
+
+
+def run(prompts, completions, engine, workers, streaming) -> tuple[float, dict]:
+    pool = PostprocessPool(max_workers=workers)
+    # Spawning the workers is not part of the latency of a problem
+    pool.submit(["x = 1"] * workers).result()
+
+    start = time.perf_counter()
+    jobs = {}
+    finished = []
+    for prompt_id, output in stream_generate(engine, prompts, None):
+        if streaming:
+            jobs[prompt_id] = pool.submit(completions[output.prompt], direct=True)
+        else:
+            finished.append((prompt_id, output))
+    for prompt_id, output in finished:
+        jobs[prompt_id] = pool.submit(completions[output.prompt], direct=True)
+    results = {prompt_id: job.result() for prompt_id, job in jobs.items()}
+    elapsed = time.perf_counter() - start
+
+    pool.close()
+    return elapsed, results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--corpus", default=None)
+    parser.add_argument("--prompts", type=int, default=32)
+    parser.add_argument("--samples", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--step-time", type=float, default=0.01)
+    parser.add_argument("--max-tokens", type=int, default=300)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    programs = load_corpus(args.corpus)
+    prompts = {f"stem-{i}": f"prompt {i}" for i in range(args.prompts)}
+    completions = {
+        prompt: [model_output(rng.choice(programs), rng) for _ in range(args.samples)]
+        for prompt in prompts.values()
+    }
+    lengths = {
+        prompt: rng.randint(args.max_tokens // 10, args.max_tokens)
+        for prompt in prompts.values()
+    }
+
+    results = {}
+    for label, streaming in (("per call", False), ("streaming", True)):
+        engine = SimulatedEngine(lengths, args.step_time)
+        elapsed, results[label] = run(
+            prompts, completions, engine, args.workers, streaming
+        )
+        print(f"{label:>9}: {elapsed:6.2f} s")
+
+    print(f"Same results: {results['per call'] == results['streaming']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Compare how `OneByOneVisitor` builds and renders mutants:
+
+    deep-copy: copy the whole tree per mutant and `ast.unparse` it
+    path-copy: copy only the ancestors of the replaced node and `ast.unparse` the tree
+    splice:    path-copy, but unparse only the replaced subtree and splice it into the source
+
+Programs are `ast.unparse` normalized first, like canonical solutions are.
+
+Usage:
+    python benchmarks/visitor_rewrite.py [--corpus DIR] [--repeat N]
+"""
+import argparse
+import ast
+import random
+import time
+import tracemalloc
+from itertools import chain
+
+from corpus import load_corpus
+
+from mutations import OneByOneTransformer
+from mutations.registry import MutationRegistry
+
+MODES = {
+    "deep-copy": dict(structural_sharing=False, splice=False),
+    "path-copy": dict(structural_sharing=True, splice=False),
+    "splice": dict(structural_sharing=True, splice=True),
+}
+
+
+def run_visitors(visitors, programs, **kwargs):
+    outputs = []
+    for program in programs:
+        for visitor in visitors:
+            # Some visitors draw random identifiers, seed them so all modes agree
+            random.seed(0)
+            outputs.append(visitor(program, **kwargs).transform())
+    return outputs
+
+
+def measure(visitors, programs, **kwargs):
+    # Timed separately from the traced run since tracemalloc skews allocation-heavy code
+    start = time.perf_counter()
+    outputs = run_visitors(visitors, programs, **kwargs)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    run_visitors(visitors, programs, **kwargs)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return outputs, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--corpus", default=None)
+    parser.add_argument("--repeat", type=int, default=2)
+    args = parser.parse_args()
+
+    programs = [
+        ast.unparse(ast.parse(program))
+        for program in load_corpus(args.corpus, repeat=args.repeat)
+    ]
+    visitors = [
+        transformer().visitor
+        for transformer in chain.from_iterable(MutationRegistry.get())
+        if issubclass(transformer, OneByOneTransformer)
+    ]
+
+    measurements = {mode: measure(visitors, programs, **kwargs) for mode, kwargs in MODES.items()}
+
+    baseline, baseline_time, _ = measurements["deep-copy"]
+    for mode, (outputs, _, _) in measurements.items():
+        assert outputs == baseline, f"{mode} changed the rendered mutants"
+
+    n_mutants = sum(len(mutants) for mutants in baseline)
+    print(f"Programs: {len(programs)}, visitors: {len(visitors)}, mutants: {n_mutants}")
+    for mode, (_, elapsed, peak) in measurements.items():
+        print(
+            f"{mode:>10}: {elapsed * 1000 / n_mutants:8.3f} ms/mutant, "
+            f"peak {peak / 2 ** 20:8.2f} MiB, speedup {baseline_time / elapsed:5.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -12,10 +12,21 @@ from loguru import logger
 from canonical import MaxProbInitializer
 from canonical.max_prob_initializer import NoPassingSolutionException
 from inference.dataset_manager import Dataset, SeedStrategy, DatasetManager
+from inference.evaluation_service import EvaluationService
 from inference.predict import InferenceEngine
+from inference.processors import FormatCache, Processors
+from inference.stem_deduplicator import StemDeduplicator
 from inference.stem_evaluator import StemEvaluator
-from mutations import CRT, RegisteredTransformation
+from inference.time_limits import TimeLimits
+from inference.verdict_cache import VerdictCache
+from mutations import (
+    CRT,
+    RegisteredTransformation,
+    OneByOneTransformer,
+    fused_candidates,
+)
 from mutations.registry import MutationRegistry
+from shared.ast_utils import ParsedProgram
 from shared.gcs_storage_manager import GCSResultStorageManager
 from shared.structs import BenchmarkResult
 
@@ -41,6 +52,12 @@ class Sampler:
             result_manager: GCSResultStorageManager,
             exclude_mutation_types: list[CRT] = None,
             base_only: bool = False,
+            max_mutants_per_transformer: int = None,
+            batch_sampling: bool = False,
+            max_prompts_per_call: int = 256,
+            canonical_early_stop: bool = False,
+            canonical_max_workers: int = 16,
+            time_limits: TimeLimits = None,
     ):
         """
         Sample original and mutated sequences for a given problem and model temperatures.
@@ -56,6 +73,12 @@ class Sampler:
             result_manager: GCS result manager
             exclude_mutation_types: list of mutation classes to exclude
             base_only: whether to only use base tests rather than plus tests
+            max_mutants_per_transformer: maximum number of mutants to take from each transformer
+            batch_sampling: whether to sample all stems at a temperature in batched generate calls
+            max_prompts_per_call: maximum number of prompts per generate call when batch sampling
+            canonical_early_stop: whether to stop evaluating canonical samples once the best passing one is known
+            canonical_max_workers: number of processes evaluating canonical samples in parallel
+            time_limits: calibrated test time limits for canonical samples (evalplus' if unset)
 
         Returns:
 
@@ -69,6 +92,9 @@ class Sampler:
             min_correct_samples=min_correct_samples,
             dataset_manager=dataset_manager,
             base_only=base_only,
+            early_stop=canonical_early_stop,
+            max_workers=canonical_max_workers,
+            time_limits=time_limits,
         )
 
         canonical_solution = initializer.canonical_solution()
@@ -79,10 +105,39 @@ class Sampler:
         all_mutations = list(chain.from_iterable(mutations))
         logger.info(f"Found {len(all_mutations)} available mutations")
 
+        # Parse the canonical solution once and share it across all transformers
+        program = ParsedProgram(canonical_solution.code)
+        transformers = [mutation() for mutation in all_mutations]
+
+        # All one-by-one transformers share a single walk over the tree, and only render
+        # the mutants their budget takes
+        fused_mutants = dict(
+            fused_candidates(
+                [
+                    transformer
+                    for transformer in transformers
+                    if isinstance(transformer, OneByOneTransformer)
+                ],
+                program,
+                max_mutants=max_mutants_per_transformer,
+            )
+        )
+
         # Collect all stems and calculate total iterations
         all_stems = []
-        for mutation in all_mutations:
-            stems = mutation().get_transformations(current_text=canonical_solution.code)
+        for mutation, transformer in zip(all_mutations, transformers):
+            if transformer in fused_mutants:
+                stems = transformer.collect_stems(
+                    canonical_solution.code,
+                    fused_mutants[transformer],
+                    max_mutants=max_mutants_per_transformer,
+                )
+            else:
+                stems = transformer.get_transformations(
+                    current_text=canonical_solution.code,
+                    program=program,
+                    max_mutants=max_mutants_per_transformer,
+                )
             if stems:
                 all_stems.append((mutation, stems))
 
@@ -92,6 +147,10 @@ class Sampler:
         # Store these in GCS for evaluation later
         evaluate_targets: Dict[str, Dict[str, str]] = defaultdict(dict)
         results = {}
+        deduplicator = StemDeduplicator()
+        pending_stems = defaultdict(dict)
+        # Completions still being postprocessed while the next stems are sampled
+        pending_completions = {}
 
         for mid, (mutation, stems) in enumerate(all_stems):
             for tid in model_temps:
@@ -106,18 +165,51 @@ class Sampler:
                         temp=tid,
                     )
 
-                    completions = inference_engine.sample_stem_solutions(
+                    source = deduplicator.source_for(ident, stem, tid)
+                    if source is not None:
+                        # Completions and evaluation are shared with `source`
+                        results[ident].add_stem(stem)
+                        results[ident].stem_source = source
+                        pbar.update(1)
+                        continue
+
+                    # Original completions are shared between stems with the same prefix
+                    original_source = deduplicator.original_source_for(ident, stem, tid)
+                    results[ident].original_source = original_source
+
+                    if batch_sampling:
+                        # Sampled below together with every other stem at `tid`
+                        pending_stems[tid][ident] = (stem, original_source is None)
+                        continue
+
+                    pending_completions[ident] = inference_engine.sample_stem_solutions_deferred(
                         stem=stem,
                         result=results[ident],
                         temp=tid,
                         num_samples=scoring_samples,
+                        include_original=original_source is None,
                     )
-                    evaluate_targets[ident]["original"] = completions["original"]
-                    evaluate_targets[ident]["mutated"] = completions["mutated"]
 
                     pbar.update(1)
 
+        for ident, completions in pending_completions.items():
+            evaluate_targets[ident].update(completions())
+
+        for tid, stems in pending_stems.items():
+            batch_completions = inference_engine.sample_stems_solutions(
+                stems=stems,
+                results=results,
+                temp=tid,
+                num_samples=scoring_samples,
+                max_prompts_per_call=max_prompts_per_call,
+            )
+            for ident, completions in batch_completions.items():
+                evaluate_targets[ident].update(completions)
+            pbar.update(len(stems))
+
         pbar.close()
+        deduplicator.report(scoring_samples)
+        Processors.format_cache.report(problem_id)
 
         # Temporary saving in case things go wrong
         eval_target = {"evaluate_targets": evaluate_targets, "results": results}
@@ -135,17 +227,27 @@ class Sampler:
             model_temps: tuple[float, ...] = (0.3, 0.5, 0.7),
             model_top_p: float = 0.9,
             model_direct_completion: bool = False,
+            model_streaming: bool = True,
+            postprocess_workers: int = 4,
+            postprocess_fast_path: bool = True,
+            format_cache_path: str = ".cache/formatted.sqlite",
             base_only: bool = True,
             dataset_mini: bool = True,
             dataset_noextreme: bool = False,
             canonical_passing_threshold: float = 0.85,
             canonical_samples: int = 200,
+            canonical_early_stop: bool = False,
+            canonical_max_workers: int = 16,
+            time_limit_margin: float = 0.0,
             scoring_samples: int = 100,
             min_correct_samples: int = 10,
             seed_problems_k: int = 5,
             seed_problem_metric: str = "cyclomatic_complexity",
             seed_problems: List[str] = None,
             exclude_mutation_types: List[str] = None,
+            max_mutants_per_transformer: int = None,
+            batch_sampling: bool = False,
+            max_prompts_per_call: int = 256,
             gcs_bucket_name: str = "amrit-research-samples",
             gcs_project_name: str = "research",
             completed: List[str] = None,
@@ -164,17 +266,27 @@ class Sampler:
             model_temps: model temperatures to evaluate at
             model_top_p: top p threshold
             model_direct_completion: whether to use a chat template or complete directly
+            model_streaming: whether to postprocess each prompt's completions as soon as they finish decoding
+            postprocess_workers: number of processes formatting completions (0 to format them inline)
+            postprocess_fast_path: whether to skip black for completions it is known to leave unchanged
+            format_cache_path: SQLite file persisting formatted code across runs (empty to keep it in memory)
             base_only: whether to only use base tests rather than plus tests
             dataset_mini: whether to use evalplus mini dataset (only if base_only is set)
             dataset_noextreme: whether to exclude extreme samples from the dataset (only if base_only is set)
             canonical_passing_threshold: passing threshold for canonical samples
             canonical_samples: number of canonical samples to consider
+            canonical_early_stop: whether to stop evaluating canonical samples once the best passing one is known
+            canonical_max_workers: number of processes evaluating canonical samples in parallel
+            time_limit_margin: multiple of locally measured ground-truth runtimes each test may take (0 for evalplus' limits)
             scoring_samples: number of samples to evaluate for original and mutated stems
             min_correct_samples: minimum number of correct samples for canonical solutions
             seed_problems_k: number of seed problems to consider
             seed_problem_metric: which metric to use for ordering seed problems
             seed_problems: explicitly specify seed problems
             exclude_mutation_types: which mutation types to exclude
+            max_mutants_per_transformer: maximum number of mutants to take from each transformer
+            batch_sampling: whether to sample all stems at a temperature in batched generate calls
+            max_prompts_per_call: maximum number of prompts per generate call when batch sampling
             gcs_bucket_name: name of the GCS bucket
             gcs_project_name: name of the GCS project
             completed: list of completed problems
@@ -193,6 +305,12 @@ class Sampler:
             noextreme=dataset_noextreme,
             direct_completion=model_direct_completion,
         )
+        time_limits = None
+        if time_limit_margin > 0:
+            time_limits = TimeLimits(dataset_manager, margin=time_limit_margin)
+
+        # Formats canonical solutions and mutants, and completions formatted inline
+        Processors.format_cache = FormatCache(path=format_cache_path or None)
 
         inference_engine = InferenceEngine(
             model_name=model_name,
@@ -201,6 +319,9 @@ class Sampler:
             dataset_manager=dataset_manager,
             top_p=model_top_p,
             direct_completion=model_direct_completion,
+            streaming=model_streaming,
+            postprocess_workers=postprocess_workers,
+            postprocess_fast_path=postprocess_fast_path,
         )
 
         if seed_problems is None:
@@ -208,33 +329,45 @@ class Sampler:
             seed_problems = dataset_manager.find_seeds(
                 k=seed_problems_k, metric=seed_problem_metric
             )
-
-        for seed_problem in seed_problems:
-            if seed_problem in (completed or []):
-                logger.info(
-                    f"Skipping problem {seed_problem} as it is already completed"
-                )
-                continue
-
-            logger.info(f"Evaluating problem: {seed_problem}")
-            try:
-                Sampler.sample_problem_solutions(
-                    inference_engine=inference_engine,
-                    problem_id=seed_problem,
-                    dataset_manager=dataset_manager,
-                    canonical_samples=canonical_samples,
-                    canonical_passing_threshold=canonical_passing_threshold,
-                    scoring_samples=scoring_samples,
-                    min_correct_samples=min_correct_samples,
-                    exclude_mutation_types=exclude_mutation_types,
-                    result_manager=result_manager,
-                    base_only=base_only,
-                    model_temps=model_temps,
-                )
-            except NoPassingSolutionException:
-                logger.exception(
-                    f"Unable to find passing solutions for problem {seed_problem}"
-                )
+        if time_limits is not None:
+            time_limits.calibrate(seed_problems)
+
+        try:
+            for seed_problem in seed_problems:
+                if seed_problem in (completed or []):
+                    logger.info(
+                        f"Skipping problem {seed_problem} as it is already completed"
+                    )
+                    continue
+
+                logger.info(f"Evaluating problem: {seed_problem}")
+                try:
+                    Sampler.sample_problem_solutions(
+                        inference_engine=inference_engine,
+                        problem_id=seed_problem,
+                        dataset_manager=dataset_manager,
+                        canonical_samples=canonical_samples,
+                        canonical_passing_threshold=canonical_passing_threshold,
+                        canonical_early_stop=canonical_early_stop,
+                        canonical_max_workers=canonical_max_workers,
+                        time_limits=time_limits,
+                        scoring_samples=scoring_samples,
+                        min_correct_samples=min_correct_samples,
+                        exclude_mutation_types=exclude_mutation_types,
+                        max_mutants_per_transformer=max_mutants_per_transformer,
+                        batch_sampling=batch_sampling,
+                        max_prompts_per_call=max_prompts_per_call,
+                        result_manager=result_manager,
+                        base_only=base_only,
+                        model_temps=model_temps,
+                    )
+                except NoPassingSolutionException:
+                    logger.exception(
+                        f"Unable to find passing solutions for problem {seed_problem}"
+                    )
+        finally:
+            inference_engine.close()
+            Processors.format_cache.close()
 
 
 class Evaluator:
@@ -249,6 +382,12 @@ class Evaluator:
             max_tasks: int = 15,
             batch_size: int = 250,
             restart_size: int = 25000,
+            queue_factor: int = 2,
+            task_timeout: float = 120.0,
+            max_chunk_size: int = 1,
+            fail_fast: bool = False,
+            time_limit_margin: float = 0.0,
+            verdict_cache_path: str = ".cache/verdicts.sqlite",
             gcs_bucket_name: str = "amrit-research-samples",
             gcs_project_name: str = "research",
             service_account_path: pathlib.Path = pathlib.Path(
@@ -269,6 +408,12 @@ class Evaluator:
             max_tasks: number of tasks before restarting each worker
             batch_size: number of samples to queue to the pool at a time
             restart_size: number of samples before restarting the pool
+            queue_factor: number of samples to keep queued per worker (capped by batch_size)
+            task_timeout: seconds before a worker evaluating a sample is killed
+            max_chunk_size: most samples of a problem a worker evaluates per task
+            fail_fast: whether to stop each sample at its first failing test (pass/fail only)
+            time_limit_margin: multiple of locally measured ground-truth runtimes each test may take (0 for evalplus' limits)
+            verdict_cache_path: SQLite file persisting verdicts across runs (empty to keep them in memory)
             gcs_bucket_name: gcs bucket name
             gcs_project_name: gcs project name
             service_account_path: GCS service account file path
@@ -283,28 +428,58 @@ class Evaluator:
         dataset_manager = DatasetManager(
             dataset=dataset_name, mini=dataset_mini, noextreme=dataset_noextreme
         )
-        for problem_id, eval_target, results in tqdm.tqdm(
-                result_manager.get_data_pickles()
-        ):
-            if problem_id in (completed or []):
+        time_limits = None
+        if time_limit_margin > 0:
+            # Problems are only known once their results are read, each one is measured
+            # when its evaluation starts, before any of its solutions are submitted
+            time_limits = TimeLimits(
+                dataset_manager, margin=time_limit_margin, max_workers=max_workers
+            )
+        # Shared across problems, identical solutions are only executed once
+        verdict_cache = VerdictCache(path=verdict_cache_path or None)
+        # One pool for the whole run, the next problem fills it while the last one drains
+        service = EvaluationService(
+            max_workers=max_workers,
+            max_tasks=max_tasks,
+            batch_size=batch_size,
+            restart_size=restart_size,
+            queue_factor=queue_factor,
+            task_timeout=task_timeout,
+            max_chunk_size=max_chunk_size,
+        )
+
+        def evaluations():
+            for problem_id, eval_target, results in tqdm.tqdm(
+                    result_manager.get_data_pickles()
+            ):
+                if problem_id in (completed or []):
+                    logger.info(
+                        f"Skipping problem {problem_id} as it is already completed"
+                    )
+                    continue
+
+                evaluator = StemEvaluator(
+                    dataset_manager=dataset_manager,
+                    problem_id=problem_id,
+                    base_only=base_only,
+                    task_timeout=task_timeout,
+                    fail_fast=fail_fast,
+                    time_limits=time_limits,
+                    verdict_cache=verdict_cache,
+                )
+                logger.info("Evaluating {} results...", len(results))
+                evaluator.start(eval_target, results)
+                yield evaluator
+
+        try:
+            for evaluator in service.run(evaluations()):
                 logger.info(
-                    f"Skipping problem {problem_id} as it is already completed"
+                    "Done with {}. Writing results to GCS...", evaluator.problem_id
                 )
-                continue
-
-            evaluator = StemEvaluator(
-                dataset_manager=dataset_manager,
-                problem_id=problem_id,
-                base_only=base_only,
-                max_workers=max_workers,
-                max_tasks=max_tasks,
-                batch_size=batch_size,
-                restart_size=restart_size,
-            )
-            logger.info("Evaluating {} results...", len(results))
-            evaluator.evaluate(eval_target, results)
-            logger.info("Done. Writing results to GCS...")
-            result_manager.add_all(results)
+                result_manager.add_all(evaluator.results)
+        finally:
+            service.close()
+            verdict_cache.close()
 
 
 @app.command(name="eval")
@@ -322,6 +497,22 @@ def cli_evaluate_solutions(
         max_tasks: int = typer.Option(15, help="Number of tasks."),
         batch_size: int = typer.Option(250, help="Batch size."),
         restart_size: int = typer.Option(25000, help="Restart size."),
+        queue_factor: int = typer.Option(2, help="Queued samples per worker."),
+        task_timeout: float = typer.Option(
+            120.0, help="Seconds before a sample evaluation is killed."
+        ),
+        max_chunk_size: int = typer.Option(
+            1, help="Most samples of a problem evaluated per task."
+        ),
+        fail_fast: bool = typer.Option(
+            False, help="Stop each sample at its first failing test (pass/fail only)."
+        ),
+        time_limit_margin: float = typer.Option(
+            0.0, help="Test time limit as a multiple of measured runtimes (0 for evalplus')."
+        ),
+        verdict_cache_path: str = typer.Option(
+            ".cache/verdicts.sqlite", help="Verdict cache file (empty for memory only)."
+        ),
         gcs_bucket_name: str = typer.Option(
             "amrit-research-samples", help="Name of the GCS bucket."
         ),
@@ -343,6 +534,12 @@ def cli_evaluate_solutions(
         max_tasks=max_tasks,
         batch_size=batch_size,
         restart_size=restart_size,
+        queue_factor=queue_factor,
+        task_timeout=task_timeout,
+        max_chunk_size=max_chunk_size,
+        fail_fast=fail_fast,
+        time_limit_margin=time_limit_margin,
+        verdict_cache_path=verdict_cache_path,
         gcs_bucket_name=gcs_bucket_name,
         gcs_project_name=gcs_project_name,
         service_account_path=service_account_path,
@@ -365,6 +562,18 @@ def cli_sample_solutions(
         direct_completion: bool = typer.Option(
             False, help="Whether to use direct completion."
         ),
+        streaming: bool = typer.Option(
+            True, help="Whether to postprocess completions as soon as each prompt finishes."
+        ),
+        postprocess_workers: int = typer.Option(
+            4, help="Processes formatting completions (0 to format them inline)."
+        ),
+        postprocess_fast_path: bool = typer.Option(
+            True, help="Whether to skip black for completions it leaves unchanged."
+        ),
+        format_cache_path: str = typer.Option(
+            ".cache/formatted.sqlite", help="Format cache file (empty for memory only)."
+        ),
         # Codex used 0.95
         model_top_p: float = typer.Option(
             0.95, help="Top-p sampling parameter for the model.", min=0.0, max=1.0
@@ -387,6 +596,15 @@ def cli_sample_solutions(
             0.95, help="Passing threshold for canonical samples.", min=0.0, max=1.0
         ),
         canonical_samples: int = typer.Option(200, help="Number of canonical samples."),
+        canonical_early_stop: bool = typer.Option(
+            False, help="Whether to stop evaluating canonical samples once the best passing one is known."
+        ),
+        canonical_max_workers: int = typer.Option(
+            16, help="Number of processes evaluating canonical samples.", min=1
+        ),
+        time_limit_margin: float = typer.Option(
+            0.0, help="Test time limit as a multiple of measured runtimes (0 for evalplus')."
+        ),
         canonical_min_correct_samples: int = typer.Option(
             10, help="Minimum number of correct samples."
         ),
@@ -394,6 +612,15 @@ def cli_sample_solutions(
         exclude_mutation_types: List[str] = typer.Option(
             None, help="List of mutation types to exclude."
         ),
+        max_mutants_per_transformer: int = typer.Option(
+            None, help="Maximum number of mutants to take from each transformer."
+        ),
+        batch_sampling: bool = typer.Option(
+            False, help="Whether to sample all stems at a temperature in batched calls."
+        ),
+        max_prompts_per_call: int = typer.Option(
+            256, help="Maximum number of prompts per generate call when batch sampling."
+        ),
         gcs_bucket_name: str = typer.Option(
             "amrit-research-samples", help="Name of the GCS bucket."
         ),
@@ -410,6 +637,10 @@ def cli_sample_solutions(
         model_temps=tuple(map(float, model_temps.split(','))),
         tokenizer_name=tokenizer_name,
         model_direct_completion=direct_completion,
+        model_streaming=streaming,
+        postprocess_workers=postprocess_workers,
+        postprocess_fast_path=postprocess_fast_path,
+        format_cache_path=format_cache_path,
         dataset_name=dataset_name,
         model_max_new_tokens=model_max_new_tokens,
         model_top_p=model_top_p,
@@ -418,12 +649,18 @@ def cli_sample_solutions(
         dataset_noextreme=dataset_noextreme,
         canonical_passing_threshold=canonical_passing_threshold,
         canonical_samples=canonical_samples,
+        canonical_early_stop=canonical_early_stop,
+        canonical_max_workers=canonical_max_workers,
+        time_limit_margin=time_limit_margin,
         scoring_samples=pass_at_samples,
         min_correct_samples=canonical_min_correct_samples,
         seed_problems_k=seed_problems_k,
         seed_problem_metric=seed_problem_metric,
         seed_problems=seed_problems,
         exclude_mutation_types=exclude_mutation_types,
+        max_mutants_per_transformer=max_mutants_per_transformer,
+        batch_sampling=batch_sampling,
+        max_prompts_per_call=max_prompts_per_call,
         gcs_bucket_name=gcs_bucket_name,
         gcs_project_name=gcs_project_name,
         completed=completed.split(","),
@@ -1,16 +1,20 @@
+import multiprocessing
 import os
 import pickle
-import time
+from functools import partial
 
 import joblib
 import numpy as np
 import tqdm
 from evalplus.evaluate import check_correctness
 from loguru import logger
+from pebble import ProcessPool
 
 from inference.dataset_manager import DatasetManager
 from inference.predict import InferenceEngine
 from inference.processors import Processors
+from inference.time_limits import TimeLimits
+from shared.pool_utils import bounded_submit
 
 
 class NoPassingSolutionException(Exception):
@@ -27,6 +31,11 @@ class MaxProbInitializer:
         num_samples: int = 300,
         min_correct_samples: int = 10,
         base_only: bool = False,
+        early_stop: bool = False,
+        max_workers: int = 16,
+        time_limits: TimeLimits = None,
+        max_tasks: int = 15,
+        task_timeout: float = 120.0,
     ):
         self.inference_engine = inference_engine
         self.dataset_manager = dataset_manager
@@ -37,6 +46,114 @@ class MaxProbInitializer:
         self.min_correct_samples = min_correct_samples
         self.cache_dir = ".cache"
         self.base_only = base_only
+        self.early_stop = early_stop
+        self.max_workers = max_workers
+        self.time_limits = time_limits
+        self.max_tasks = max_tasks
+        self.task_timeout = task_timeout
+
+    def _pass_ratio(self, solution, eval_results) -> float | None:
+        logger.debug("Results: {}", eval_results)
+
+        total = eval_results["base"][1]
+        if not self.base_only:
+            total += eval_results["plus"][1]
+
+        if len(total) == 0:
+            logger.warning(
+                f"No results were found for a syntactically incorrect solution.\n{solution.code}"
+            )
+            return None
+
+        passed = [i for i in total if i == 1]
+        solution.failed_tests = [idx for idx in range(len(total)) if total[idx] == 0]
+        pass_ratio = float(len(passed)) / float(len(total))
+
+        logger.info("Passing Ratio: {}", pass_ratio)
+        return pass_ratio
+
+    def _search_done(self, pass_ratios: dict[int, float | None]) -> bool:
+        """
+        Whether the highest ranked passing solution is known, i.e. every solution ranked
+        above it failed, and at least `min_correct_samples` solutions passed.
+        """
+        passing = [
+            index
+            for index, pass_ratio in pass_ratios.items()
+            if pass_ratio is not None and pass_ratio >= self.passing_threshold
+        ]
+        if len(passing) < self.min_correct_samples or not passing:
+            return False
+        return all(index in pass_ratios for index in range(min(passing)))
+
+    def _evaluate_solutions(self, ranked) -> dict[int, float | None]:
+        """
+        Evaluate `ranked` solutions in a process pool, submitting them in rank order. With
+        `early_stop`, stops once `_search_done`; otherwise evaluates all of them.
+        """
+        pass_ratios = {}
+
+        expected_output = self.dataset_manager.get_correct(self.problem_id)
+        limit_kwargs = dict(gt_time_limit_factor=2.5)
+        if self.time_limits is not None:
+            expected_output = self.time_limits.expected_output(self.problem_id)
+            limit_kwargs = self.time_limits.check_kwargs()
+
+        tasks = (
+            (
+                index,
+                dict(
+                    dataset=self.dataset_manager.dataset,
+                    completion_id=index,
+                    expected_output=expected_output,
+                    problem=self.problem,
+                    solution=solution.code,
+                    base_only=self.base_only,
+                    **limit_kwargs,
+                ),
+            )
+            for index, solution in enumerate(ranked)
+        )
+        # Spawned rather than forked from the process holding the model and its CUDA
+        # context, workers are replaced after `max_tasks` like `EvaluationService`'s
+        pool = ProcessPool(
+            max_workers=self.max_workers,
+            max_tasks=self.max_tasks,
+            context=multiprocessing.get_context("spawn"),
+        )
+        try:
+            with tqdm.tqdm(total=len(ranked), desc="Evaluating Sequences") as pbar:
+                completed = bounded_submit(
+                    partial(self._schedule, pool), tasks, self.max_workers
+                )
+                for index, future in completed:
+                    try:
+                        eval_results = future.result()
+                    except Exception as e:
+                        # Killed after `task_timeout`, or its worker died
+                        logger.warning(
+                            "Solution {} failed to evaluate ({!r})", index, e
+                        )
+                        pass_ratios[index] = 0.0
+                    else:
+                        pass_ratios[index] = self._pass_ratio(
+                            ranked[index], eval_results
+                        )
+                    pbar.update(1)
+
+                    if self.early_stop and self._search_done(pass_ratios):
+                        break
+        finally:
+            # Solutions still running after an early stop are not needed
+            pool.stop()
+            pool.join()
+
+        return pass_ratios
+
+    def _schedule(self, pool: ProcessPool, **kwargs):
+        return pool.schedule(
+            check_correctness, kwargs=kwargs, timeout=self.task_timeout
+        )
 
     def _canonical_solution(self):
         logger.info(f"Finding Canonical Solution for {self.problem_id}")
@@ -44,43 +161,24 @@ class MaxProbInitializer:
             problem_id=self.problem_id
         )
 
+        # Highest probability first, ties keep their sampling order like `max` does
+        ranked = sorted(batch.solutions, key=lambda sol: sol.probs, reverse=True)
+        pass_ratios = self._evaluate_solutions(ranked)
+        logger.info(
+            "Evaluated {} of {} solutions", len(pass_ratios), len(batch.solutions)
+        )
+
         passing_solutions = []
-        pass_ratios = []
+        success_stats = []
         failed_stats = []
 
-        for solution in tqdm.tqdm(batch.solutions, desc="Evaluating Sequences"):
-            logger.debug("Checking Correctness of Solution:\n{}", solution.code)
-            eval_results = check_correctness(
-                dataset=self.dataset_manager.dataset,
-                completion_id=time.time_ns(),
-                expected_output=self.dataset_manager.get_correct(self.problem_id),
-                problem=self.problem,
-                solution=solution.code,
-                base_only=self.base_only,
-                gt_time_limit_factor=2.5,
-            )
-            logger.debug("Results: {}", eval_results)
-
-            total = eval_results["base"][1]
-            if not self.base_only:
-                total += eval_results["plus"][1]
-
-            if len(total) == 0:
-                logger.warning(
-                    f"No results were found for a syntactically incorrect solution.\n{solution.code}"
-                )
+        for index in sorted(pass_ratios):
+            pass_ratio = pass_ratios[index]
+            if pass_ratio is None:
                 continue
-
-            passed = [i for i in total if i == 1]
-            solution.failed_tests = [
-                idx for idx in range(len(total)) if total[idx] == 0
-            ]
-            pass_ratio = float(len(passed)) / float(len(total))
-
-            logger.info("Passing Ratio: {}", pass_ratio)
             if pass_ratio >= self.passing_threshold:
-                pass_ratios.append(pass_ratio)
-                passing_solutions.append(solution)
+                success_stats.append(pass_ratio)
+                passing_solutions.append(ranked[index])
             else:
                 failed_stats.append(pass_ratio)
 
@@ -89,13 +187,16 @@ class MaxProbInitializer:
                 f"Needed {self.min_correct_samples} correct solutions, but found {len(passing_solutions)}"
             )
 
-        self._print_stats("Failure", failed_stats)
+        # Rates are only meaningful when every solution was evaluated
+        if not self.early_stop:
+            self._print_stats("Failure", failed_stats)
 
-        canonical_solution = max(passing_solutions, key=lambda sol: sol.probs)
+        canonical_solution = passing_solutions[0]
         logger.warning(
             f"Max Probability Solution (Probs={canonical_solution.probs}):\n{canonical_solution.code}"
         )
-        self._print_stats("Success", pass_ratios)
+        if not self.early_stop:
+            self._print_stats("Success", success_stats)
 
         canonical_solution.code = Processors.postprocess_canonical(
             canonical_solution.code
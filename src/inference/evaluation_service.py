@@ -0,0 +1,423 @@
+import os
+import pickle
+import shutil
+import tempfile
+import time
+from collections import deque
+from contextlib import contextmanager
+from functools import partial
+from itertools import chain, count, islice
+from multiprocessing import Array
+from typing import Any, Iterable, Iterator
+
+import evalplus.eval as evalplus_eval
+from evalplus.eval import FAILED, SUCCESS, TIMEOUT, unsafe_execute, untrusted_check
+from evalplus.eval.utils import TimeoutException, time_limit
+from loguru import logger
+from pebble import ProcessPool
+from tqdm import tqdm
+
+from inference.fail_fast import failed_input, reorder_context, splits_of
+from shared.pool_utils import bounded_submit
+from shared.structs import SolutionType
+
+# Worker contexts are loaded from here on first use, see `EvaluationService.add_context`
+_context_dir: str | None = None
+# Problems and expected outputs loaded by this worker, keyed by problem id
+_problem_contexts: dict[str, tuple[dict, dict]] = {}
+# Only the problems of the last few evaluations are in flight at the same time
+MAX_WORKER_CONTEXTS = 4
+
+
+def context_path(context_dir: str, problem_id: str) -> str:
+    return os.path.join(context_dir, f'{problem_id.replace("/", "_")}.pkl')
+
+
+def init_worker(context_dir: str):
+    global _context_dir
+    _context_dir = context_dir
+    _problem_contexts.clear()
+
+
+def load_context(problem_id: str) -> tuple[dict, dict]:
+    if problem_id not in _problem_contexts:
+        if len(_problem_contexts) >= MAX_WORKER_CONTEXTS:
+            _problem_contexts.pop(next(iter(_problem_contexts)))
+        with open(context_path(_context_dir, problem_id), "rb") as f:
+            _problem_contexts[problem_id] = pickle.load(f)
+    return _problem_contexts[problem_id]
+
+
+def verdict_of(eval_results: dict[str, Any], base_only: bool, fail_fast=False) -> str:
+    stats = [eval_results.get(split, (None,))[0] for split in splits_of(base_only)]
+    if TIMEOUT in stats:
+        return SolutionType.TIMEOUT
+
+    if fail_fast:
+        # Fail-fast details end at the first failure, so a solution that does not load
+        # looks like one failing its first input, the precheck catches most of those
+        if all(stat == SUCCESS for stat in stats):
+            return SolutionType.PASSED
+        return SolutionType.FAILED
+
+    total = eval_results["base"][1]
+    if not base_only:
+        total += eval_results["plus"][1]
+
+    # evalplus runs no tests for solutions that do not load
+    if len(total) == 0:
+        return SolutionType.BAD_SYNTAX
+
+    passed = [i for i in total if i == 1]
+    if len(passed) == len(total):
+        return SolutionType.PASSED
+    return SolutionType.FAILED
+
+
+@contextmanager
+def recording_time_limit(timed_out: Array, index: int, seconds: float):
+    try:
+        with time_limit(seconds):
+            yield
+    except TimeoutException:
+        timed_out[index] = True
+        raise
+
+
+def execute_recording_timeouts(timed_out: Array, *args):
+    """
+    `unsafe_execute`, also marking in `timed_out` each input that ran past its limit.
+    """
+    inputs = count()
+    # Only patches the process running this one check
+    evalplus_eval.time_limit = lambda seconds: recording_time_limit(
+        timed_out, next(inputs), seconds
+    )
+    unsafe_execute(*args)
+
+
+def check_split(
+    dataset: str,
+    problem: dict[str, Any],
+    solution: str,
+    expected_output: dict[str, Any],
+    split: str,
+    fast_check: bool,
+    min_time_limit: float,
+    gt_time_limit_factor: float,
+) -> tuple[str, list[bool]]:
+    """
+    evalplus' `untrusted_check` of `solution` on the inputs of `split`, reporting a
+    failure on an input that ran out of time as a timeout.
+
+    evalplus only reports a timeout when it kills the whole check, an input that runs
+    past its limit is just a failed input. The check process records which inputs hit
+    their limit, so a solution that is only wrong is never mistaken for a slow one.
+    """
+    timed_out = Array("b", [False] * len(problem[f"{split}_input"]))
+    # The check process runs whatever `unsafe_execute` is when it starts
+    evalplus_eval.unsafe_execute = partial(execute_recording_timeouts, timed_out)
+    try:
+        stat, details = untrusted_check(
+            dataset,
+            solution,
+            problem[f"{split}_input"],
+            problem["entry_point"],
+            expected=expected_output[split],
+            atol=problem["atol"],
+            ref_time=expected_output[f"{split}_time"],
+            fast_check=fast_check,
+            min_time_limit=min_time_limit,
+            gt_time_limit_factor=gt_time_limit_factor,
+        )
+    finally:
+        evalplus_eval.unsafe_execute = unsafe_execute
+    if stat == FAILED and any(timed_out):
+        stat = TIMEOUT
+    return stat, details
+
+
+def check_full(
+    dataset: str,
+    problem: dict[str, Any],
+    solution: str,
+    expected_output: dict[str, Any],
+    base_only: bool,
+    min_time_limit: float,
+    gt_time_limit_factor: float,
+    **_,
+) -> dict[str, Any]:
+    """
+    `check_correctness` that tells a solution running out of time on an input apart from
+    one failing it, see `check_split`.
+    """
+    return {
+        split: check_split(
+            dataset,
+            problem,
+            solution,
+            expected_output,
+            split,
+            fast_check=False,
+            min_time_limit=min_time_limit,
+            gt_time_limit_factor=gt_time_limit_factor,
+        )
+        for split in splits_of(base_only)
+    }
+
+
+def check_fail_fast(
+    dataset: str,
+    problem: dict[str, Any],
+    solution: str,
+    expected_output: dict[str, Any],
+    base_only: bool,
+    min_time_limit: float,
+    gt_time_limit_factor: float,
+    **_,
+) -> dict[str, Any]:
+    """
+    `check_correctness` that stops at the first failing input, and only runs the plus
+    tests once the base tests pass.
+
+    A failure that took at least its input's time limit is reported as a timeout.
+    """
+    eval_results = {}
+    for split in splits_of(base_only):
+        stat, details = check_split(
+            dataset,
+            problem,
+            solution,
+            expected_output,
+            split,
+            fast_check=True,
+            min_time_limit=min_time_limit,
+            gt_time_limit_factor=gt_time_limit_factor,
+        )
+        eval_results[split] = (stat, details)
+        if stat != SUCCESS:
+            break
+    return eval_results
+
+
+def check_solutions(
+    problem_id: str,
+    solutions: list[str],
+    base_only: bool,
+    fail_fast: bool = False,
+    input_order: dict[str, list[int]] = None,
+    **kwargs,
+) -> list[tuple[str | None, float, tuple[str, int] | None]]:
+    """
+    Evaluate a chunk of `solutions` to `problem_id` one after the other, against the
+    problem context each worker loads once. Returns the verdict (None on error), runtime
+    and, in fail-fast mode, the input each solution failed on. `check_full` runs
+    every solution in its own process with its own time limits, so solutions in a chunk
+    stay isolated from each other.
+
+    Fail-fast chunks run the inputs of each split in `input_order`.
+    """
+    problem, expected_output = load_context(problem_id)
+    check = check_full
+    if fail_fast:
+        check = check_fail_fast
+        problem, expected_output = reorder_context(
+            problem, expected_output, input_order
+        )
+
+    outcomes = []
+    for completion_id, solution in enumerate(solutions):
+        start = time.perf_counter()
+        failed = None
+        try:
+            eval_results = check(
+                problem=problem,
+                expected_output=expected_output,
+                solution=solution,
+                completion_id=completion_id,
+                base_only=base_only,
+                **kwargs,
+            )
+            verdict = verdict_of(eval_results, base_only, fail_fast)
+            if fail_fast:
+                failed = failed_input(eval_results, input_order)
+        except Exception:
+            logger.exception("Error during evaluation")
+            verdict = None
+        outcomes.append((verdict, time.perf_counter() - start, failed))
+    return outcomes
+
+
+def take_samples(tasks: Iterator, n_samples: int) -> Iterator:
+    """
+    Chunk tasks from `tasks` until they hold at least `n_samples` solutions.
+    """
+    taken = 0
+    for task in tasks:
+        yield task
+        taken += len(task[1]["solutions"])
+        if taken >= n_samples:
+            return
+
+
+class EvaluationService:
+    """
+    A process pool shared by the evaluations of many problems.
+
+    `run` streams the tasks of each evaluation into the pool one problem after the other,
+    so the next problem's tasks fill the pool while the previous one drains. Workers are
+    replaced after `max_tasks` tasks and the whole pool after `restart_size` samples.
+
+    Solutions are sent in chunks of up to `max_chunk_size` from the same problem, sized
+    so a chunk takes about `target_chunk_time` seconds at the runtime observed so far.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = 32,
+        max_tasks: int = 15,
+        batch_size: int = 250,
+        restart_size: int = 25000,
+        queue_factor: int = 2,
+        task_timeout: float = 120.0,
+        max_chunk_size: int = 1,
+        target_chunk_time: float = 0.5,
+    ):
+        self.max_workers = max_workers
+        self.max_tasks = max_tasks
+        self.restart_size = restart_size
+        self.task_timeout = task_timeout
+        self.max_chunk_size = max_chunk_size
+        self.target_chunk_time = target_chunk_time
+        # Keep every worker busy with a few queued tasks, but never more than a batch
+        self.max_in_flight = min(batch_size, queue_factor * max_workers)
+        self.context_dir = tempfile.mkdtemp(prefix="evaluation-contexts-")
+        # Moving average of the runtime of a single solution
+        self.solution_time = None
+        # Chunks killed by the task timeout, rerun one solution at a time
+        self.retries = deque()
+
+        logger.info(
+            "Evaluating with {} workers ({} tasks each), {} tasks in flight, "
+            "restarting the pool every {} samples",
+            self.max_workers,
+            self.max_tasks,
+            self.max_in_flight,
+            self.restart_size,
+        )
+
+    def add_context(self, problem_id: str, context: tuple[dict, dict]):
+        with open(context_path(self.context_dir, problem_id), "wb") as f:
+            pickle.dump(context, f)
+
+    def create_pool(self) -> ProcessPool:
+        # Workers are replaced after `max_tasks` tasks to release memory leaked by solutions
+        return ProcessPool(
+            max_workers=self.max_workers,
+            max_tasks=self.max_tasks,
+            initializer=init_worker,
+            initargs=(self.context_dir,),
+        )
+
+    def schedule(self, pool: ProcessPool, **kwargs):
+        return pool.schedule(
+            check_solutions,
+            kwargs=kwargs,
+            timeout=self.task_timeout * len(kwargs["solutions"]),
+        )
+
+    def chunk_size(self) -> int:
+        if self.solution_time is None:
+            return 1
+        size = int(self.target_chunk_time / max(self.solution_time, 1e-6))
+        return max(1, min(self.max_chunk_size, size))
+
+    def observe(self, outcomes: list[tuple]):
+        for _, elapsed, _ in outcomes:
+            if self.solution_time is None:
+                self.solution_time = elapsed
+            else:
+                self.solution_time = 0.9 * self.solution_time + 0.1 * elapsed
+
+    @staticmethod
+    def task(evaluation: "StemEvaluator", metas: list, solutions: list[str]):
+        kwargs = dict(evaluation.check_kwargs(), solutions=solutions)
+        return (evaluation, metas, solutions), kwargs
+
+    def chunks(self, evaluation: "StemEvaluator") -> Iterator[tuple[tuple, dict]]:
+        tasks = evaluation.dispatch()
+        while chunk := list(islice(tasks, self.chunk_size())):
+            metas, solutions = zip(*chunk)
+            yield self.task(evaluation, list(metas), list(solutions))
+
+    def retry(self, evaluation: "StemEvaluator", metas: list, solutions: list[str]):
+        logger.error(
+            "Chunk of {} solutions exceeded the task timeout, retrying them one by one",
+            len(metas),
+        )
+        for meta, solution in zip(metas, solutions):
+            self.retries.append(self.task(evaluation, [meta], [solution]))
+
+    def run(self, evaluations: Iterable["StemEvaluator"]) -> Iterator["StemEvaluator"]:
+        """
+        Evaluate every started `StemEvaluator` in `evaluations`, yielding each one once
+        all of its results are in, in the order they were given.
+        """
+        active = deque()
+
+        def stream():
+            for evaluation in evaluations:
+                self.add_context(evaluation.problem_id, evaluation.problem_context())
+                active.append(evaluation)
+                yield from self.chunks(evaluation)
+                evaluation.dispatched = True
+
+        def finished():
+            while active and active[0].done:
+                evaluation = active.popleft()
+                evaluation.finish()
+                yield evaluation
+
+        tasks = stream()
+        with tqdm(desc="Evaluating", unit="samples") as pbar:
+            while True:
+                segment = take_samples(tasks, self.restart_size)
+                first = next(segment, None)
+                if first is None:
+                    break
+
+                # Each pool drains its share of tasks before the next one starts
+                pool = self.create_pool()
+                try:
+                    # Retries go into the running pool ahead of the next tasks, so the
+                    # evaluation they belong to is not held back until the stream ends
+                    completed = bounded_submit(
+                        partial(self.schedule, pool),
+                        chain([first], segment),
+                        self.max_in_flight,
+                        requeue=self.retries,
+                    )
+                    for (evaluation, metas, solutions), future in completed:
+                        if len(metas) > 1 and isinstance(
+                            future.exception(), TimeoutError
+                        ):
+                            self.retry(evaluation, metas, solutions)
+                            continue
+
+                        if future.exception() is None:
+                            self.observe(future.result())
+                        pbar.update(evaluation.complete(metas, future))
+                        yield from finished()
+                    pool.close()
+                except BaseException:
+                    pool.stop()
+                    raise
+                finally:
+                    logger.warning("Shutting down process pool...")
+                    pool.join()
+
+        # Evaluations answered entirely from the verdict cache never reach the pool
+        yield from finished()
+
+    def close(self):
+        shutil.rmtree(self.context_dir, ignore_errors=True)
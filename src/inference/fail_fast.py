@@ -0,0 +1,65 @@
+from collections import Counter
+from typing import Any
+
+
+def splits_of(base_only: bool) -> tuple[str, ...]:
+    return ("base",) if base_only else ("base", "plus")
+
+
+class InputFailures:
+    """
+    How often solutions to a problem stopped at each of its test inputs, used to run the
+    inputs that fail most often first when evaluating in fail-fast mode.
+    """
+
+    def __init__(self):
+        self.counts = Counter()
+
+    def record(self, failed_input: tuple[str, int]):
+        self.counts[failed_input] += 1
+
+    def order(self, problem: dict[str, Any], base_only: bool) -> dict[str, list[int]]:
+        # Stable, so inputs that never failed keep their dataset order
+        return {
+            split: sorted(
+                range(len(problem[f"{split}_input"])),
+                key=lambda i: -self.counts[(split, i)],
+            )
+            for split in splits_of(base_only)
+        }
+
+
+def reorder_context(
+    problem: dict[str, Any],
+    expected_output: dict[str, Any],
+    order: dict[str, list[int]],
+) -> tuple[dict[str, Any], dict[str, Any]]:
+    """
+    Copies of `problem` and `expected_output` whose inputs, outputs and ground-truth
+    runtimes of each split are in the given `order`.
+    """
+    problem, expected_output = dict(problem), dict(expected_output)
+    for split, indices in order.items():
+        inputs = problem[f"{split}_input"]
+        problem[f"{split}_input"] = [inputs[i] for i in indices]
+        for key in (split, f"{split}_time"):
+            values = expected_output[key]
+            expected_output[key] = [values[i] for i in indices]
+    return problem, expected_output
+
+
+def failed_input(
+    eval_results: dict[str, Any], order: dict[str, list[int]]
+) -> tuple[str, int] | None:
+    """
+    The `(split, index)` of the input a fail-fast evaluation stopped at, in the
+    dataset's order, or None if it ran every input.
+    """
+    for split, indices in order.items():
+        if split not in eval_results:
+            break
+        # Fail-fast details only cover the inputs before the first failure
+        _, details = eval_results[split]
+        if len(details) < len(indices):
+            return split, indices[len(details)]
+    return None
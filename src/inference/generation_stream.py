@@ -0,0 +1,52 @@
+import itertools
+from typing import Any, Iterator, Protocol
+
+_request_ids = itertools.count()
+
+
+class StepEngine(Protocol):
+    """
+    The part of vLLM's `LLMEngine` that `stream_generate` drives. A local stand-in that
+    implements it can replace the engine where no GPU is available.
+    """
+
+    def add_request(self, request_id: str, prompt: str, params: Any) -> None: ...
+
+    def abort_request(self, request_id: str | list[str]) -> None: ...
+
+    def has_unfinished_requests(self) -> bool: ...
+
+    def step(self) -> list[Any]:
+        """
+        Run one decoding step, returning a `RequestOutput` for every request it advanced.
+        """
+        ...
+
+
+def stream_generate(
+    engine: StepEngine, prompts: dict[Any, str], params: Any
+) -> Iterator[tuple[Any, Any]]:
+    """
+    Generate a completion of each of `prompts` with `engine`, yielding its prompt id and
+    `RequestOutput` as soon as the output is finished, in the order they finish.
+
+    Requests are added in the order of `prompts` like `LLM.generate` does, so the engine
+    schedules them the same way. Requests still running when the stream is closed early
+    are aborted.
+    """
+    pending = {}
+    for prompt_id, prompt in prompts.items():
+        request_id = f"stream-{next(_request_ids)}"
+        engine.add_request(request_id, prompt, params)
+        pending[request_id] = prompt_id
+
+    try:
+        while pending and engine.has_unfinished_requests():
+            for output in engine.step():
+                if output.finished and output.request_id in pending:
+                    yield pending.pop(output.request_id), output
+    except GeneratorExit:
+        # Closed before every output finished, the engine would keep decoding them
+        if pending:
+            engine.abort_request(list(pending))
+        raise
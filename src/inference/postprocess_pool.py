@@ -0,0 +1,102 @@
+import multiprocessing
+import traceback
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from inference.processors import Processors
+
+
+def postprocess_codes(
+    codes: list[str], direct: bool, fast_path: bool = False
+) -> list[tuple[str, str]]:
+    """
+    `Processors.postprocess_eval` each of `codes`, returning the formatted code and None,
+    or None and the traceback of the error that made it fail.
+    """
+    processed = []
+    for code in codes:
+        try:
+            formatted = Processors.postprocess_eval(
+                code, direct=direct, fast_path=fast_path
+            )
+        except Exception:
+            processed.append((None, traceback.format_exc(120)))
+        else:
+            processed.append((formatted, None))
+    return processed
+
+
+class PostprocessJob:
+    def __init__(
+        self,
+        outcomes: list[tuple[str, str] | None],
+        pending: list[tuple[list[int], list[tuple], Future]],
+    ):
+        # Outcomes of codes still being formatted are filled in from `pending`, each a
+        # chunk's indices into `outcomes`, format cache keys and future
+        self.outcomes = outcomes
+        self.pending = pending
+
+    def result(self) -> list[tuple[str, str]]:
+        """
+        The outcome of every submitted code, in submission order.
+        """
+        for indices, keys, future in self.pending:
+            for index, key, outcome in zip(indices, keys, future.result()):
+                self.outcomes[index] = outcome
+                # Workers only cache in memory, this process' cache may persist it
+                Processors.format_cache.put(key, *outcome)
+        self.pending = []
+        return self.outcomes
+
+
+class PostprocessPool:
+    """
+    Formats completions in worker processes while the model generates the next ones.
+    Codes are sent in chunks of `chunk_size`; with no workers they are formatted inline
+    when submitted.
+    """
+
+    def __init__(self, max_workers: int = 4, chunk_size: int = 16):
+        self.max_workers = max_workers
+        self.chunk_size = chunk_size
+        self.executor = None
+
+    def submit(
+        self, codes: list[str], direct: bool = False, fast_path: bool = False
+    ) -> PostprocessJob:
+        if self.max_workers == 0:
+            return PostprocessJob(postprocess_codes(codes, direct, fast_path), [])
+
+        # Codes this process has formatted before, in this run or a previous one, are
+        # not sent to the workers
+        flags = Processors.eval_flags(direct, fast_path)
+        outcomes = []
+        misses = []
+        for index, code in enumerate(codes):
+            key = Processors.format_cache.key("eval", flags, code)
+            outcomes.append(Processors.format_cache.get(key))
+            if outcomes[-1] is None:
+                misses.append((index, key, code))
+
+        pending = []
+        for start in range(0, len(misses), self.chunk_size):
+            indices, keys, chunk = zip(*misses[start : start + self.chunk_size])
+            future = self.get_executor().submit(
+                postprocess_codes, list(chunk), direct, fast_path
+            )
+            pending.append((list(indices), list(keys), future))
+        return PostprocessJob(outcomes, pending)
+
+    def get_executor(self) -> ProcessPoolExecutor:
+        if self.executor is None:
+            # Forking would copy the inference engine's threads and GPU state
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self.executor
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.executor = None
@@ -0,0 +1,30 @@
+import re
+import warnings
+
+from shared.structs import SolutionType
+
+
+def precheck_solution(solution: str, entry_point: str) -> str | None:
+    """
+    Classify solutions that evalplus would report without any test results, without
+    running them: empty ones, ones that do not compile and ones that never mention the
+    entry point. Returns their `SolutionType`, or None if the solution must be run.
+    """
+    if not solution.strip():
+        return SolutionType.BAD_SYNTAX
+
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            compile(solution, "<solution>", "exec")
+    except (SyntaxError, ValueError):
+        return SolutionType.BAD_SYNTAX
+    except Exception:
+        # e.g. too deeply nested to compile here, leave it to the worker
+        return None
+
+    # The entry point cannot be defined without its name appearing somewhere
+    if not re.search(rf"\b{re.escape(entry_point)}\b", solution):
+        return SolutionType.BAD_SYNTAX
+
+    return None
@@ -1,12 +1,17 @@
 import copy
 import os
-import traceback
-from typing import Any, Optional
+import time
+from collections import defaultdict
+from functools import partial
+from typing import Any, Callable, Optional
 
 from loguru import logger
 from transformers import AutoTokenizer
 
 from inference.dataset_manager import DatasetManager
+from inference.generation_stream import stream_generate
+from inference.postprocess_pool import PostprocessJob, PostprocessPool
+from inference.prefix_scheduler import PrefixScheduler
 from inference.processors import Processors, PostprocessingException
 from shared.logging_utils import log_time
 from shared.program_utils import program_concat
@@ -32,6 +37,9 @@ class InferenceEngine:
             enable_prefix_caching: bool = True,
             direct_completion: bool = False,
             tokenizer: Optional[str] = None,
+            postprocess_workers: int = 4,
+            postprocess_fast_path: bool = True,
+            streaming: bool = True,
     ):
         from vllm import LLM, SamplingParams
         # save for reinitialization later
@@ -49,6 +57,12 @@ class InferenceEngine:
 
         self.model_name = model_name
         self.direct_completion = direct_completion
+        # Formats the completions of one generate call while the next one runs
+        self.postprocess_pool = PostprocessPool(max_workers=postprocess_workers)
+        # Skip black for completions whose every line it is known to leave as it is
+        self.postprocess_fast_path = postprocess_fast_path
+        # Hand each prompt's completions on as soon as they finish instead of per call
+        self.streaming = streaming
 
         logger.info("Using model '{}' with params {}".format(model_name, sampling_args))
 
@@ -63,6 +77,11 @@ class InferenceEngine:
             "\n#",
         ]
         self.tokenizer = AutoTokenizer.from_pretrained(tokenizer or self.model_name)
+        self.scheduler = PrefixScheduler(
+            tokenize=lambda prompt: self.tokenizer.encode(
+                prompt, add_special_tokens=False
+            )
+        )
         self.add_eos_for_task()
         self.sampling_params = SamplingParams(
             top_p=top_p, max_tokens=max_tokens, stop=self.eos, **(sampling_args or {})
@@ -177,37 +196,136 @@ class InferenceEngine:
         return new_sampling_params
 
     def generate(
-            self, prompts: dict[str, str], num_samples: int, temp: float, logprobs: bool, max_tries: int = 0
+            self,
+            prompts: dict[Any, str],
+            num_samples: int,
+            temp: float,
+            logprobs: bool,
+            max_tries: int = 0,
+            max_prompts_per_call: int = None,
+            on_call: Callable[[dict[Any, list[dict[str, Any]]]], None] = None,
+            on_output: Callable[[Any, list[dict[str, Any]]], None] = None,
     ):
+        """
+        Sample `num_samples` sequences for each of `prompts`, calling `on_call` with the
+        sequences of each generate call as soon as it finishes. When streaming,
+        `on_output` is called with the sequences of each prompt as soon as they finish,
+        while the rest of the call is still decoding.
+        """
+        new_sampling_params = self.get_sampling_params(num_samples, temp, logprobs)
+        # Prompts sharing the longest prefixes are submitted together for prefix caching
+        calls, prefix_stats = self.scheduler.schedule(prompts, max_prompts_per_call)
+        logger.info(
+            "Scheduled {} prompts in {} calls, expected prefix cache hit rate {:.1%}",
+            prefix_stats.prompts,
+            len(calls),
+            prefix_stats.hit_rate,
+        )
+
+        sequences = {}
+        for prompt_ids in calls:
+            if self.streaming:
+                model_outputs = self._stream_with_restarts(
+                    {prompt_id: prompts[prompt_id] for prompt_id in prompt_ids},
+                    new_sampling_params,
+                    max_tries=max_tries,
+                )
+            else:
+                prompt_conts = [prompts[prompt_id] for prompt_id in prompt_ids]
+                model_outputs = zip(
+                    prompt_ids,
+                    self._generate_with_restarts(
+                        prompt_conts, new_sampling_params, max_tries=max_tries
+                    ),
+                )
+
+            for prompt_id, prompt_gen in model_outputs:
+                sequences[prompt_id] = []
+                for output in prompt_gen.outputs:
+                    sequence = {
+                        "text": output.text,
+                        "cumulative_logprob": output.cumulative_logprob,
+                    }
+                    sequences[prompt_id].append(sequence)
+                if on_output is not None:
+                    on_output(prompt_id, sequences[prompt_id])
+
+            if on_call is not None:
+                on_call({prompt_id: sequences[prompt_id] for prompt_id in prompt_ids})
+
+        return sequences
+
+    def _stream_with_restarts(self, prompts, sampling_params, max_tries: int = 0):
+        """
+        `_generate_with_restarts` over vLLM's engine steps, yielding each prompt id and
+        output as soon as it finishes. After a restart only the prompts that had not
+        finished yet are generated again.
+        """
         if max_tries >= 3:
             raise Exception("Max tries exceeded")
 
-        new_sampling_params = self.get_sampling_params(num_samples, temp, logprobs)
-        sorted_prompts = sorted(prompts.items(), key=lambda x: x[1])
-        prompt_ids, prompt_conts = list(zip(*sorted_prompts))
+        remaining = dict(prompts)
+        n_tokens = 0
+        start = time.perf_counter()
+        with log_time("Streaming {} sequences".format(sampling_params.n)):
+            try:
+                for prompt_id, prompt_gen in stream_generate(
+                    self.llm.llm_engine, dict(remaining), sampling_params
+                ):
+                    del remaining[prompt_id]
+                    n_tokens += sum(
+                        len(output.token_ids) for output in prompt_gen.outputs
+                    )
+                    yield prompt_id, prompt_gen
+            except RuntimeError:
+                logger.exception("Error encountered while generating sequences... restarting VLLM")
+                self._restart_vllm()
+                yield from self._stream_with_restarts(
+                    remaining, sampling_params, max_tries=max_tries + 1
+                )
+                return
 
-        sequences = {}
+        # A call with nothing to decode can finish within the timer's resolution
+        elapsed = max(time.perf_counter() - start, 1e-6)
+        logger.info(
+            "Generated {} tokens for {} prompts ({:.1f} tokens/s, {:.2f} prompts/s)",
+            n_tokens,
+            len(prompts),
+            n_tokens / elapsed,
+            len(prompts) / elapsed,
+        )
 
-        with log_time("Sampling {} sequences".format(num_samples)):
+    def _generate_with_restarts(self, prompt_conts, sampling_params, max_tries: int = 0):
+        if max_tries >= 3:
+            raise Exception("Max tries exceeded")
+
+        start = time.perf_counter()
+        with log_time("Sampling {} sequences".format(sampling_params.n)):
             try:
                 model_outputs = self.llm.generate(
-                    prompt_conts, sampling_params=new_sampling_params
+                    prompt_conts, sampling_params=sampling_params
                 )
             except RuntimeError:
                 logger.exception("Error encountered while generating sequences... restarting VLLM")
                 self._restart_vllm()
-                return self.generate(prompts, num_samples, temp, logprobs, max_tries=max_tries + 1)
-
-        for prompt_id, prompt_gen in zip(prompt_ids, model_outputs):
-            sequences[prompt_id] = []
-            for output in prompt_gen.outputs:
-                sequence = {
-                    "text": output.text,
-                    "cumulative_logprob": output.cumulative_logprob,
-                }
-                sequences[prompt_id].append(sequence)
+                return self._generate_with_restarts(
+                    prompt_conts, sampling_params, max_tries=max_tries + 1
+                )
 
-        return sequences
+        elapsed = max(time.perf_counter() - start, 1e-6)
+        n_tokens = sum(
+            len(output.token_ids)
+            for prompt_gen in model_outputs
+            for output in prompt_gen.outputs
+        )
+        logger.info(
+            "Generated {} tokens for {} prompts ({:.1f} tokens/s, {:.2f} prompts/s)",
+            n_tokens,
+            len(prompt_conts),
+            n_tokens / elapsed,
+            len(prompt_conts) / elapsed,
+        )
+        return model_outputs
 
     def predict_solutions(
             self, problem_id: str, num_samples: int = 200, temperature: float = 0.8
@@ -223,26 +341,50 @@ class InferenceEngine:
         errors = []
         batch_solution = BatchSolution()
         problem = self.dataset.get_problem(problem_id)
-        for sequence in sequences:
-            solution = Solution(
-                code=program_concat(problem["formatted_prompt"], sequence["text"]),
-                probs=sequence["cumulative_logprob"],
-            )
-            original_code = copy.copy(solution.code)
-            try:
-                solution.post_process(direct=self.direct_completion)
-                batch_solution.add_solution(solution)
-            except Exception:
-                logger.exception(f"Error postprocessing solution:\n{original_code}")
-                errors.append(PostprocessingException(code=solution.code))
-                batch_solution.add_solution(Solution(code="", probs=0.0))
+        pending = self.submit_solutions(problem["formatted_prompt"], sequences)
+        self.gather_solutions(pending, batch_solution, errors)
 
         return batch_solution, errors
 
-    def complete_stems(
-            self, stem: MutatedStem, temperature: float, num_samples: int = 200
+    def submit_solutions(
+            self, prefix: str, sequences: list[dict[str, Any]]
+    ) -> tuple[list[dict[str, Any]], list[str], PostprocessJob]:
+        """
+        Send the completions of `prefix` in `sequences` to the postprocessing pool.
+        """
+        codes = [program_concat(prefix, sequence["text"]) for sequence in sequences]
+        job = self.postprocess_pool.submit(
+            codes, direct=self.direct_completion, fast_path=self.postprocess_fast_path
+        )
+        return sequences, codes, job
+
+    @staticmethod
+    def gather_solutions(
+            pending: tuple[list[dict[str, Any]], list[str], PostprocessJob],
+            batch: BatchSolution,
+            errors: list[PostprocessingException],
+            mutated: bool = False,
     ):
+        """
+        Add the postprocessed solutions of `submit_solutions` to `batch` in sampling
+        order, with an empty solution and an error in `errors` for each one that failed.
+        """
+        sequences, codes, job = pending
+        for sequence, code, (processed, error) in zip(sequences, codes, job.result()):
+            if error is None:
+                batch.add_solution(
+                    Solution(code=processed, probs=sequence["cumulative_logprob"])
+                )
+                continue
+
+            logger.error(f"Error postprocessing solution:\n{code}\n\n{error}")
+            errors.append(PostprocessingException(code=code, mutated=mutated))
+            batch.add_solution(Solution(code="", probs=0.0))
+
+    def stem_prompts(self, stem: MutatedStem, include_original: bool = True):
         prompts = {"original": stem.original_stem, "mutated": stem.mutated_stem}
+        if not include_original:
+            del prompts["original"]
         for prompt in prompts:
             prompts[prompt] = Processors.preprocess_stem(prompts[prompt])
             prompts[prompt] = self.make_stem_completion_prompt(prompts[prompt])
@@ -250,47 +392,163 @@ class InferenceEngine:
         for prompt in prompts:
             logger.debug("Prompt:\n{}", prompt)
 
-        batch_solutions = dict(original=BatchSolution(), mutated=BatchSolution())
+        return prompts
 
-        outputs = self.generate(prompts, num_samples, temperature, logprobs=False)
+    def submit_stem_solutions(
+            self, stem: MutatedStem, outputs: dict[str, list[dict[str, Any]]]
+    ):
+        return {
+            prompt_id: self.submit_solutions(
+                stem.original_stem if prompt_id == "original" else stem.mutated_stem,
+                sequences,
+            )
+            for prompt_id, sequences in outputs.items()
+        }
 
+    def gather_stem_solutions(self, pending: dict[str, tuple]):
+        batch_solutions = {prompt_id: BatchSolution() for prompt_id in pending}
         errors = []
-        last_solution = None
 
-        for prompt_id in outputs:
-            for sequence in outputs[prompt_id]:
-                prefix = (
-                    stem.original_stem if prompt_id == "original" else stem.mutated_stem
-                )
-                solution = Solution(
-                    code=program_concat(prefix, sequence["text"]),
-                    probs=sequence["cumulative_logprob"],
-                )
-                last_solution = solution
-                try:
-                    solution.post_process(direct=self.direct_completion)
-                    batch_solutions[prompt_id].add_solution(solution)
-                except Exception:
-                    logger.error(f"Error postprocessing solution:\n{solution.code}\n\n{traceback.format_exc(120)}")
-                    errors.append(
-                        PostprocessingException(
-                            code=solution.code, mutated=prompt_id == "mutated"
-                        )
-                    )
-                    batch_solutions[prompt_id].add_solution(
-                        Solution(code="", probs=0.0)
-                    )
+        for prompt_id in pending:
+            self.gather_solutions(
+                pending[prompt_id],
+                batch_solutions[prompt_id],
+                errors,
+                mutated=prompt_id == "mutated",
+            )
 
-        logger.info(f"Last Solution:\n{last_solution.code}")
+        last_codes = [codes[-1] for _, codes, _ in pending.values() if codes]
+        if last_codes:
+            logger.info(f"Last Solution:\n{last_codes[-1]}")
         return batch_solutions, errors
 
+    def collect_stem_solutions(
+            self, stem: MutatedStem, outputs: dict[str, list[dict[str, Any]]]
+    ):
+        return self.gather_stem_solutions(self.submit_stem_solutions(stem, outputs))
+
+    def complete_stems(
+            self,
+            stem: MutatedStem,
+            temperature: float,
+            num_samples: int = 200,
+            include_original: bool = True,
+    ):
+        return self.complete_stems_deferred(
+            stem, temperature, num_samples, include_original
+        )()
+
+    def complete_stems_deferred(
+            self,
+            stem: MutatedStem,
+            temperature: float,
+            num_samples: int = 200,
+            include_original: bool = True,
+    ) -> Callable[[], tuple]:
+        """
+        `complete_stems` that returns as soon as the completions are generated, with a
+        callable that waits for their postprocessing.
+        """
+        prompts = self.stem_prompts(stem, include_original)
+        pending = {}
+
+        def submit(prompt_id, sequences):
+            # Postprocessed while the other prompt is still decoding
+            pending.update(self.submit_stem_solutions(stem, {prompt_id: sequences}))
+
+        self.generate(
+            prompts, num_samples, temperature, logprobs=False, on_output=submit
+        )
+        # Gathered in prompt order, whichever finished first
+        pending = {prompt_id: pending[prompt_id] for prompt_id in prompts}
+        return partial(self.gather_stem_solutions, pending)
+
+    def complete_stems_batch(
+            self,
+            stems: dict[str, tuple[MutatedStem, bool]],
+            temperature: float,
+            num_samples: int = 200,
+            max_prompts_per_call: int = None,
+    ):
+        """
+        Complete many stems at one temperature with as few `LLM.generate` calls as
+        possible. `stems` maps an identifier to a stem and whether to include its original
+        prompt; completions are returned under the same identifiers.
+        """
+        prompts = {}
+        for ident, (stem, include_original) in stems.items():
+            for prompt_id, prompt in self.stem_prompts(stem, include_original).items():
+                prompts[(ident, prompt_id)] = prompt
+
+        stem_pending = defaultdict(dict)
+
+        def submit(prompt_key, sequences):
+            # Postprocessed while the rest of the call is still decoding
+            ident, prompt_id = prompt_key
+            stem, _ = stems[ident]
+            stem_pending[ident].update(
+                self.submit_stem_solutions(stem, {prompt_id: sequences})
+            )
+
+        self.generate(
+            prompts,
+            num_samples,
+            temperature,
+            logprobs=False,
+            max_prompts_per_call=max_prompts_per_call,
+            on_output=submit,
+        )
+
+        return {
+            ident: self.gather_stem_solutions(
+                {
+                    prompt_id: stem_pending[ident][prompt_id]
+                    for prompt_id in ("original", "mutated")
+                    if prompt_id in stem_pending[ident]
+                }
+            )
+            for ident in stems
+        }
+
+    @staticmethod
+    def record_stem_predictions(
+            result: BenchmarkResult, predictions: dict[str, BatchSolution], errors
+    ):
+        logger.warning("Found {} errors during postprocessing", len(errors))
+
+        for error in errors:
+            result.add_example(
+                example=error.code,
+                solution_type=SolutionType.BAD_PROCESS,
+                mutated=error.mutated,
+            )
+
+        return {prompt_id: batch.get_code() for prompt_id, batch in predictions.items()}
+
     def sample_stem_solutions(
             self,
             stem: MutatedStem,
             result: BenchmarkResult,
             temp: float,
             num_samples: int = 200,
+            include_original: bool = True,
     ):
+        return self.sample_stem_solutions_deferred(
+            stem, result, temp, num_samples, include_original
+        )()
+
+    def sample_stem_solutions_deferred(
+            self,
+            stem: MutatedStem,
+            result: BenchmarkResult,
+            temp: float,
+            num_samples: int = 200,
+            include_original: bool = True,
+    ) -> Callable[[], dict[str, list[str]]]:
+        """
+        `sample_stem_solutions` that returns a callable for the completions, so the next
+        stem can be sampled while these are postprocessed.
+        """
         logger.info(
             "Completing tests (@T{}) for:\n===========\nOld:\n{}\n\nMutated:\n{}",
             temp,
@@ -299,22 +557,47 @@ class InferenceEngine:
         )
         result.add_stem(stem)
 
-        predictions, errors = self.complete_stems(
-            stem=stem, num_samples=num_samples, temperature=temp
+        gather = self.complete_stems_deferred(
+            stem=stem,
+            num_samples=num_samples,
+            temperature=temp,
+            include_original=include_original,
         )
 
-        logger.warning("Found {} errors during postprocessing", len(errors))
+        def completions():
+            predictions, errors = gather()
+            return self.record_stem_predictions(result, predictions, errors)
 
-        for error in errors:
-            result.add_example(
-                example=error.code,
-                solution_type=SolutionType.BAD_PROCESS,
-                mutated=error.mutated,
-            )
+        return completions
+
+    def sample_stems_solutions(
+            self,
+            stems: dict[str, tuple[MutatedStem, bool]],
+            results: dict[str, BenchmarkResult],
+            temp: float,
+            num_samples: int = 200,
+            max_prompts_per_call: int = None,
+    ):
+        """
+        Batched `sample_stem_solutions` over every stem in `stems`, see `complete_stems_batch`.
+        """
+        logger.info("Completing {} stems (@T{}) in batches", len(stems), temp)
+        for ident, (stem, _) in stems.items():
+            results[ident].add_stem(stem)
+
+        completions = self.complete_stems_batch(
+            stems,
+            temperature=temp,
+            num_samples=num_samples,
+            max_prompts_per_call=max_prompts_per_call,
+        )
+        return {
+            ident: self.record_stem_predictions(results[ident], predictions, errors)
+            for ident, (predictions, errors) in completions.items()
+        }
 
-        original_predictions = predictions["original"].get_code()
-        mutated_predictions = predictions["mutated"].get_code()
-        return dict(original=original_predictions, mutated=mutated_predictions)
+    def close(self):
+        self.postprocess_pool.close()
 
     def _restart_vllm(self):
         # Sometimes, we encounter memory leaks with VLLM which requires we restart VLLM executor
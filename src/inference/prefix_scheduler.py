@@ -0,0 +1,159 @@
+from dataclasses import dataclass
+from typing import Any, Callable, Hashable, Sequence
+
+
+class PrefixTrie:
+    """
+    Trie over token sequences. Each node is a dict of child nodes keyed by token, and
+    the keys of the sequences ending at a node are kept under `PrefixTrie.END`.
+    """
+
+    END = object()
+
+    def __init__(self):
+        self.root = {}
+
+    def insert(self, tokens: Sequence[Hashable], key: Any) -> int:
+        """
+        Insert `tokens` under `key` and return the length of the longest prefix it shares
+        with a sequence inserted before it.
+        """
+        node = self.root
+        shared = 0
+        for token in tokens:
+            if token in node:
+                shared += 1
+            else:
+                node[token] = {}
+            node = node[token]
+        node.setdefault(self.END, []).append(key)
+        return shared
+
+    def keys(self) -> list[Any]:
+        """
+        Keys in depth-first order, so sequences sharing longer prefixes are adjacent.
+        """
+        keys = []
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            keys.extend(node.get(self.END, ()))
+            children = [token for token in node if token is not self.END]
+            # Push in reverse so children are visited in a deterministic order
+            for token in sorted(children, key=repr, reverse=True):
+                stack.append(node[token])
+        return keys
+
+
+def common_prefix_length(a: Sequence[Hashable], b: Sequence[Hashable]) -> int:
+    n = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        n += 1
+    return n
+
+
+@dataclass
+class PrefixStats:
+    prompts: int = 0
+    prompt_tokens: int = 0
+    cached_tokens: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        return self.cached_tokens / self.prompt_tokens if self.prompt_tokens else 0.0
+
+    def __add__(self, other: "PrefixStats") -> "PrefixStats":
+        return PrefixStats(
+            prompts=self.prompts + other.prompts,
+            prompt_tokens=self.prompt_tokens + other.prompt_tokens,
+            cached_tokens=self.cached_tokens + other.cached_tokens,
+        )
+
+
+class PrefixScheduler:
+    """
+    Orders the prompts of a batch so prompts sharing the longest token prefixes are
+    submitted together, and splits them into calls where they share the least.
+
+    vLLM's prefix cache reuses KV blocks of `block_size` tokens, so a prompt only hits
+    the cache for the full blocks of the prefix it shares with a prompt computed before
+    it. `stats` estimates that reuse for a schedule, assuming the cache holds every
+    prompt of a call but nothing across calls.
+    """
+
+    def __init__(
+        self,
+        tokenize: Callable[[str], Sequence[Hashable]] = None,
+        block_size: int = 16,
+    ):
+        # Without a tokenizer every character is a token, which is enough for ordering
+        self.tokenize = tokenize or tuple
+        self.block_size = block_size
+
+    def order(self, tokens: dict[Any, Sequence[Hashable]]) -> list[Any]:
+        trie = PrefixTrie()
+        for prompt_id, prompt_tokens in tokens.items():
+            trie.insert(prompt_tokens, prompt_id)
+        return trie.keys()
+
+    def split(
+        self,
+        order: list[Any],
+        tokens: dict[Any, Sequence[Hashable]],
+        max_prompts_per_call: int = None,
+    ) -> list[list[Any]]:
+        """
+        Split `order` into calls of at most `max_prompts_per_call` prompts, choosing the
+        cuts that lose the fewest cached blocks: the first prompt of a call recomputes the
+        prefix it shares with the last prompt of the previous call.
+        """
+        if not max_prompts_per_call or len(order) <= max_prompts_per_call:
+            return [order] if order else []
+
+        lost = [0] + [
+            common_prefix_length(tokens[a], tokens[b]) // self.block_size
+            for a, b in zip(order, order[1:])
+        ]
+        # best[i] is the (lost blocks, calls) of the best split of order[:i], cut at cut[i]
+        best = [(0, 0)] + [None] * len(order)
+        cut = [0] * (len(order) + 1)
+        for i in range(1, len(order) + 1):
+            for j in range(max(i - max_prompts_per_call, 0), i):
+                candidate = (best[j][0] + lost[j], best[j][1] + 1)
+                if best[i] is None or candidate < best[i]:
+                    best[i], cut[i] = candidate, j
+
+        calls = []
+        end = len(order)
+        while end > 0:
+            calls.append(order[cut[end] : end])
+            end = cut[end]
+        return calls[::-1]
+
+    def schedule(
+        self, prompts: dict[Any, str], max_prompts_per_call: int = None
+    ) -> tuple[list[list[Any]], PrefixStats]:
+        """
+        Schedule `prompts` into generate calls. Returns the prompt ids of each call in
+        submission order, and the expected prefix cache reuse of the schedule.
+        """
+        tokens = {
+            prompt_id: self.tokenize(prompt) for prompt_id, prompt in prompts.items()
+        }
+        calls = self.split(self.order(tokens), tokens, max_prompts_per_call)
+        return calls, self.stats(calls, tokens)
+
+    def stats(
+        self, calls: list[list[Any]], tokens: dict[Any, Sequence[Hashable]]
+    ) -> PrefixStats:
+        stats = PrefixStats()
+        for call in calls:
+            trie = PrefixTrie()
+            for prompt_id in call:
+                shared = trie.insert(tokens[prompt_id], prompt_id)
+                stats.prompts += 1
+                stats.prompt_tokens += len(tokens[prompt_id])
+                stats.cached_tokens += shared // self.block_size * self.block_size
+        return stats
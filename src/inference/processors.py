@@ -1,15 +1,34 @@
 import ast
 import copy
+import hashlib
+import sys
+from collections import Counter
+from typing import Callable
 
 import black
+from cachetools import LRUCache
+from loguru import logger
 
 from shared.program_utils import (
     remove_pass,
     remove_comments_and_docstrings,
     fix_odd_indents,
     autopep8_normalize_ident,
+    logical_lines,
+    normalize_direct_completion,
     truncate_code_to_last_function,
 )
+from shared.tiered_cache import TieredCache
+
+BLACK_MODE = black.Mode(
+    string_normalization=False,
+    line_length=120,
+    magic_trailing_comma=False,
+)
+# Formatted code only stays valid for the formatter that produced it
+FORMATTER_VERSION = (
+    f"black-{black.__version__}/py{sys.version_info[0]}.{sys.version_info[1]}"
+)
 
 
 class PostprocessingException(Exception):
@@ -19,10 +38,76 @@ class PostprocessingException(Exception):
         super().__init__()
 
 
+class FormatCache(TieredCache):
+    """
+    Content-addressed cache of postprocessed code, keyed by the postprocessing function,
+    its flags and the hash of the source. Failures are cached too, as the error that
+    caused them, so code that cannot be formatted is not retried.
+
+    Lookups go through an in-memory LRU tier first and then, if `path` is set, an
+    SQLite tier shared across runs, see `TieredCache`. Postprocessing worker processes
+    only have memory caches, `PostprocessPool` looks their codes up in the cache of the
+    process submitting them and stores what the workers formatted there.
+    """
+
+    name = "Format cache"
+    table = "formatted"
+    key_columns = {"function": "TEXT", "flags": "TEXT", "source_hash": "TEXT"}
+    value_columns = {"formatted": "TEXT", "error": "TEXT"}
+
+    def __init__(self, path: str = None, max_size: int = 50_000, commit_every=1000):
+        super().__init__(path, max_size, commit_every)
+
+    @staticmethod
+    def key(function: str, flags: str, source: str) -> tuple[str, str, str]:
+        source_hash = hashlib.sha256(source.encode()).hexdigest()
+        return function, f"{flags}@{FORMATTER_VERSION}", source_hash
+
+    def get(self, key: tuple[str, str, str]) -> tuple[str | None, str | None] | None:
+        """
+        The formatted code and None, or None and the error formatting failed with.
+        """
+        return super().get(key)
+
+    def put(self, key: tuple[str, str, str], formatted: str | None, error: str = None):
+        super().put(key, (formatted, error))
+
+
 class Processors:
+    format_cache = FormatCache()
+    # Layout keys of logical lines black leaves unchanged, see `layout_keys`
+    stable_lines = LRUCache(maxsize=200_000)
+    fast_path_stats = Counter()
+
+    @classmethod
+    def cached(
+        cls, function: str, flags: str, sequence: str, transform: Callable[[str], str]
+    ) -> str:
+        """
+        `transform(sequence)` through `format_cache`. Only `PostprocessingException`s are
+        cached, as the error they were raised from.
+        """
+        key = cls.format_cache.key(function, flags, sequence)
+        outcome = cls.format_cache.get(key)
+        if outcome is None:
+            try:
+                formatted = transform(sequence)
+            except PostprocessingException as e:
+                cls.format_cache.put(key, None, repr(e.__cause__))
+                raise
+            cls.format_cache.put(key, formatted)
+            return formatted
+
+        formatted, error = outcome
+        if error is not None:
+            raise PostprocessingException(sequence) from Exception(error)
+        return formatted
+
     @staticmethod
     def postprocess_canonical(code: str) -> str:
-        return ast.unparse(ast.parse(code))
+        return Processors.cached(
+            "canonical", "", code, lambda code: ast.unparse(ast.parse(code))
+        )
 
     @staticmethod
     def preprocess_stem(stem: str) -> str:
@@ -31,16 +116,13 @@ class Processors:
 
     @staticmethod
     def postprocess_mutation(sequence: str) -> str:
+        return Processors.cached("mutation", "", sequence, Processors.format_mutation)
+
+    @staticmethod
+    def format_mutation(sequence: str) -> str:
         transforms = (
             lambda code: code.rstrip("\n"),
-            lambda code: black.format_str(
-                code,
-                mode=black.Mode(
-                    string_normalization=False,
-                    line_length=120,
-                    magic_trailing_comma=False,
-                ),
-            ),
+            lambda code: black.format_str(code, mode=BLACK_MODE),
         )
         try:
             for transform in transforms:
@@ -50,7 +132,30 @@ class Processors:
             raise PostprocessingException(sequence) from e
 
     @staticmethod
-    def postprocess_eval(sequence: str, direct: bool = False) -> str:
+    def postprocess_eval(
+        sequence: str, direct: bool = False, fast_path: bool = False
+    ) -> str:
+        return Processors.cached(
+            "eval",
+            Processors.eval_flags(direct, fast_path),
+            sequence,
+            lambda code: Processors.format_eval(
+                code, direct=direct, fast_path=fast_path
+            ),
+        )
+
+    @staticmethod
+    def eval_flags(direct: bool, fast_path: bool) -> str:
+        # Direct completions went through the stepwise normalizer before
+        flags = "direct=fused" if direct else "direct=False"
+        if fast_path:
+            flags += ",fast_path"
+        return flags
+
+    @staticmethod
+    def format_eval(
+        sequence: str, direct: bool = False, fast_path: bool = False
+    ) -> str:
         original_sequence = copy.copy(sequence)
 
         if len(sequence.strip()) == 0:
@@ -61,19 +166,15 @@ class Processors:
         transforms = (
             lambda code: code.rstrip("\n").replace("\\\n", " "),
             # Only for direct completion we need to fix indentation because the model messes it up occasionally
-            # ---
-            lambda code: truncate_code_to_last_function(code) if direct else code,
-            lambda code: fix_odd_indents(code) if direct else code,
-            lambda code: autopep8_normalize_ident(code) if direct else code,
-            # ---
-            lambda code: remove_comments_and_docstrings(code, remove_docstrings=False),
-            lambda code: black.format_str(
-                code,
-                mode=black.Mode(
-                    string_normalization=False,
-                    line_length=120,
-                    magic_trailing_comma=False,
-                ),
+            lambda code: (
+                Processors.normalize_direct(code)
+                if direct
+                else remove_comments_and_docstrings(code, remove_docstrings=False)
+            ),
+            lambda code: (
+                Processors.format_stable(code)
+                if fast_path
+                else black.format_str(code, mode=BLACK_MODE)
             ),
         )
 
@@ -85,6 +186,84 @@ class Processors:
             raise PostprocessingException(original_sequence) from e
         return sequence
 
+    @staticmethod
+    def format_stable(code: str) -> str:
+        """
+        Format `code` with black unless every one of its logical lines is known to be
+        left unchanged by black where it is and the code parses. Either way the blank
+        lines black would insert between statements are left out, so the output does
+        not depend on whether black ran.
+        """
+        lines = logical_lines(code)
+        keys = Processors.layout_keys(lines)
+        if keys is not None and all(key in Processors.stable_lines for key in keys):
+            try:
+                ast.parse(code)
+            except SyntaxError:
+                pass
+            else:
+                Processors.fast_path_stats["skipped"] += 1
+                return "\n".join(text for text, _ in lines) + "\n"
+
+        Processors.fast_path_stats["formatted"] += 1
+        formatted_lines = logical_lines(black.format_str(code, mode=BLACK_MODE))
+        if keys is not None and len(formatted_lines) == len(lines):
+            for key, (text, _), (formatted, _) in zip(keys, lines, formatted_lines):
+                if text == formatted:
+                    Processors.stable_lines[key] = True
+        return "\n".join(text for text, _ in formatted_lines) + "\n"
+
+    @staticmethod
+    def layout_keys(lines: list[tuple[str, str]]) -> list[tuple[str, str, str]] | None:
+        """
+        Key each of `logical_lines` by its text and what black looks at around it: the
+        kind of statement before it (whether a string is a docstring) and the
+        indentation of the statement after it (where a comment goes, whether a `...`
+        body is joined to its `def`). None if a statement is wrapped in brackets, since
+        black splits those depending on the features used anywhere in the code.
+        """
+        if any(kind == "wrapped" for _, kind in lines):
+            return None
+
+        following = []
+        after = "end"
+        for text, kind in reversed(lines):
+            following.append(after)
+            if kind != "comment":
+                stripped = text.lstrip()
+                after = str(len(text) - len(stripped))
+                if stripped == "...":
+                    after += " ..."
+        following.reverse()
+
+        keys = []
+        before = "start"
+        for (text, kind), after in zip(lines, following):
+            keys.append((before, after, text))
+            if kind != "comment":
+                before = kind
+        return keys
+
+    @staticmethod
+    def normalize_direct(code: str) -> str:
+        normalized = normalize_direct_completion(code)
+        if normalized is None:
+            # Only code that does not tokenize or parse as it is needs autopep8
+            normalized = Processors.normalize_direct_stepwise(code)
+        return normalized
+
+    @staticmethod
+    def normalize_direct_stepwise(code: str) -> str:
+        transforms = (
+            truncate_code_to_last_function,
+            fix_odd_indents,
+            autopep8_normalize_ident,
+            lambda code: remove_comments_and_docstrings(code, remove_docstrings=False),
+        )
+        for transform in transforms:
+            code = transform(code)
+        return code
+
     @staticmethod
     def split_sequences(
         sequences: list[str], sids: list[str], samples_per_sequence: int
@@ -0,0 +1,80 @@
+from loguru import logger
+
+from inference.processors import Processors
+from shared.structs import MutatedStem
+
+
+class StemDeduplicator:
+    """
+    Different mutants often truncate to the same stem pair, e.g. several transformers
+    rewriting the same line. Those stems produce identical prompts, so only the first
+    result with a given stem pair at a temperature is sampled and evaluated, and every
+    later one points at it through `BenchmarkResult.stem_source`.
+
+    Mutants that differ on the same line also share the original stem even when their
+    mutated stems differ, so the original completions are only sampled and evaluated for
+    the first of them and shared through `BenchmarkResult.original_source`.
+    """
+
+    def __init__(self):
+        self.sources: dict[tuple[float, str, str], str] = {}
+        self.original_sources: dict[tuple[float, str], str] = {}
+        self.total = 0
+        self.duplicates = 0
+        self.shared_originals = 0
+
+    @staticmethod
+    def normalize(stem: str) -> str:
+        # Stems are preprocessed and stripped when they are turned into prompts
+        return Processors.preprocess_stem(stem).strip()
+
+    def stem_key(self, stem: MutatedStem, temp: float) -> tuple[float, str, str]:
+        return (
+            temp,
+            self.normalize(stem.original_stem),
+            self.normalize(stem.mutated_stem),
+        )
+
+    def source_for(self, ident: str, stem: MutatedStem, temp: float) -> str | None:
+        """
+        Register the result `ident` and return the ident of an earlier result with the
+        same stem pair at `temp`, or None if `ident` is the first one and must be sampled.
+        """
+        self.total += 1
+        key = self.stem_key(stem, temp)
+        if key in self.sources:
+            self.duplicates += 1
+            return self.sources[key]
+
+        self.sources[key] = ident
+        return None
+
+    def original_source_for(
+        self, ident: str, stem: MutatedStem, temp: float
+    ) -> str | None:
+        """
+        Return the ident of an earlier sampled result with the same original stem at
+        `temp`, or None if the original stem of `ident` must be sampled.
+        """
+        key = (temp, self.normalize(stem.original_stem))
+        if key in self.original_sources:
+            self.shared_originals += 1
+            return self.original_sources[key]
+
+        self.original_sources[key] = ident
+        return None
+
+    def report(self, num_samples: int):
+        logger.info(
+            "Deduplicated {} of {} stems, skipping {} sampling calls ({} sequences)",
+            self.duplicates,
+            self.total,
+            self.duplicates,
+            # Each sampling call completes the original and the mutated stem
+            2 * num_samples * self.duplicates,
+        )
+        logger.info(
+            "Reused original completions for {} stems, skipping {} sequences",
+            self.shared_originals,
+            num_samples * self.shared_originals,
+        )
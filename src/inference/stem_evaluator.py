@@ -1,17 +1,24 @@
-from collections import Counter, defaultdict
-from concurrent.futures import as_completed, ProcessPoolExecutor
+import pickle
+import time
+from collections import defaultdict
 from typing import Tuple, Dict
 
-from evalplus.evaluate import check_correctness
 from loguru import logger
-from tqdm import tqdm
 
 from inference.dataset_manager import DatasetManager
+from inference.evaluation_service import EvaluationService
+from inference.fail_fast import InputFailures
+from inference.precheck import precheck_solution
+from inference.time_limits import TimeLimits
+from inference.verdict_cache import VerdictCache
 from shared.metrics import pass_at_k
 from shared.structs import BenchmarkResult, SolutionType
 
 
 class StemEvaluator:
+    # evalplus' time limits, used unless calibrated `time_limits` are given
+    EVALPLUS_LIMITS = dict(min_time_limit=1, gt_time_limit_factor=5.0)
+
     def __init__(
         self,
         dataset_manager: DatasetManager,
@@ -23,6 +30,12 @@ class StemEvaluator:
         max_tasks: int = 15,
         batch_size: int = 250,
         restart_size: int = 25000,
+        queue_factor: int = 2,
+        task_timeout: float = 120.0,
+        max_chunk_size: int = 1,
+        fail_fast: bool = False,
+        time_limits: TimeLimits = None,
+        verdict_cache: VerdictCache = None,
     ):
         self.dataset_manager = dataset_manager
         self.num_samples = num_samples
@@ -33,42 +46,63 @@ class StemEvaluator:
         self.max_tasks = max_tasks
         self.batch_size = batch_size
         self.restart_size = restart_size
+        self.queue_factor = queue_factor
+        self.task_timeout = task_timeout
+        self.max_chunk_size = max_chunk_size
+        # Only tell passing from failing solutions, which is all pass@k needs
+        self.fail_fast = fail_fast
+        self.input_failures = InputFailures()
+        # Calibrated limits, evalplus' ground-truth runtimes with loose limits otherwise
+        self.time_limits = time_limits
+        self.verdict_cache = verdict_cache or VerdictCache()
 
-    def process_future_result(self, future, future_meta_mapping, results, pass_stats):
-        result_id, result_type, k = future_meta_mapping[future]
-        mutated = result_type == "mutated"
-
+    def verdicts_of(self, future, solutions: list[str]) -> list[str | None]:
         try:
-            eval_results = future.result()
-            solution: str = eval_results.pop("solution")
-
-            total = eval_results["base"][1]
-            if not self.base_only:
-                total += eval_results["plus"][1]
-
-            pass_stats[(result_id, result_type)]["total"] += 1
+            outcomes = future.result()
+        except TimeoutError:
+            # The worker was killed, so the solution ran past every test time limit
+            for solution in solutions:
+                logger.warning("Solution exceeded the task timeout:\n{}", solution)
+            self.n_timeouts += len(solutions)
+            self.timeout_time += self.task_timeout * len(solutions)
+            return [SolutionType.TIMEOUT] * len(solutions)
+        except Exception:
+            logger.exception("Error during evaluation")
+            return [None] * len(solutions)
 
-            if len(total) == 0:
+        verdicts = []
+        for solution, (verdict, elapsed, failed_input) in zip(solutions, outcomes):
+            if failed_input is not None:
+                self.input_failures.record(failed_input)
+            if verdict == SolutionType.TIMEOUT:
+                logger.warning("Solution timed out:\n{}", solution)
+                self.n_timeouts += 1
+                self.timeout_time += elapsed
+            elif verdict == SolutionType.BAD_SYNTAX:
                 logger.warning("Solution has invalid syntax :\n{}", solution)
-                results[result_id].add_example(
-                    solution, SolutionType.BAD_SYNTAX, mutated
-                )
-                return
-
-            passed = [i for i in total if i == 1]
-
-            if len(passed) == len(total):
-                pass_stats[(result_id, result_type)]["pass"] += 1
-                results[result_id].add_example(solution, SolutionType.PASSED, mutated)
-            else:
+            elif verdict == SolutionType.FAILED:
                 logger.warning("Solution failed:\n{}", solution)
-                results[result_id].add_example(solution, SolutionType.FAILED, mutated)
+            verdicts.append(verdict)
+        return verdicts
 
-        except Exception as e:
-            logger.exception("Error during evaluation")
+    @staticmethod
+    def record_verdict(ident, solution: str, verdict: str, results, pass_stats):
+        result_id, result_type, _ = ident
+        pass_stats[(result_id, result_type)]["total"] += 1
+        if verdict == SolutionType.PASSED:
+            pass_stats[(result_id, result_type)]["pass"] += 1
+        results[result_id].add_example(solution, verdict, result_type == "mutated")
 
     def update_results(self, results):
+        # Original completions shared at sampling time were only evaluated for their source
+        for result in results.values():
+            if result.original_source is not None:
+                result.share_original(results[result.original_source])
+
         for result_id, result in results.items():
+            if result.stem_source is not None:
+                continue
+
             result.pass_at_diff = {
                 k: result.pass_at_mutated[k] - result.pass_at_original[k]
                 for k in self.k
@@ -81,85 +115,237 @@ class StemEvaluator:
 
             logger.info("Result for {}:\n{}", result_id, result)
 
-    def evaluate(
+        # Results deduplicated at sampling time were never evaluated themselves
+        for result_id, result in results.items():
+            if result.stem_source is not None:
+                result.share_outcomes(results[result.stem_source])
+                logger.info(
+                    "Result for {} (shared with {}):\n{}",
+                    result_id,
+                    result.stem_source,
+                    result,
+                )
+
+    def problem_context(self):
+        if self.time_limits is not None:
+            expected_output = self.time_limits.expected_output(self.problem_id)
+        else:
+            expected_output = self.dataset_manager.get_correct(self.problem_id)
+        return self.dataset_manager.get_problem(self.problem_id), expected_output
+
+    def iter_tasks(self, solutions: Dict[str, Dict[str, str]]):
+        for result_id in solutions:
+            for key in solutions[result_id]:
+                for k, sequence in enumerate(solutions[result_id][key]):
+                    yield (result_id, key, k), sequence
+
+    def check_kwargs(self):
+        """
+        `check_solutions` arguments for the next chunk of this problem. Fail-fast chunks
+        run the inputs that failed most often so far first.
+        """
+        kwargs = dict(
+            dataset=self.dataset_manager.dataset_name,
+            problem_id=self.problem_id,
+            base_only=self.base_only,
+            **self.EVALPLUS_LIMITS,
+        )
+        if self.time_limits is not None:
+            kwargs.update(self.time_limits.check_kwargs())
+        if not self.fail_fast:
+            return dict(kwargs, fast_check=False)
+
+        problem = self.dataset_manager.get_problem(self.problem_id)
+        input_order = self.input_failures.order(problem, self.base_only)
+        return dict(kwargs, fail_fast=True, input_order=input_order)
+
+    def limits_key(self) -> str:
+        """
+        Identifies the time limits this problem's solutions are checked under, so cached
+        verdicts are only reused under the same limits.
+        """
+        if self.time_limits is not None:
+            return self.time_limits.fingerprint(self.problem_id)
+        return "evalplus-" + ",".join(
+            f"{name}={value}" for name, value in self.EVALPLUS_LIMITS.items()
+        )
+
+    def log_payload(self, solutions, problem_context):
+        """
+        Log how much a single solution task sends to the workers, and how much it would
+        send if it carried the problem context itself.
+        """
+        task = next(self.iter_tasks(solutions), None)
+        if task is None:
+            return
+        _, solution = task
+        kwargs = dict(self.check_kwargs(), solutions=[solution])
+        problem, expected_output = problem_context
+        full_kwargs = dict(kwargs, problem=problem, expected_output=expected_output)
+
+        for label, payload in (
+            ("carrying the problem context", full_kwargs),
+            ("using the worker context", kwargs),
+        ):
+            start = time.perf_counter()
+            size = len(pickle.dumps(payload))
+            elapsed = time.perf_counter() - start
+            logger.info(
+                "Task payload {}: {} bytes, pickled in {:.3f} ms",
+                label,
+                size,
+                elapsed * 1000,
+            )
+
+    def start(
         self, solutions: Dict[str, Dict[str, str]], results: Dict[str, BenchmarkResult]
     ):
-        futures = []
-        future_meta_mapping = {}
-        completion_id = Counter()
-        n_samples = 0
-        remaining = set()
-        pass_stats = defaultdict(lambda: {"pass": 0, "total": 0})
-        completed_jobs = 0
-
-        executor = ProcessPoolExecutor(max_workers=self.max_workers)
-        logger.info(
-            "Creating process pool with {} workers and {} tasks",
-            self.max_workers,
-            self.max_tasks,
+        """
+        Prepare to evaluate `solutions` into `results` through an `EvaluationService`.
+        """
+        self.solutions = solutions
+        self.results = results
+        self.pass_stats = defaultdict(lambda: {"pass": 0, "total": 0})
+        # Identical solutions are evaluated once, duplicates wait on the first one
+        self.waiting: dict[tuple, list[tuple]] = {}
+        self.n_samples = sum(
+            len(sequences)
+            for result_solutions in solutions.values()
+            for sequences in result_solutions.values()
         )
+        self.n_evaluated = 0
+        self.n_shared = 0
+        self.n_prechecked = 0
+        self.n_timeouts = 0
+        self.timeout_time = 0.0
+        self.in_flight = 0
+        self.dispatched = False
+        self.cache_limits = self.limits_key()
 
-        try:
-            for i, result_id in enumerate(tqdm(solutions.keys())):
-                for j, key in enumerate(solutions[result_id]):
-                    sequences = solutions[result_id][key]
-                    for k, sequence in enumerate(sequences):
-                        ident = (result_id, key, k)
-                        remaining.add(ident)
-                        kwargs = dict(
-                            dataset=self.dataset_manager.dataset_name,
-                            completion_id=completion_id[ident],
-                            problem=self.dataset_manager.get_problem(self.problem_id),
-                            solution=sequence,
-                            expected_output=self.dataset_manager.get_correct(
-                                self.problem_id
-                            ),
-                            fast_check=False,
-                            base_only=self.base_only,
-                            identifier=ident,
-                            min_time_limit=1,
-                            gt_time_limit_factor=5.0,
-                        )
-                        futures.append(executor.submit(check_correctness, **kwargs))
-                        future_meta_mapping[futures[-1]] = ident
-                        completion_id[ident] += 1
-                        n_samples += 1
-
-                        if len(futures) >= self.batch_size:
-                            logger.info("Reached batch size, waiting for completion...")
-                            logger.debug("Remaining: {}", len(remaining))
-                            for future in tqdm(
-                                as_completed(futures), total=len(futures)
-                            ):
-                                self.process_future_result(
-                                    future, future_meta_mapping, results, pass_stats
-                                )
-                                remaining.remove(future_meta_mapping[future])
-                                completed_jobs += 1
-
-                            futures = []
-
-            for future in as_completed(futures):
-                self.process_future_result(
-                    future, future_meta_mapping, results, pass_stats
+        self.log_payload(solutions, self.problem_context())
+
+    @property
+    def done(self) -> bool:
+        return self.dispatched and self.in_flight == 0
+
+    def solution_of(self, ident) -> str:
+        result_id, key, k = ident
+        return self.solutions[result_id][key][k]
+
+    def dispatch(self):
+        """
+        `(meta, solution)` for the solutions that pass the precheck and whose verdicts are
+        not cached or already in flight.
+        """
+        entry_point = self.dataset_manager.get_problem(self.problem_id)["entry_point"]
+        for ident, solution in self.iter_tasks(self.solutions):
+            # Solutions evalplus would not run any tests for never need a worker
+            verdict = precheck_solution(solution, entry_point)
+            if verdict is not None:
+                logger.warning("Solution has invalid syntax :\n{}", solution)
+                self.record_verdict(
+                    ident, solution, verdict, self.results, self.pass_stats
                 )
-                remaining.remove(future_meta_mapping[future])
+                self.n_prechecked += 1
+                continue
 
-        finally:
-            logger.warning("Shutting down executor...")
-            executor.shutdown(wait=True, cancel_futures=True)
+            cache_key = self.verdict_cache.key(
+                self.dataset_manager.dataset_hash,
+                self.problem_id,
+                self.base_only,
+                solution,
+                fail_fast=self.fail_fast,
+                limits=self.cache_limits,
+            )
+            if cache_key in self.waiting:
+                self.waiting[cache_key].append(ident)
+                self.n_shared += 1
+                continue
+
+            verdict = self.verdict_cache.get(cache_key)
+            if verdict is not None:
+                self.record_verdict(
+                    ident, solution, verdict, self.results, self.pass_stats
+                )
+                continue
+
+            self.waiting[cache_key] = []
+            self.in_flight += 1
+            yield (ident, cache_key), solution
+
+    def complete(self, metas, future) -> int:
+        """
+        Record the verdicts of a finished chunk for its solutions and every duplicate of
+        them, returning how many samples were recorded.
+        """
+        self.in_flight -= len(metas)
+        self.n_evaluated += len(metas)
+        verdicts = self.verdicts_of(
+            future, [self.solution_of(ident) for ident, _ in metas]
+        )
+        n_recorded = 0
+        for (ident, cache_key), verdict in zip(metas, verdicts):
+            duplicates = self.waiting.pop(cache_key)
+            if verdict is None:
+                continue
+
+            # Timeouts depend on load, so they are not worth persisting
+            if verdict != SolutionType.TIMEOUT:
+                self.verdict_cache.put(cache_key, verdict)
+            for dup in [ident] + duplicates:
+                self.record_verdict(
+                    dup, self.solution_of(dup), verdict, self.results, self.pass_stats
+                )
+            n_recorded += len(duplicates) + 1
+        return n_recorded
+
+    def finish(self):
+        self.verdict_cache.flush()
+        self.verdict_cache.report(self.problem_id)
+        logger.info(
+            "Shared {} verdicts with identical in-flight solutions", self.n_shared
+        )
+        logger.info(
+            "Precheck classified {} samples without a worker", self.n_prechecked
+        )
+        logger.info(
+            "{} samples timed out, spending {:.1f}s of worker time",
+            self.n_timeouts,
+            self.timeout_time,
+        )
+        completed_jobs = sum(stats["total"] for stats in self.pass_stats.values())
 
-        logger.info("Num Samples: {}", n_samples)
+        logger.info("Num Samples: {}", self.n_samples)
+        logger.info("Evaluated Jobs: {}", self.n_evaluated)
         logger.info("Completed Jobs: {}", completed_jobs)
-        logger.info("Remaining Jobs: {}", len(remaining))
+        logger.info("Remaining Jobs: {}", self.n_samples - completed_jobs)
 
-        for result_id, result_type in pass_stats:
-            stats = pass_stats[(result_id, result_type)]
+        for result_id, result_type in self.pass_stats:
+            stats = self.pass_stats[(result_id, result_type)]
             for k in self.k:
                 pass_k = pass_at_k(stats["total"], stats["pass"], k)
                 if result_type == "original":
-                    results[result_id].pass_at_original[k] = pass_k
+                    self.results[result_id].pass_at_original[k] = pass_k
                 else:
-                    results[result_id].pass_at_mutated[k] = pass_k
+                    self.results[result_id].pass_at_mutated[k] = pass_k
+
+        self.update_results(self.results)
 
-        self.update_results(results)
+    def evaluate(
+        self, solutions: Dict[str, Dict[str, str]], results: Dict[str, BenchmarkResult]
+    ):
+        service = EvaluationService(
+            max_workers=self.max_workers,
+            max_tasks=self.max_tasks,
+            batch_size=self.batch_size,
+            restart_size=self.restart_size,
+            queue_factor=self.queue_factor,
+            task_timeout=self.task_timeout,
+            max_chunk_size=self.max_chunk_size,
+        )
+        self.start(solutions, results)
+        try:
+            for _ in service.run([self]):
+                pass
+        finally:
+            service.close()
@@ -0,0 +1,158 @@
+import copy
+import hashlib
+import os
+import pickle
+import platform
+import time
+from typing import Any, Iterable
+
+from loguru import logger
+from pebble import ProcessPool
+
+
+def measure_runtimes(problem: dict[str, Any], repeats: int = 3) -> dict[str, list]:
+    """
+    Runtimes of the canonical solution of `problem` on each of its base and plus inputs,
+    keeping the slowest of `repeats` runs, keyed like evalplus' ground truth.
+    """
+    exec_globals = {}
+    exec(problem["prompt"] + problem["canonical_solution"], exec_globals)
+    fn = exec_globals[problem["entry_point"]]
+
+    runtimes = {}
+    for split in ("base", "plus"):
+        inputs = problem[f"{split}_input"]
+        times = [0.0] * len(inputs)
+        for _ in range(repeats):
+            # Canonical solutions may change their arguments in place
+            for i, inp in enumerate(copy.deepcopy(inputs)):
+                start = time.perf_counter()
+                fn(*inp)
+                times[i] = max(times[i], time.perf_counter() - start)
+        runtimes[f"{split}_time"] = times
+    return runtimes
+
+
+class TimeLimits:
+    """
+    Per-input time limits calibrated on this machine. evalplus limits each input to
+    `max(min_time_limit, gt_time_limit_factor * runtime)`, but its ground-truth runtimes
+    come from wherever its cache was built. These are measured here instead, once per
+    problem, and cached per dataset hash and host in `cache_dir`, so `margin` can be
+    tight without failing correct solutions.
+
+    Canonical solutions are measured in a process pool of `max_workers`, each killed
+    after `timeout` seconds. `calibrate` the problems of a run before evaluating them
+    when they are known up front, otherwise each problem is measured on first use.
+    """
+
+    def __init__(
+        self,
+        dataset_manager,
+        margin: float = 3.0,
+        min_time_limit: float = 0.1,
+        repeats: int = 3,
+        cache_dir: str = ".cache/ground_truth_times",
+        max_workers: int = 8,
+        timeout: float = 60.0,
+    ):
+        self.dataset_manager = dataset_manager
+        self.margin = margin
+        self.min_time_limit = min_time_limit
+        self.repeats = repeats
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.path = os.path.join(
+            cache_dir, f"{dataset_manager.dataset_hash}-{platform.node()}.pkl"
+        )
+
+        self.runtimes: dict[str, dict[str, list]] = {}
+        if os.path.exists(self.path):
+            with open(self.path, "rb") as f:
+                self.runtimes = pickle.load(f)
+        # evalplus' runtimes of problems that could not be measured, only for this run
+        self.fallbacks: dict[str, dict[str, list]] = {}
+
+    def calibrate(self, problem_ids: Iterable[str]):
+        """
+        Measure the runtimes of every problem in `problem_ids` that has none yet. Problems
+        whose canonical solution fails or runs past `timeout` keep evalplus' runtimes.
+        """
+        missing = [
+            problem_id
+            for problem_id in dict.fromkeys(problem_ids)
+            if problem_id not in self.runtimes and problem_id not in self.fallbacks
+        ]
+        if not missing:
+            return
+
+        start = time.perf_counter()
+        with ProcessPool(max_workers=min(self.max_workers, len(missing))) as pool:
+            futures = {
+                problem_id: pool.schedule(
+                    measure_runtimes,
+                    args=(self.dataset_manager.get_problem(problem_id), self.repeats),
+                    timeout=self.timeout,
+                )
+                for problem_id in missing
+            }
+            for problem_id, future in futures.items():
+                try:
+                    self.runtimes[problem_id] = future.result()
+                except Exception as e:
+                    logger.warning(
+                        "Could not measure the ground-truth runtimes of {} ({!r}), "
+                        "keeping evalplus' runtimes",
+                        problem_id,
+                        e,
+                    )
+                    correct = self.dataset_manager.get_correct(problem_id)
+                    self.fallbacks[problem_id] = {
+                        key: correct[key] for key in ("base_time", "plus_time")
+                    }
+        logger.info(
+            "Measured the ground-truth runtimes of {} problems in {:.2f}s",
+            len(missing),
+            time.perf_counter() - start,
+        )
+        self.save()
+
+    def runtimes_of(self, problem_id: str) -> dict[str, list]:
+        self.calibrate([problem_id])
+        if problem_id in self.runtimes:
+            return self.runtimes[problem_id]
+        return self.fallbacks[problem_id]
+
+    def limits(self, problem_id: str) -> dict[str, list]:
+        return {
+            key: [max(self.min_time_limit, self.margin * t) for t in times]
+            for key, times in self.runtimes_of(problem_id).items()
+        }
+
+    def fingerprint(self, problem_id: str) -> str:
+        """
+        Identifies the limits of `problem_id`, which change with the margin, the floor
+        and the runtimes measured on this machine.
+        """
+        limits = repr(sorted(self.limits(problem_id).items()))
+        return f"calibrated-{hashlib.sha256(limits.encode()).hexdigest()[:16]}"
+
+    def expected_output(self, problem_id: str) -> dict[str, Any]:
+        """
+        The ground truth of `problem_id` with the runtimes measured on this machine.
+        """
+        return dict(
+            self.dataset_manager.get_correct(problem_id), **self.runtimes_of(problem_id)
+        )
+
+    def check_kwargs(self) -> dict[str, float]:
+        return dict(
+            min_time_limit=self.min_time_limit, gt_time_limit_factor=self.margin
+        )
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        # Written aside and swapped in, so an interrupted run never truncates the cache
+        with open(f"{self.path}.tmp", "wb") as f:
+            pickle.dump(self.runtimes, f)
+        os.replace(f"{self.path}.tmp", self.path)
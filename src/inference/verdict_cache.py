@@ -0,0 +1,73 @@
+import hashlib
+
+from loguru import logger
+
+from shared.tiered_cache import TieredCache
+
+
+class VerdictCache(TieredCache):
+    """
+    Content-addressed cache of evaluation verdicts (`SolutionType`s), keyed by the
+    dataset hash, problem id, `base_only`, `fail_fast`, the time limits and the hash of
+    the normalized solution. Fail-fast verdicts only tell passing from failing
+    solutions, so they are kept apart from full ones, and a solution that passes under
+    loose limits may fail under tight ones.
+
+    Lookups go through an in-memory LRU tier first and then, if `path` is set, an
+    SQLite tier that persists verdicts across runs, see `TieredCache`.
+    """
+
+    name = "Verdict cache"
+    table = "verdicts"
+    key_columns = {
+        "dataset_hash": "TEXT",
+        "problem_id": "TEXT",
+        "base_only": "INTEGER",
+        "fail_fast": "INTEGER",
+        "limits": "TEXT",
+        "solution_hash": "TEXT",
+    }
+    value_columns = {"verdict": "TEXT"}
+
+    def create_table(self):
+        columns = [row[1] for row in self.db.execute("PRAGMA table_info(verdicts)")]
+        if columns and "limits" not in columns:
+            # Verdicts cached without their time limits, the cache starts over
+            logger.warning("Dropping verdict cache {} with an old schema", self.path)
+            self.db.execute("DROP TABLE verdicts")
+        super().create_table()
+
+    @staticmethod
+    def normalize(solution: str) -> str:
+        # Only changes that cannot affect execution, leading indentation still matters
+        return solution.replace("\r\n", "\n").rstrip()
+
+    def key(
+        self,
+        dataset_hash: str,
+        problem_id: str,
+        base_only: bool,
+        solution: str,
+        fail_fast: bool = False,
+        limits: str = "",
+    ) -> tuple[str, str, int, int, str, str]:
+        """
+        `limits` identifies the time limits the solution is checked under, see
+        `StemEvaluator.limits_key`.
+        """
+        solution_hash = hashlib.sha256(self.normalize(solution).encode()).hexdigest()
+        return (
+            dataset_hash,
+            problem_id,
+            int(base_only),
+            int(fail_fast),
+            limits,
+            solution_hash,
+        )
+
+    def get(self, key: tuple[str, str, int, int, str, str]) -> str | None:
+        row = super().get(key)
+        return None if row is None else row[0]
+
+    def put(self, key: tuple[str, str, int, int, str, str], verdict: str):
+        super().put(key, (verdict,))
@@ -1,5 +1,10 @@
 from .registry import CRT, RegisteredMixin
-from .mutation import RegisteredTransformation, OneByOneTransformer
+from .mutation import (
+    RegisteredTransformation,
+    OneByOneTransformer,
+    fused_candidates,
+    fused_transform,
+)
 from .visitor import OneByOneVisitor
 
 import importlib
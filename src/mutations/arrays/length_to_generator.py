@@ -7,6 +7,8 @@ from mutations.visitor import OneByOneVisitor
 
 
 class LenToGeneratorVisitor(OneByOneVisitor):
+    node_types = (ast.Call,)
+
     def transform_node(self, node) -> list[ast.AST] | ast.AST:
         new_call = ast.Call(
             func=ast.Name(id="sum", ctx=ast.Load()),
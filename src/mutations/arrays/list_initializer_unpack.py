@@ -8,6 +8,8 @@ from shared.ast_utils import is_unary_assign
 
 
 class ListInitializerUnpackVisitor(OneByOneVisitor):
+    node_types = (ast.Assign,)
+
     def transform_node(self, node) -> list[ast.AST] | ast.AST:
         new_value = ast.Call(
             func=ast.Name(id="list", ctx=ast.Load()),
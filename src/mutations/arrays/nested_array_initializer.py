@@ -8,6 +8,7 @@ from shared.ast_utils import is_unary_assign
 
 
 class NestedArrayInitializerVisitor(OneByOneVisitor):
+    node_types = (ast.Assign,)
 
     def is_transformable(self, node):
         return is_unary_assign(node) and isinstance(node.value, ast.List)
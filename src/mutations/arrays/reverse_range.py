@@ -9,6 +9,8 @@ from shared.ast_utils import get_constant_num
 
 
 class ReverseRangeVisitor(OneByOneVisitor):
+    node_types = (ast.Call,)
+
     def extract_range_params(
         self, node
     ) -> Tuple[ast.Constant, ast.Constant, ast.Constant]:
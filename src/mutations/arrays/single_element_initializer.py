@@ -8,6 +8,7 @@ from shared.ast_utils import is_unary_assign
 
 
 class SingleElementInitializerVisitor(OneByOneVisitor):
+    node_types = (ast.Assign,)
 
     def is_transformable(self, node):
         return (
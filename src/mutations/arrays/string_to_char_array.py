@@ -7,6 +7,8 @@ from mutations.visitor import OneByOneVisitor
 
 
 class StringToCharArrayVisitor(OneByOneVisitor):
+    node_types = (ast.Assign,)
+
     def transform_node(self, node) -> list[ast.AST] | ast.AST:
         string_value = node.value.value
         char_nodes = [ast.Constant(value=char) for char in string_value]
@@ -10,6 +10,8 @@ from shared.ast_utils import is_unary_assign
 
 
 class BooleanDemorgansVisitor(OneByOneVisitor):
+    node_types = (ast.If, ast.While, ast.Return, ast.Assign, ast.Expr)
+
     # TODO @abaveja313: add support for nested demorgans simplification
     def transform_node(self, node) -> list[ast.AST] | ast.AST:
         return self.apply_demorgans(node)
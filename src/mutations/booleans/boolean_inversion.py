@@ -77,6 +77,8 @@ class SimplifyTransformer(ast.NodeTransformer):
 
 
 class FirstInversionVisitor(OneByOneVisitor):
+    node_types = (ast.If, ast.While)
+
     def is_transformable(self, node):
         return isinstance(node, (ast.If, ast.While))
 
@@ -128,6 +130,8 @@ class FirstInversionVisitor(OneByOneVisitor):
 
 
 class SecondInversionVisitor(OneByOneVisitor):
+    node_types = (ast.If, ast.While, ast.Assign)
+
     def is_boolean_expr(self, node):
         return (
             isinstance(node, (ast.Constant, ast.NameConstant))
@@ -9,6 +9,8 @@ from mutations import (
 
 
 class ExpandBooleansVisitor(OneByOneVisitor):
+    node_types = (ast.Compare, ast.UnaryOp, ast.Constant)
+
     def transform_node(self, node) -> list[ast.AST] | ast.AST:
         return ast.BoolOp(op=ast.And(), values=[node, ast.Constant(value=True)])
 
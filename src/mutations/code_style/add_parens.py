@@ -1,24 +1,23 @@
 import ast
 from typing import Callable
 
-from asttokens import ASTTokens
-
 from mutations import RegisteredTransformation, CRT
 
-from shared.ast_utils import get_docstring_ranges, is_node_within_docstring
+from shared.ast_utils import ParsedProgram, is_node_within_docstring
 
 
 class ParensProcessor:
-    def __init__(self, source_code, node_types=None):
-        self.source_code = source_code
+    def __init__(self, source_code: str | ParsedProgram, node_types=None):
+        self.program = ParsedProgram.of(source_code)
+        self.source_code = self.program.code
         self.node_types = (
             node_types
             if node_types
             else [ast.BinOp, ast.UnaryOp, ast.BoolOp, ast.Compare, ast.UnaryOp]
         )
-        self.atok = ASTTokens(source_code, parse=True)
-        self.tree = self.atok.tree
-        self.docstring_ranges = get_docstring_ranges(self.tree)
+        self.atok = self.program.tokens
+        self.tree = self.program.tree
+        self.docstring_ranges = self.program.docstring_ranges
 
     def add_redundant_parens(self, target_node):
         original_text = self.atok.get_text(target_node)
@@ -27,17 +26,11 @@ class ParensProcessor:
         return modified_source
 
     def find_and_paren_nodes_recursive(self):
-        nodes = []
-
-        def find_nodes(node):
-            if isinstance(
-                node, tuple(self.node_types)
-            ) and not is_node_within_docstring(node, self.docstring_ranges):
-                nodes.append(node)
-            for child in ast.iter_child_nodes(node):
-                find_nodes(child)
-
-        find_nodes(self.tree)
+        nodes = [
+            node
+            for node in self.program.nodes_of_type(*self.node_types)
+            if not is_node_within_docstring(node, self.docstring_ranges)
+        ]
 
         for node in nodes:
             yield self.add_redundant_parens(node)
@@ -49,7 +42,7 @@ class AddParensTransformer(RegisteredTransformation, category=CRT.code_style):
         return True
 
     @property
-    def attack_func(self) -> Callable[[str], list[str]]:
+    def attack_func(self) -> Callable[[str | ParsedProgram], list[str]]:
         def process(source) -> list[str]:
             parens_processor = ParensProcessor(source)
             return list(parens_processor.find_and_paren_nodes_recursive())
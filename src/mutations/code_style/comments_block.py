@@ -1,6 +1,5 @@
-from asttokens import asttokens
 from mutations import RegisteredTransformation, CRT
-from shared.ast_utils import get_docstring_ranges, is_line_within_docstring
+from shared.ast_utils import ParsedProgram, is_line_within_docstring
 
 
 class BlockCommentsTransformer(RegisteredTransformation, category=CRT.code_style):
@@ -13,11 +12,12 @@ class BlockCommentsTransformer(RegisteredTransformation, category=CRT.code_style
     def deterministic(self):
         return True  # Set to False to generate different variations
 
-    def transform(self, code: str):
+    def transform(self, source: str | ParsedProgram):
+        program = ParsedProgram.of(source)
+        code = program.code
         new_lines = code.split("\n")
         results = []
-        tree = asttokens.ASTTokens(code, parse=True).tree
-        docstring_lines = get_docstring_ranges(tree)
+        docstring_lines = program.docstring_ranges
 
         for i, line in enumerate(new_lines, start=1):
             if is_line_within_docstring(i, docstring_lines):
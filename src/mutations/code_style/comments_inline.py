@@ -1,9 +1,8 @@
 from typing import Callable
 
-import asttokens
 from mutations import RegisteredTransformation, CRT
 
-from shared.ast_utils import is_line_within_docstring, get_docstring_ranges
+from shared.ast_utils import ParsedProgram, is_line_within_docstring
 
 
 class InlineCommentsTransformer(RegisteredTransformation, category=CRT.code_style):
@@ -16,12 +15,13 @@ class InlineCommentsTransformer(RegisteredTransformation, category=CRT.code_styl
     def deterministic(self):
         return False
 
-    def transform(self, code: str):
+    def transform(self, source: str | ParsedProgram):
+        program = ParsedProgram.of(source)
+        code = program.code
         results = []
         lines = code.split("\n")
 
-        tree = asttokens.ASTTokens(code, parse=True).tree
-        docstring_lines = get_docstring_ranges(tree)
+        docstring_lines = program.docstring_ranges
 
         # Add inline comment to each indented line
         for i, line in enumerate(lines, start=1):
@@ -36,5 +36,5 @@ class InlineCommentsTransformer(RegisteredTransformation, category=CRT.code_styl
         return results
 
     @property
-    def attack_func(self) -> Callable[[str], list[str]]:
+    def attack_func(self) -> Callable[[str | ParsedProgram], list[str]]:
         return self.transform
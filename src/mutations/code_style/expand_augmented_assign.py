@@ -9,6 +9,8 @@ from mutations import (
 
 
 class ExpandAugmentedAssignVisitor(OneByOneVisitor):
+    node_types = (ast.AugAssign,)
+
     def transform_node(self, node) -> list[ast.AST] | ast.AST:
         new_value = ast.BinOp(left=node.target, op=node.op, right=node.value)
         return ast.Assign(targets=[node.target], value=new_value)
@@ -56,14 +56,16 @@ class DeclaredIdentifiersCollector(ast.NodeVisitor):
         self.generic_visit(node)
 
 
-def collect_declared_identifiers(source_code):
-    tree = ast.parse(source_code)
+def collect_declared_identifiers(source_code: str | ast.AST):
+    tree = ast.parse(source_code) if isinstance(source_code, str) else source_code
     collector = DeclaredIdentifiersCollector()
     collector.visit(tree)
     return list(collector.declared_idents)
 
 
 class IdentifierRenameVisitorBase(OneByOneVisitor, ABC):
+    node_types = (ast.For, ast.Assign)
+
     def is_transformable(self, node):
         # Skip function declarations as they cause truncation prematurely
         return isinstance(node, ast.For) or is_unary_assign(node)
@@ -90,7 +92,7 @@ class IdentifierRenameVisitorBase(OneByOneVisitor, ABC):
 
 class IdentifierRenameVisitor(IdentifierRenameVisitorBase):
     def next_identifier(self) -> typing.Generator[str, None, None]:
-        consumed_tokens = collect_declared_identifiers(self.source_code)
+        consumed_tokens = collect_declared_identifiers(self.ast_tree)
         existing_set = set(consumed_tokens)
 
         # Check single letter identifiers first
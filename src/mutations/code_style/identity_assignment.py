@@ -9,6 +9,8 @@ from shared.ast_utils import StatementGroup
 
 
 class IdentityAssignmentVisitor(OneByOneVisitor):
+    node_types = (ast.Assign,)
+
     def is_transformable(self, node):
         return is_unary_assign(node)
 
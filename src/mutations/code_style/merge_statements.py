@@ -1,19 +1,19 @@
 import ast
 from typing import Callable
 
-from asttokens import asttokens
-
 from mutations import (
     RegisteredTransformation,
     CRT,
 )
+from shared.ast_utils import ParsedProgram
 
 
 class MergeConsecutiveStatements:
-    def __init__(self, source):
-        self.source = source
-        self.atok = asttokens.ASTTokens(source, parse=True)
-        self.tree = self.atok.tree
+    def __init__(self, source: str | ParsedProgram):
+        self.program = ParsedProgram.of(source)
+        self.source = self.program.code
+        self.atok = self.program.tokens
+        self.tree = self.program.tree
 
     def merge_statements(self, statements):
         merged_versions = []
@@ -69,8 +69,8 @@ class MergeStatementsTransformer(RegisteredTransformation, category=CRT.code_sty
         return True
 
     @property
-    def attack_func(self) -> Callable[[str], list[str]]:
-        def process(source: str) -> list[str]:
+    def attack_func(self) -> Callable[[str | ParsedProgram], list[str]]:
+        def process(source: str | ParsedProgram) -> list[str]:
             merger = MergeConsecutiveStatements(source=source)
             return list(merger.get_merged_versions())
 
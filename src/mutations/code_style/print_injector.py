@@ -11,6 +11,8 @@ from shared.ast_utils import StatementGroup
 
 
 class PrintInjectionVisitor(OneByOneVisitor):
+    node_types = (ast.Call, ast.Assign, ast.Expr)
+
     @staticmethod
     def debug_statement():
         return ast.Expr(
@@ -1,18 +1,18 @@
 import ast
 from typing import Callable
-from asttokens import ASTTokens
 from mutations import RegisteredTransformation, CRT
-from shared.ast_utils import get_docstring_ranges, is_node_within_docstring
+from shared.ast_utils import ParsedProgram, is_node_within_docstring
 
 
 class StringQuoteTransformer:
-    def __init__(self, source_code, old, new):
+    def __init__(self, source_code: str | ParsedProgram, old, new):
         self.old = old
         self.new = new
-        self.source_code = source_code
-        self.atok = ASTTokens(source_code, parse=True)
-        self.tree = self.atok.tree
-        self.docstring_lines = get_docstring_ranges(self.tree)
+        self.program = ParsedProgram.of(source_code)
+        self.source_code = self.program.code
+        self.atok = self.program.tokens
+        self.tree = self.program.tree
+        self.docstring_lines = self.program.docstring_ranges
 
     def replace_quotes(self, target_node):
         original_text = self.atok.get_text(target_node)
@@ -32,20 +32,13 @@ class StringQuoteTransformer:
         return modified_source
 
     def find_and_replace_strings(self):
-        nodes = []
-
-        def find_nodes(node):
-            if (
-                isinstance(node, ast.Constant)
-                and isinstance(node.value, str)
-                and f"{self.old}" in self.atok.get_text(node)
-                and not is_node_within_docstring(node, self.docstring_lines)
-            ):
-                nodes.append(node)
-            for child in ast.iter_child_nodes(node):
-                find_nodes(child)
-
-        find_nodes(self.tree)
+        nodes = [
+            node
+            for node in self.program.nodes_of_type(ast.Constant)
+            if isinstance(node.value, str)
+            and f"{self.old}" in self.atok.get_text(node)
+            and not is_node_within_docstring(node, self.docstring_lines)
+        ]
 
         for node in nodes:
             yield self.replace_quotes(node)
@@ -59,8 +52,8 @@ class StringQuoteSingleTransformer(
         return True
 
     @property
-    def attack_func(self) -> Callable[[str], list[str]]:
-        def process(source: str) -> list[str]:
+    def attack_func(self) -> Callable[[str | ParsedProgram], list[str]]:
+        def process(source: str | ParsedProgram) -> list[str]:
             transformer = StringQuoteTransformer(source, old='"', new="'")
             return list(transformer.find_and_replace_strings())
 
@@ -75,8 +68,8 @@ class StringQuoteDoubleTransformer(
         return True
 
     @property
-    def attack_func(self) -> Callable[[str], list[str]]:
-        def process(source: str) -> list[str]:
+    def attack_func(self) -> Callable[[str | ParsedProgram], list[str]]:
+        def process(source: str | ParsedProgram) -> list[str]:
             transformer = StringQuoteTransformer(source, old="'", new='"')
             return list(transformer.find_and_replace_strings())
 
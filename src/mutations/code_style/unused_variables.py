@@ -12,6 +12,7 @@ from shared.ast_utils import StatementGroup
 
 
 class UnusedVariableVisitor(OneByOneVisitor):
+    node_types = (ast.Call, ast.Assign, ast.Expr)
 
     @staticmethod
     def weird_assign():
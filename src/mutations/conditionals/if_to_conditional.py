@@ -10,6 +10,8 @@ from shared.ast_utils import has_elif_block
 
 
 class IfToConditionalVisitor(OneByOneVisitor):
+    node_types = (ast.If,)
+
     def transform_node(self, node) -> list[ast.AST] | ast.AST:
         if_body = node.body[0]
         else_body = node.orelse[0]
@@ -5,6 +5,8 @@ from mutations import OneByOneVisitor, OneByOneTransformer, CRT
 
 
 class IfToWhileLoopVisitor(OneByOneVisitor):
+    node_types = (ast.If,)
+
     def transform_node(self, node) -> list[ast.AST] | ast.AST:
         while_loop = ast.While(test=node.test, body=[ast.Pass()], orelse=[])
         return while_loop
@@ -5,6 +5,7 @@ from mutations import OneByOneVisitor, OneByOneTransformer, CRT
 
 
 class ArrayToDictVisitor(OneByOneVisitor):
+    node_types = (ast.Assign,)
 
     def is_transformable(self, node):
         return (
@@ -7,6 +7,8 @@ from shared.ast_utils import is_unary_assign
 
 
 class DictInitializerUnpackVisitor(OneByOneVisitor):
+    node_types = (ast.Assign,)
+
     def transform_node(self, node) -> list[ast.AST] | ast.AST:
         empty_dict = ast.Dict(keys=[], values=[])
 
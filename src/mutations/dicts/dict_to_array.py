@@ -5,6 +5,7 @@ from mutations import OneByOneVisitor, OneByOneTransformer, CRT
 
 
 class DictToArrayVisitor(OneByOneVisitor):
+    node_types = (ast.Assign,)
 
     def is_transformable(self, node):
         if isinstance(node, ast.Assign):
@@ -10,6 +10,7 @@ from mutations import (
 
 
 class EnumerateForVisitor(OneByOneVisitor):
+    node_types = (ast.For,)
 
     def is_transformable(self, node):
         return isinstance(node, ast.For) and not (
@@ -11,6 +11,7 @@ from shared.ast_utils import StatementGroup
 
 
 class ForToWhileVisitor(OneByOneVisitor):
+    node_types = (ast.For,)
 
     def is_transformable(self, node):
         return (
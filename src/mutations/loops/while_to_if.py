@@ -9,6 +9,7 @@ from mutations import (
 
 
 class WhileToIfVisitor(OneByOneVisitor):
+    node_types = (ast.While,)
 
     def transform_node(self, node) -> list[ast.AST] | ast.AST:
         return ast.If(body=[ast.Pass()], test=node.test, orelse=[])
@@ -5,6 +5,8 @@ from mutations import OneByOneTransformer, OneByOneVisitor, CRT
 
 
 class MultiplyBy2ToBitshiftVisitor(OneByOneVisitor):
+    node_types = (ast.BinOp,)
+
     def is_transformable(self, node):
         return (
             isinstance(node, ast.BinOp)
@@ -20,6 +22,8 @@ class MultiplyBy2ToBitshiftVisitor(OneByOneVisitor):
 
 
 class DivideBy2ToBitshiftVisitor(OneByOneVisitor):
+    node_types = (ast.BinOp,)
+
     def is_transformable(self, node):
         return (
             isinstance(node, ast.BinOp)
@@ -35,6 +39,8 @@ class DivideBy2ToBitshiftVisitor(OneByOneVisitor):
 
 
 class NegationToComplementVisitor(OneByOneVisitor):
+    node_types = (ast.UnaryOp,)
+
     def is_transformable(self, node):
         return isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub)
 
@@ -10,6 +10,8 @@ from mutations import (
 
 
 class MathInversionVisitor(OneByOneVisitor, ABC):
+    node_types = (ast.BinOp,)
+
     @property
     @abstractmethod
     def op_type(self):
@@ -1,13 +1,16 @@
+import ast
 from abc import ABC, abstractmethod
-from typing import Type, Callable
+from itertools import islice
+from typing import Type, Callable, Iterable, Iterator
 
 from loguru import logger
 
 from inference.processors import Processors
 from mutations.registry import RegisteredMixin
 from mutations.visitor import OneByOneVisitor
+from shared.ast_utils import ParsedProgram
 from shared.structs import MutatedStem
-from shared.program_utils import parse_stem
+from shared.program_utils import parse_stem, stratified_order
 
 
 class RegisteredTransformation(RegisteredMixin, ABC, abstract=True):
@@ -22,14 +25,23 @@ class RegisteredTransformation(RegisteredMixin, ABC, abstract=True):
 
     @property
     @abstractmethod
-    def attack_func(self) -> Callable[[str], list[str]]:
+    def attack_func(self) -> Callable[[str | ParsedProgram], list[str]]:
         pass
 
     def postprocess(self, original: str, mutated: list[str]) -> list[MutatedStem]:
-        results = []
+        return list(self.iter_postprocess(original, mutated))
+
+    def iter_postprocess(
+        self, original: str, mutated: Iterable[str]
+    ) -> Iterator[MutatedStem]:
+        try:
+            post_processed_original = Processors.postprocess_mutation(original)
+        except Exception:
+            logger.warning("Failed to postprocess sequence:\nOriginal:\n{}", original)
+            return
+
         for m in mutated:
             try:
-                post_processed_original = Processors.postprocess_mutation(original)
                 post_processed_mutated = Processors.postprocess_mutation(m)
             except Exception:
                 logger.warning(
@@ -49,20 +61,68 @@ class RegisteredTransformation(RegisteredMixin, ABC, abstract=True):
                 continue
 
             old_stem, new_stem = parsed
-            stem = MutatedStem(original_stem=old_stem, mutated_stem=new_stem)
-            results.append(stem)
-        return results
-
-    def get_transformations(self, current_text: str) -> list[MutatedStem]:
-        # Filter if for some reason we have duplicate transformations
-        # TODO do we still need this?
-        transformed = list(set(self.attack_func(current_text)))
-        post_processed: list[MutatedStem] = self.postprocess(current_text, transformed)
+            yield MutatedStem(original_stem=old_stem, mutated_stem=new_stem)
+
+    def iter_mutants(
+        self, program: ParsedProgram, max_mutants: int = None
+    ) -> Iterator[str]:
+        """
+        Mutants of `program`. With `max_mutants`, they come in the `stratified_order` for a
+        budget of that many, so the first ones are spread evenly over the program.
+        """
+        mutants = self.attack_func(program)
+        if max_mutants is not None:
+            mutants = stratified_order(mutants, max_mutants)
+        yield from mutants
+
+    def iter_transformations(
+        self, current_text: str, program: ParsedProgram = None, max_mutants: int = None
+    ) -> Iterator[MutatedStem]:
+        """
+        Lazily mutate `current_text` and parse the resulting stems, one mutant at a time.
+        Pass `program` to reuse an existing parse of `current_text` rather than having the
+        transformer parse it again. With `max_mutants`, stops after the stems of that many
+        distinct mutants.
+        """
+        program = program or ParsedProgram(current_text)
+        stems = self.iter_postprocess(
+            current_text, unique(self.iter_mutants(program, max_mutants))
+        )
+        yield from islice(stems, max_mutants)
+
+    def get_transformations(
+        self, current_text: str, program: ParsedProgram = None, max_mutants: int = None
+    ) -> list[MutatedStem]:
+        post_processed = list(
+            self.iter_transformations(current_text, program, max_mutants)
+        )
         logger.debug(
             f"{self.__class__.__name__} produced {len(post_processed)} transformations"
         )
         return post_processed
 
+    def collect_stems(
+        self, current_text: str, mutated: Iterable[str], max_mutants: int = None
+    ) -> list[MutatedStem]:
+        # `mutated` is only consumed until `max_mutants` distinct mutants gave stems
+        post_processed = list(
+            islice(self.iter_postprocess(current_text, unique(mutated)), max_mutants)
+        )
+        logger.debug(
+            f"{self.__class__.__name__} produced {len(post_processed)} transformations"
+        )
+        return post_processed
+
+
+def unique(mutated: Iterable[str]) -> Iterator[str]:
+    # Different nodes can produce the same mutant. Duplicates are dropped before a
+    # `max_mutants` budget is cut, so they never take the place of distinct mutants
+    seen = set()
+    for m in mutated:
+        if m not in seen:
+            seen.add(m)
+            yield m
+
 
 class OneByOneTransformer(RegisteredTransformation, ABC, abstract=True):
     @property
@@ -77,6 +137,68 @@ class OneByOneTransformer(RegisteredTransformation, ABC, abstract=True):
     def _visit_transform(self, source):
         return self.visitor(source).transform()
 
+    def iter_mutants(
+        self, program: ParsedProgram, max_mutants: int = None
+    ) -> Iterator[str]:
+        return self.visitor(program).iter_transform(max_mutants)
+
     @property
-    def attack_func(self) -> Callable[[str], list[str]]:
+    def attack_func(self) -> Callable[[str | ParsedProgram], list[str]]:
         return self._visit_transform
+
+
+def _fused_walk(
+    visitors: list[OneByOneVisitor], program: ParsedProgram
+) -> Iterator[tuple[int, ast.AST]]:
+    """
+    Walk `program` once, handing each node only to the visitors whose `node_types` match
+    it. Yields `(visitor index, node)` for every node the visitor can transform.
+    """
+    dispatch: dict[type, list[int]] = {}
+    for node in program.nodes:
+        node_type = type(node)
+        if node_type not in dispatch:
+            dispatch[node_type] = [
+                i
+                for i, visitor in enumerate(visitors)
+                if issubclass(node_type, visitor.node_types)
+            ]
+        for i in dispatch[node_type]:
+            if visitors[i].is_transformable(node):
+                yield i, node
+
+
+def fused_transform(
+    transformers: list[OneByOneTransformer], program: ParsedProgram
+) -> Iterator[tuple[OneByOneTransformer, str]]:
+    """
+    Walk `program` once for all `transformers`. Yields `(transformer, mutant)` pairs; each
+    transformer's mutants come out in the same order as from its own `iter_mutants`.
+    """
+    visitors = [transformer.visitor(program) for transformer in transformers]
+    for i, node in _fused_walk(visitors, program):
+        for mutant in visitors[i].iter_mutants([node]):
+            yield transformers[i], mutant
+
+
+def fused_candidates(
+    transformers: list[OneByOneTransformer],
+    program: ParsedProgram,
+    max_mutants: int = None,
+) -> Iterator[tuple[OneByOneTransformer, Iterator[str]]]:
+    """
+    Walk `program` once for all `transformers`, collecting the nodes each can transform.
+    Yields `(transformer, mutants)`, where `mutants` lazily renders the same mutants in
+    the same order as the transformer's own `iter_mutants(program, max_mutants)`, so a
+    budget only pays for the mutants it takes.
+    """
+    visitors = [transformer.visitor(program) for transformer in transformers]
+    candidates: list[list[ast.AST]] = [[] for _ in visitors]
+    for i, node in _fused_walk(visitors, program):
+        candidates[i].append(node)
+
+    for transformer, visitor, nodes in zip(transformers, visitors, candidates):
+        if max_mutants is None:
+            yield transformer, visitor.iter_mutants(nodes)
+        else:
+            yield transformer, visitor.iter_spread(stratified_order(nodes, max_mutants))
@@ -5,6 +5,8 @@ from mutations import OneByOneVisitor, OneByOneTransformer, CRT
 
 
 class IntegerReplacementVisitor(OneByOneVisitor):
+    node_types = (ast.Constant,)
+
     @property
     def magic_constant(self):
         return 5
@@ -2,21 +2,21 @@ import ast
 from abc import abstractmethod
 from typing import Callable, List, Tuple
 
-from asttokens import ASTTokens
 from asttokens.util import replace
 
 from mutations import CRT
 from mutations import RegisteredTransformation
-from shared.ast_utils import get_docstring_ranges, is_node_within_docstring
+from shared.ast_utils import ParsedProgram, is_node_within_docstring
 
 
 class IntegerConstantProcessor:
-    def __init__(self, source_code: str, func: Callable[[int], str]):
+    def __init__(self, source_code: str | ParsedProgram, func: Callable[[int], str]):
         self.func = func
-        self.source_code = source_code
-        self.atok = ASTTokens(source_code, parse=True)
-        self.tree = self.atok.tree
-        self.docstring_ranges = get_docstring_ranges(self.tree)
+        self.program = ParsedProgram.of(source_code)
+        self.source_code = self.program.code
+        self.atok = self.program.tokens
+        self.tree = self.program.tree
+        self.docstring_ranges = self.program.docstring_ranges
 
     def replace_constant(self, target_node: ast.Constant) -> Tuple[int, int, str]:
         new_value = self.func(target_node.value)
@@ -24,20 +24,13 @@ class IntegerConstantProcessor:
         return start, end, str(new_value)
 
     def find_and_replace_constants(self) -> List[str]:
-        nodes = []
-
-        def find_nodes(node: ast.AST):
-            if (
-                isinstance(node, ast.Constant)
-                and isinstance(node.value, int)
-                and not isinstance(node.value, bool)
-                and not is_node_within_docstring(node, self.docstring_ranges)
-            ):
-                nodes.append(node)
-            for child in ast.iter_child_nodes(node):
-                find_nodes(child)
-
-        find_nodes(self.tree)
+        nodes = [
+            node
+            for node in self.program.nodes_of_type(ast.Constant)
+            if isinstance(node.value, int)
+            and not isinstance(node.value, bool)
+            and not is_node_within_docstring(node, self.docstring_ranges)
+        ]
 
         modified_sources = []
         for node in nodes:
@@ -54,12 +47,12 @@ class BaseIntegerConstantTransformer(RegisteredTransformation, abstract=True):
     def func(self):
         pass
 
-    def transform(self, source):
+    def transform(self, source: str | ParsedProgram):
         transformer = IntegerConstantProcessor(source, self.func)
         return list(transformer.find_and_replace_constants())
 
     @property
-    def attack_func(self) -> Callable[[str], List[str]]:
+    def attack_func(self) -> Callable[[str | ParsedProgram], List[str]]:
         return self.transform
 
 
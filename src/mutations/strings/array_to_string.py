@@ -5,6 +5,8 @@ from mutations import OneByOneVisitor, OneByOneTransformer, CRT
 
 
 class EmptyArrayToStringVisitor(OneByOneVisitor):
+    node_types = (ast.Assign,)
+
     def transform_node(self, node) -> list[ast.AST] | ast.AST:
         node.value = ast.Constant(value="")
         return node
@@ -2,13 +2,11 @@ import ast
 from typing import Type
 
 from mutations import OneByOneVisitor, OneByOneTransformer, CRT
-from shared.ast_utils import get_docstring_ranges, is_node_within_docstring
+from shared.ast_utils import is_node_within_docstring
 
 
 class ConstantSplittingVisitor(OneByOneVisitor):
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.docstring_ranges = get_docstring_ranges(self.ast_tree)
+    node_types = (ast.Constant,)
 
     @property
     def split_index(self):
@@ -33,7 +31,7 @@ class ConstantSplittingVisitor(OneByOneVisitor):
             isinstance(node, ast.Constant)
             and isinstance(node.value, str)
             and len(node.value) > 3
-            and not is_node_within_docstring(node, self.docstring_ranges)
+            and not is_node_within_docstring(node, self.program.docstring_ranges)
         )
 
 
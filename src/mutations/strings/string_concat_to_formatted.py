@@ -5,6 +5,8 @@ from mutations import OneByOneVisitor, OneByOneTransformer, CRT
 
 
 class StringConcatToFStringVisitor(OneByOneVisitor):
+    node_types = (ast.BinOp,)
+
     def transform_node(self, node) -> list[ast.AST] | ast.AST:
         components = self.collect_components(node)
         fstring_node = self.create_fstring(components)
@@ -9,6 +9,7 @@ from mutations import (
 
 
 class StringConcatToJoinVisitor(OneByOneVisitor):
+    node_types = (ast.BinOp,)
 
     @property
     def name(self):
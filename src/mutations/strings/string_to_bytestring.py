@@ -5,6 +5,8 @@ from mutations import OneByOneVisitor, OneByOneTransformer, CRT
 
 
 class StringToBytestringVisitor(OneByOneVisitor):
+    node_types = (ast.Assign,)
+
     def transform_node(self, node) -> list[ast.AST] | ast.AST:
         # Encode the constant as a bytestring
         node.value.value = node.value.value.encode()
@@ -1,28 +1,43 @@
 import ast
 import copy
-import uuid
 from abc import abstractmethod, ABC
+from itertools import zip_longest
+from typing import Iterator
 
-from asttokens import ASTTokens
-
-from shared.ast_utils import dfs_walk, NodeReplacer, StatementGroupExpander
+from shared.ast_utils import (
+    NodeReplacer,
+    ParsedProgram,
+    StatementGroupExpander,
+    unparse_in_context,
+    unparse_indented,
+)
+from shared.program_utils import IDENT, stratified_order
 
 
 class OneByOneVisitor(ABC):
-    def __init__(self, code: str):
-        self.code = code
-        self.ast_tokens = ASTTokens(self.code, parse=True)
-        self.ast_tree = self.ast_tokens.tree
-        self.transformations: list[ast.AST] = []
-        self.source_code = code
-
-        self._add_node_metadata(self.ast_tree)
+    # Only nodes of these types are passed to `is_transformable`
+    node_types: tuple[type, ...] = (ast.AST,)
 
-    def _add_node_metadata(self, node: ast.AST):
-        node.uuid = uuid.uuid4().hex
-        for child in ast.iter_child_nodes(node):
-            child.parent = node
-            self._add_node_metadata(child)
+    def __init__(
+        self,
+        code: str | ParsedProgram,
+        structural_sharing: bool = True,
+        splice: bool = True,
+    ):
+        self.program = ParsedProgram.of(code)
+        self.code = self.program.code
+        self.ast_tokens = self.program.tokens
+        self.ast_tree = self.program.tree
+        self.transformations: list[ast.AST] = []
+        self.source_code = self.code
+        # When set, each mutant only copies the ancestors of the replaced node and shares
+        # every untouched subtree with `ast_tree` instead of deep-copying the whole tree
+        self.structural_sharing = structural_sharing
+        # When set (and the source is already `ast.unparse` normalized), mutants are rendered by
+        # unparsing only the replaced subtree and splicing it into the source at its token range
+        self.splice = splice and structural_sharing
+        # (original node, replacement) pairs, parallel to `transformations`
+        self.replacements: list[tuple[ast.AST, ast.AST]] = []
 
     @property
     def name(self):
@@ -37,12 +52,219 @@ class OneByOneVisitor(ABC):
         pass
 
     def transform(self) -> list[str]:
-        for i, node in enumerate(dfs_walk(self.ast_tree)):
-            if self.is_transformable(node):
-                self.apply_transformations(node)
-        return [ast.unparse(tree) for tree in self.transformations]
+        results = []
+        for node in self.program.nodes_of_type(*self.node_types):
+            results.extend(self.visit_node(node))
+        return results
+
+    def transformable_nodes(self) -> list[ast.AST]:
+        return [
+            node
+            for node in self.program.nodes_of_type(*self.node_types)
+            if self.is_transformable(node)
+        ]
+
+    def iter_transform(self, max_mutants: int = None) -> Iterator[str]:
+        """
+        Lazily yield the mutants of `transform`, without keeping perturbed trees around.
+
+        With `max_mutants`, mutants come in the order a budget of that many should take
+        them: nodes in the `stratified_order` over the program, and each node's first
+        mutant before any node's second. Nothing is cut off here, since mutants can still
+        be dropped as duplicates or in postprocessing; callers stop once they have enough.
+        """
+        nodes = self.transformable_nodes()
+        if max_mutants is None:
+            return self.iter_mutants(nodes)
+        return self.iter_spread(stratified_order(nodes, max_mutants))
+
+    def iter_mutants(self, nodes: list[ast.AST]) -> Iterator[str]:
+        # `nodes` must already be transformable
+        for node in nodes:
+            start = len(self.transformations)
+            self.apply_transformations(node)
+            try:
+                for i in range(start, len(self.transformations)):
+                    yield self.render(i)
+            finally:
+                # Rendered mutants no longer need their trees
+                del self.transformations[start:]
+                del self.replacements[start:]
+
+    def iter_spread(self, nodes: list[ast.AST]) -> Iterator[str]:
+        """
+        The mutants of `nodes` in rounds: the first mutant of every node, then the second
+        of every node with more than one, and so on.
+        """
+        rounds = []
+        for node in nodes:
+            mutants = list(self.iter_mutants([node]))
+            if mutants:
+                yield mutants[0]
+                rounds.append(mutants[1:])
+        for later in zip_longest(*rounds):
+            yield from (mutant for mutant in later if mutant is not None)
+
+    def visit_node(self, node) -> list[str]:
+        """
+        Render the mutants produced by replacing `node`, or none if it isn't transformable.
+        """
+        if not self.is_transformable(node):
+            return []
+
+        start = len(self.transformations)
+        self.apply_transformations(node)
+        return [self.render(i) for i in range(start, len(self.transformations))]
+
+    def render(self, index: int) -> str:
+        tree = self.transformations[index]
+        if self.splice and self.is_normalized():
+            spliced = self.splice_replacement(*self.replacements[index])
+            if spliced is not None:
+                return spliced
+        return ast.unparse(tree)
+
+    def is_normalized(self) -> bool:
+        # Splicing only reproduces `ast.unparse` output if the untouched code is already in that form
+        return self.program.is_normalized
+
+    def _is_elif(self, node) -> bool:
+        parent = getattr(node, "parent", None)
+        return (
+            isinstance(node, ast.If)
+            and isinstance(parent, ast.If)
+            and parent.orelse == [node]
+            and self.ast_tokens.get_text(node, padded=False).startswith("elif")
+        )
+
+    def splice_replacement(self, node, perturbed) -> str | None:
+        """
+        Render a mutant by unparsing only the changed code and splicing it into the source.
+
+        Expressions are widened to the outermost expression of their statement, since a parent
+        expression's rendering can depend on its children. Returns None if the replacement
+        can't be spliced, in which case the caller should unparse the whole tree.
+        """
+        if isinstance(perturbed, ast.Module) and not isinstance(node, ast.stmt):
+            # Statement groups only render sensibly in place of a statement
+            return None
+
+        anchor, new_anchor = node, perturbed
+        while not isinstance(anchor, ast.stmt):
+            parent = getattr(anchor, "parent", None)
+            if parent is None:
+                return None
+            if isinstance(parent, ast.stmt):
+                break
+            new_anchor = self._replace_child(parent, anchor, new_anchor)
+            anchor = parent
+
+        start, end = self.ast_tokens.get_text_range(anchor, padded=False)
+        if start == end:
+            return None
+
+        if isinstance(anchor, ast.stmt):
+            indent, remainder = divmod(anchor.col_offset, len(IDENT))
+            if remainder:
+                return None
+
+            prefix = ""
+            if self._is_elif(anchor):
+                if not isinstance(new_anchor, ast.If):
+                    return None
+                prefix = "el"
+            original = prefix + unparse_indented(anchor, indent)
+            replacement = prefix + unparse_indented(new_anchor, indent)
+        else:
+            original = unparse_in_context(anchor.parent, anchor)
+            replacement = unparse_in_context(
+                self._replace_child(anchor.parent, anchor, new_anchor), new_anchor
+            )
+            if original is None or replacement is None:
+                return None
+
+        # Token ranges exclude parentheses required by the context, which the rendering includes
+        if self.code[start:end] != original:
+            if (
+                self.code[start - 1 : end + 1] != original
+                or original[0] != "("
+                or original[-1] != ")"
+            ):
+                return None
+            start, end = start - 1, end + 1
+
+        return self.code[:start] + replacement + self.code[end:]
 
     def apply_transformations(self, node):
+        if self.structural_sharing:
+            self._apply_path_copy(node)
+        else:
+            self._apply_deep_copy(node)
+
+    @classmethod
+    def _copy_subtree(cls, node):
+        # Copy along AST fields only. `copy.deepcopy` would follow `parent` links (including the
+        # ones set on shared `ast.Load`/`ast.Store` singletons) and drag the entire tree along.
+        if isinstance(node, list):
+            return [cls._copy_subtree(item) for item in node]
+        if not isinstance(node, ast.AST):
+            return node
+
+        new_node = copy.copy(node)
+        for field, value in ast.iter_fields(node):
+            if isinstance(value, (ast.AST, list)):
+                setattr(new_node, field, cls._copy_subtree(value))
+        for child in ast.iter_child_nodes(new_node):
+            if not isinstance(child, ast.expr_context):
+                child.parent = new_node
+        return new_node
+
+    @staticmethod
+    def _replace_child(parent: ast.AST, child: ast.AST, new_child: ast.AST) -> ast.AST:
+        # Shallow copy of `parent` with `child` swapped for `new_child`
+        new_parent = copy.copy(parent)
+        for field, value in ast.iter_fields(parent):
+            if value is child:
+                setattr(new_parent, field, new_child)
+            elif isinstance(value, list) and any(item is child for item in value):
+                setattr(
+                    new_parent,
+                    field,
+                    [new_child if item is child else item for item in value],
+                )
+        return new_parent
+
+    @classmethod
+    def _copy_path(cls, node: ast.AST, replacement: ast.AST) -> ast.AST:
+        """
+        Rebuild the root-to-node path with `node` swapped for `replacement`.
+
+        Only the ancestors of `node` are shallow-copied; all sibling subtrees are shared
+        with the original tree, so they must be treated as read-only.
+        """
+        child, new_child = node, replacement
+        while hasattr(child, "parent"):
+            new_child = cls._replace_child(child.parent, child, new_child)
+            child = child.parent
+        return new_child
+
+    def _apply_path_copy(self, node):
+        # Detach the copy so nothing reachable from it leads back into the shared tree
+        node_copy = self._copy_subtree(node)
+        node_copy.__dict__.pop("parent", None)
+        perturbed_nodes: list[ast.AST] | ast.AST = self.transform_node(node_copy)
+        if not isinstance(perturbed_nodes, list):
+            perturbed_nodes = [perturbed_nodes]
+
+        for perturbed in perturbed_nodes:
+            ast.copy_location(perturbed, node)
+            # Basic blocks can only be introduced by the replacement itself
+            perturbed = StatementGroupExpander().visit(perturbed)
+            perturbed = ast.fix_missing_locations(perturbed)
+            self.replacements.append((node, perturbed))
+            self.transformations.append(self._copy_path(node, perturbed))
+
+    def _apply_deep_copy(self, node):
         # Transform a copy of the node to avoid modifying the original tree
         # It is possible for a single node transformation to return multiple perturbations
         perturbed_nodes: list[ast.AST] | ast.AST = self.transform_node(
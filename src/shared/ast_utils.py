@@ -1,9 +1,14 @@
 import ast
+import heapq
+import uuid
+from collections import defaultdict
+from functools import cached_property
 from typing import List, Tuple
 
+from asttokens import ASTTokens
 from loguru import logger
 
-import ast
+from shared.program_utils import IDENT
 
 
 def get_docstring_ranges(tree: ast.AST) -> List[Tuple[int, int]]:
@@ -114,12 +119,105 @@ class StatementGroupExpander(ast.NodeTransformer):
         return module
 
 
+class PrecedenceProbe(ast._Unparser):
+    """
+    Walks the header of `root` just far enough to learn the operator precedence
+    `ast.unparse` assigns to `target`, without rendering any nested statements.
+    """
+
+    def __init__(self, root: ast.AST, target: ast.AST):
+        super().__init__()
+        self.root = root
+        self.target = target
+        self.precedence = None
+
+    def traverse(self, node):
+        if node is self.target:
+            self.precedence = self.get_precedence(node)
+        elif isinstance(node, ast.stmt) and node is not self.root:
+            return
+        else:
+            super().traverse(node)
+
+
+def unparse_in_context(parent: ast.AST, node: ast.AST) -> str | None:
+    """
+    Unparse `node` exactly as `ast.unparse(parent)` would render it, including any
+    parentheses its position requires. Returns None if `node` is not reachable from `parent`.
+    """
+    probe = PrecedenceProbe(parent, node)
+    probe.visit(parent)
+    if probe.precedence is None:
+        return None
+
+    unparser = ast._Unparser()
+    unparser.set_precedence(probe.precedence, node)
+    return unparser.visit(node)
+
+
+def unparse_indented(node: ast.AST, indent: int) -> str:
+    """
+    Unparse a statement (or a Module of statements) as if it was nested `indent` levels deep.
+    The indentation of the first line is not included.
+    """
+    unparser = ast._Unparser()
+    unparser._indent = indent
+    return unparser.visit(node)[len(IDENT) * indent :]
+
+
 def dfs_walk(node):
     yield node
     for child in ast.iter_child_nodes(node):
         yield from dfs_walk(child)
 
 
+class ParsedProgram:
+    """
+    Everything derived from parsing a source program once, shared by all transformers that
+    mutate it. The tree is read-only: transformers must only ever modify copies of its nodes.
+    """
+
+    def __init__(self, code: str):
+        self.code = code
+        self.tokens = ASTTokens(code, parse=True)
+        self.tree = self.tokens.tree
+        # Every node in `dfs_walk` order, and their positions in it by node type
+        self.nodes: list[ast.AST] = []
+        self.node_index: dict[type, list[int]] = defaultdict(list)
+
+        for node in dfs_walk(self.tree):
+            self.node_index[type(node)].append(len(self.nodes))
+            self.nodes.append(node)
+            node.uuid = uuid.uuid4().hex
+            for child in ast.iter_child_nodes(node):
+                # `Load`/`Store`/`Del` are shared singletons, so they have no single parent
+                if not isinstance(child, ast.expr_context):
+                    child.parent = node
+
+    @classmethod
+    def of(cls, source: "str | ParsedProgram") -> "ParsedProgram":
+        return source if isinstance(source, ParsedProgram) else cls(source)
+
+    @cached_property
+    def docstring_ranges(self) -> List[Tuple[int, int]]:
+        return get_docstring_ranges(self.tree)
+
+    @cached_property
+    def is_normalized(self) -> bool:
+        return ast.unparse(self.tree) == self.code
+
+    def nodes_of_type(self, *node_types: type) -> list[ast.AST]:
+        """
+        Nodes that are instances of any of `node_types`, in `dfs_walk` order.
+        """
+        positions = [
+            self.node_index[indexed]
+            for indexed in self.node_index
+            if issubclass(indexed, node_types)
+        ]
+        return [self.nodes[i] for i in heapq.merge(*positions)]
+
+
 def has_elif_block(node: ast.If):
     if isinstance(node, ast.If):
         for child in node.orelse:
@@ -0,0 +1,47 @@
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from typing import Any, Callable, Iterable, Iterator
+
+
+def bounded_submit(
+    submit: Callable[..., Future],
+    tasks: Iterable[tuple[Any, dict[str, Any]]],
+    max_in_flight: int,
+    requeue: deque = None,
+) -> Iterator[tuple[Any, Future]]:
+    """
+    Call `submit(**kwargs)` for each `(meta, kwargs)` in `tasks`, keeping at most
+    `max_in_flight` futures pending, and yield `(meta, future)` as each one completes.
+
+    A new task is submitted as soon as any pending one finishes, so slow tasks never hold
+    back the rest of the pool. Tasks are only pulled from `tasks` when there is room, so a
+    lazy iterable keeps memory bounded by `max_in_flight`.
+
+    Tasks appended to `requeue` while iterating, e.g. to retry a failed one, are
+    submitted ahead of the rest of `tasks`, even once `tasks` is exhausted.
+    """
+    tasks = iter(tasks)
+    requeue = deque() if requeue is None else requeue
+    pending: dict[Future, Any] = {}
+    exhausted = False
+
+    while True:
+        while len(pending) < max_in_flight:
+            if requeue:
+                task = requeue.popleft()
+            elif not exhausted:
+                task = next(tasks, None)
+                if task is None:
+                    exhausted = True
+                    continue
+            else:
+                break
+            meta, kwargs = task
+            pending[submit(**kwargs)] = meta
+
+        if not pending:
+            return
+
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            yield pending.pop(future), future
@@ -1,4 +1,5 @@
 import ast
+import bisect
 import copy
 import io
 import textwrap
@@ -197,7 +198,7 @@ def remove_comments_and_docstrings(source, remove_docstrings=False):
     while preserving indentation and spacing correctly.
     """
     io_obj = io.StringIO(source)
-    out = ""
+    out = []
     prev_toktype = tokenize.INDENT
     last_lineno = -1
     last_col = 0
@@ -207,15 +208,15 @@ def remove_comments_and_docstrings(source, remove_docstrings=False):
         start_line, start_col = start
         end_line, end_col = end
         if start_line > last_lineno:
-            out += "\n" * (start_line - last_lineno)
+            out.append("\n" * (start_line - last_lineno))
             last_col = 0
         if start_col > last_col:
-            out += " " * (start_col - last_col)
+            out.append(" " * (start_col - last_col))
 
         # We don't want to remove these comments because they are placed as part of mutations
         if token_type == tokenize.COMMENT:
             if token_string.startswith(MUTATED_COMMENT_PREFIX):
-                out += token_string
+                out.append(token_string)
         elif (
             token_type == tokenize.STRING
             and remove_docstrings
@@ -223,12 +224,14 @@ def remove_comments_and_docstrings(source, remove_docstrings=False):
         ):
             pass
         else:
-            out += token_string
+            out.append(token_string)
         prev_toktype = token_type
         last_col = end_col
         last_lineno = end_line
 
-    cleaned_lines = [line.rstrip() for line in out.splitlines() if line.strip()]
+    cleaned_lines = [
+        line.rstrip() for line in "".join(out).splitlines() if line.strip()
+    ]
     if cleaned_lines:
         base_indentation = len(cleaned_lines[0]) - len(cleaned_lines[0].lstrip())
         cleaned_lines = [
@@ -238,6 +241,157 @@ def remove_comments_and_docstrings(source, remove_docstrings=False):
     return "\n".join(cleaned_lines)
 
 
+def normalize_direct_completion(code: str) -> str | None:
+    """
+    Truncate, re-indent and strip comments from a direct completion in a single tokenize
+    pass, the way `truncate_code_to_last_function`, `fix_odd_indents`,
+    `autopep8_normalize_ident` and `remove_comments_and_docstrings` do one after another:
+
+    - everything from the first statement at column 0 after the last `def` is dropped,
+    - every statement is indented by four spaces per block, counted from the first one,
+    - comments are removed, except those placed by mutations, and so are blank lines.
+
+    Returns None if `code` does not tokenize or the result does not parse, since only
+    the slower pipeline can repair such code.
+    """
+    try:
+        tokens = list(tokenize.generate_tokens(io.StringIO(code).readline))
+    except (SyntaxError, tokenize.TokenError):
+        # SyntaxError includes the IndentationError of dedents to an unknown level
+        return None
+
+    # Offsets of the lines `tokenize` read, to copy tokens verbatim from `code`
+    line_offsets = [0]
+    for line in code.split("\n"):
+        line_offsets.append(line_offsets[-1] + len(line) + 1)
+
+    def source_of(start: tuple[int, int], end: tuple[int, int]) -> str:
+        return code[
+            line_offsets[start[0] - 1] + start[1] : line_offsets[end[0] - 1] + end[1]
+        ]
+
+    out = []
+    # Columns the enclosing blocks are indented to
+    indents = [0]
+    base_depth = None
+    brackets = 0
+    line_start = True
+    last_col = 0
+    seen_def = False
+    cut = None
+
+    for i, (token_type, token_string, start, end, _) in enumerate(tokens):
+        if token_type == tokenize.INDENT:
+            indents.append(end[1])
+            continue
+        if token_type == tokenize.DEDENT:
+            indents.pop()
+            continue
+        if token_type == tokenize.ENDMARKER:
+            break
+        if token_type in (tokenize.NEWLINE, tokenize.NL):
+            out.append("\n")
+            line_start = line_start or token_type == tokenize.NEWLINE or brackets == 0
+            last_col = 0
+            continue
+        if token_type == tokenize.COMMENT and not token_string.startswith(
+            MUTATED_COMMENT_PREFIX
+        ):
+            continue
+
+        if line_start and token_type != tokenize.COMMENT:
+            depth = len(indents) - 1
+            if base_depth is None:
+                base_depth = depth
+            if start[1] == 0 and seen_def and cut is None:
+                cut = len(out)
+            if (
+                token_string == "def"
+                and token_type == tokenize.NAME
+                and tokens[i + 1].type == tokenize.NAME
+                and tokens[i + 2].string == "("
+            ):
+                seen_def = True
+                cut = None
+            out.append(IDENT * max(depth - base_depth, 0))
+            line_start = False
+        elif line_start:
+            # A comment on a line of its own, which comes before the dedents after it
+            depth = bisect.bisect_right(indents, start[1]) - 1
+            out.append(IDENT * max(depth - (base_depth or 0), 0))
+        else:
+            # Continuation lines keep their original column
+            out.append(" " * (start[1] - last_col))
+
+        if token_type == tokenize.OP and token_string in ("(", "[", "{"):
+            brackets += 1
+        elif token_type == tokenize.OP and token_string in (")", "]", "}"):
+            brackets -= 1
+        out.append(source_of(start, end))
+        last_col = end[1]
+
+    if cut is not None:
+        out = out[:cut]
+    normalized = "\n".join(
+        line.rstrip() for line in "".join(out).splitlines() if line.strip()
+    )
+    try:
+        ast.parse(normalized)
+    except SyntaxError:
+        return None
+    return normalized
+
+
+def logical_lines(code: str) -> list[tuple[str, str]]:
+    """
+    Split `code` into its logical lines, leaving out blank lines. Each comes with its
+    kind: "comment" for a line with only a comment, "wrapped" for a statement
+    continued inside brackets, "block" for one that opens a block and "line" otherwise.
+    Strings spanning several lines stay within their statement.
+    """
+    physical_lines = code.split("\n")
+    lines = []
+    first_line = None
+    brackets = 0
+    wrapped = False
+    last_token = None
+
+    for token in tokenize.generate_tokens(io.StringIO(code).readline):
+        if token.type in (tokenize.INDENT, tokenize.DEDENT, tokenize.ENDMARKER):
+            continue
+        if first_line is None:
+            if token.type == tokenize.NL:
+                continue
+            first_line = token.start[0]
+            last_token = None
+
+        if token.type == tokenize.OP and token.string in ("(", "[", "{"):
+            brackets += 1
+        elif token.type == tokenize.OP and token.string in (")", "]", "}"):
+            brackets -= 1
+        elif token.type == tokenize.NL and brackets > 0:
+            wrapped = True
+            continue
+
+        if token.type in (tokenize.NEWLINE, tokenize.NL):
+            if last_token is None:
+                kind = "comment"
+            elif wrapped:
+                kind = "wrapped"
+            elif last_token.type == tokenize.OP and last_token.string == ":":
+                kind = "block"
+            else:
+                kind = "line"
+            lines.append(
+                ("\n".join(physical_lines[first_line - 1 : token.end[0]]), kind)
+            )
+            first_line = None
+            wrapped = False
+        elif token.type != tokenize.COMMENT:
+            last_token = token
+    return lines
+
+
 def parse_stem(old_code: str, new_code: str, extra_skips: int = 0):
     old_lines = old_code.splitlines()
     new_lines = new_code.splitlines()
@@ -292,3 +446,29 @@ def parse_stem(old_code: str, new_code: str, extra_skips: int = 0):
     new_func_split = "\n".join(new_lines[:new_index])
     old_func_split = "\n".join(old_lines[:old_index])
     return old_func_split, new_func_split
+
+
+def stratified_sample(items: list, k: int) -> list:
+    """
+    Deterministically pick `k` items spread evenly over `items`, keeping their order.
+    `items` is split into `k` equal strata and the middle item of each is picked.
+    """
+    n = len(items)
+    if k >= n:
+        return list(items)
+    return [items[(2 * i + 1) * n // (2 * k)] for i in range(max(k, 0))]
+
+
+def stratified_order(items: list, k: int) -> list:
+    """
+    Order `items` for a budget of `k`: the `stratified_sample` of `k` items comes first,
+    then the `stratified_sample` of what is left, and so on until every item is placed.
+    """
+    remaining = list(items)
+    order = []
+    while len(remaining) > k > 0:
+        n = len(remaining)
+        picked = {(2 * i + 1) * n // (2 * k) for i in range(k)}
+        order.extend(remaining[i] for i in sorted(picked))
+        remaining = [item for i, item in enumerate(remaining) if i not in picked]
+    return order + remaining
@@ -1,3 +1,5 @@
+import copy
+import hashlib
 from dataclasses import dataclass, field
 from typing import Any
 
@@ -40,8 +42,14 @@ class SolutionType:
     BAD_SYNTAX = "bad_syntax"
     BAD_PROCESS = "bad_post_process"
     ERROR = "error"
+    # Ran into a time limit, which depends on the load of the machine
+    TIMEOUT = "timeout"
 
-    ALL_TYPES = (PASSED, FAILED, BAD_SYNTAX, BAD_PROCESS, ERROR)
+    ALL_TYPES = (PASSED, FAILED, BAD_SYNTAX, BAD_PROCESS, ERROR, TIMEOUT)
+
+
+# Example texts kept per solution type and side, their counts and hashes stay exact
+MAX_EXAMPLES = 10
 
 
 def create_examples():
@@ -51,6 +59,18 @@ def create_examples():
     return examples
 
 
+def create_example_counts():
+    return {key: {"original": 0, "mutated": 0} for key in SolutionType.ALL_TYPES}
+
+
+def create_example_hashes():
+    return {key: {"original": {}, "mutated": {}} for key in SolutionType.ALL_TYPES}
+
+
+def example_hash(example: str) -> str:
+    return hashlib.sha1(example.encode()).hexdigest()[:12]
+
+
 @dataclass
 class BenchmarkResult:
     problem_id: str
@@ -60,14 +80,43 @@ class BenchmarkResult:
     temp: float
     original_prefix: str = None
     mutated_prefix: str = None
+    # Ident of the result with the same stems whose completions and evaluation this shares
+    stem_source: str = None
+    # Ident of the result with the same original stem whose original completions this shares
+    original_source: str = None
     pass_at_original: dict[int, Any] = field(default_factory=dict)
     pass_at_mutated: dict[int, Any] = field(default_factory=dict)
     pass_at_ratio: dict[str, float] = field(default_factory=dict)
     pass_at_diff: dict[str, float] = field(default_factory=dict)
-    average_levenshtein: float = None
+    # Average Levenshtein distance of the passed original and mutated `examples`, an
+    # estimate of the one over every passed solution that results used to report
+    sampled_average_levenshtein: float = None
+    # The distinct texts with the `MAX_EXAMPLES` smallest hashes per solution type and
+    # side, the same whatever order the solutions arrive in
     examples: dict[str, dict[str, list[str]]] = field(
         default_factory=create_examples, repr=False
     )
+    # Number of solutions per solution type and side
+    example_counts: dict[str, dict[str, int]] = field(
+        default_factory=create_example_counts, repr=False
+    )
+    # Multiplicity of each distinct solution per solution type and side, by content hash
+    example_hashes: dict[str, dict[str, dict[str, int]]] = field(
+        default_factory=create_example_hashes, repr=False
+    )
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        # Results pickled before examples were sampled kept every text
+        if "example_counts" not in state:
+            examples = self.examples
+            self.examples = create_examples()
+            self.example_counts = create_example_counts()
+            self.example_hashes = create_example_hashes()
+            for solution_type, sides in examples.items():
+                for sol_class, texts in sides.items():
+                    for text in texts:
+                        self.add_example(text, solution_type, sol_class == "mutated")
 
     def add_stem(self, stem: MutatedStem):
         self.original_prefix = stem.original_stem
@@ -79,14 +128,49 @@ class BenchmarkResult:
         self.pass_at_original = pass_at_original
         self.pass_at_mutated = pass_at_mutated
 
+    def share_outcomes(self, source: "BenchmarkResult"):
+        self.pass_at_original = dict(source.pass_at_original)
+        self.pass_at_mutated = dict(source.pass_at_mutated)
+        self.pass_at_ratio = dict(source.pass_at_ratio)
+        self.pass_at_diff = dict(source.pass_at_diff)
+        self.sampled_average_levenshtein = source.sampled_average_levenshtein
+        self.examples = copy.deepcopy(source.examples)
+        self.example_counts = copy.deepcopy(source.example_counts)
+        self.example_hashes = copy.deepcopy(source.example_hashes)
+
+    def share_original(self, source: "BenchmarkResult"):
+        self.pass_at_original = dict(source.pass_at_original)
+        for solution_type in self.examples:
+            self.examples[solution_type]["original"] = list(
+                source.examples[solution_type]["original"]
+            )
+            self.example_counts[solution_type]["original"] = source.example_counts[
+                solution_type
+            ]["original"]
+            self.example_hashes[solution_type]["original"] = dict(
+                source.example_hashes[solution_type]["original"]
+            )
+
     def add_example(self, example, solution_type, mutated):
         sol_class = "mutated" if mutated else "original"
-        self.examples[solution_type][sol_class].append(example)
+        count = self.example_counts[solution_type][sol_class] + 1
+        self.example_counts[solution_type][sol_class] = count
+        hashes = self.example_hashes[solution_type][sol_class]
+        key = example_hash(example)
+        hashes[key] = hashes.get(key, 0) + 1
+
+        if hashes[key] > 1:
+            # Already kept or already passed over
+            return
+        examples = self.examples[solution_type][sol_class]
+        examples.append(example)
+        examples.sort(key=example_hash)
+        del examples[MAX_EXAMPLES:]
 
     def compute_metrics(self):
         from shared.metrics import average_levenshtein_distance
 
-        average_levenshtein = average_levenshtein_distance(
+        # Over the sampled examples, which bounds the pairwise distances computed
+        self.sampled_average_levenshtein = average_levenshtein_distance(
             self.examples["passed"]["original"], self.examples["passed"]["mutated"]
         )
-        self.average_levenshtein = average_levenshtein
@@ -0,0 +1,139 @@
+import os
+import sqlite3
+from collections import Counter
+
+from cachetools import LRUCache
+from loguru import logger
+
+
+class TieredCache:
+    """
+    An in-memory LRU tier in front of an optional SQLite tier at `path` that persists
+    entries across runs. Entries map a tuple of `key_columns` to a tuple of
+    `value_columns`, both the `{name: SQLite type}` of columns of `table`.
+
+    The disk tier is only an optimization: if SQLite fails, the error is logged and
+    the cache carries on with its memory tier alone.
+    """
+
+    name = "Cache"
+    table: str
+    key_columns: dict[str, str]
+    value_columns: dict[str, str]
+
+    def __init__(self, path: str = None, max_size: int = 100_000, commit_every=1000):
+        self.memory = LRUCache(maxsize=max_size)
+        self.path = path
+        self.commit_every = commit_every
+        self.uncommitted = 0
+        self.stats = Counter()
+
+        self.db = None
+        if path is not None:
+            try:
+                os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+                self.db = sqlite3.connect(path)
+                self.create_table()
+            except (OSError, sqlite3.Error) as e:
+                self.disk_failed(e)
+
+    def create_table(self):
+        columns = ", ".join(
+            f"{name} {kind}"
+            for name, kind in (self.key_columns | self.value_columns).items()
+        )
+        self.db.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.table} ({columns}, "
+            f"PRIMARY KEY ({', '.join(self.key_columns)}))"
+        )
+
+    def disk_failed(self, error: Exception):
+        logger.warning(
+            "{} at {} failed ({!r}), keeping entries in memory only",
+            self.name,
+            self.path,
+            error,
+        )
+        if self.db is not None:
+            try:
+                self.db.close()
+            except sqlite3.Error:
+                pass
+        self.db = None
+
+    def get(self, key: tuple) -> tuple | None:
+        if key in self.memory:
+            self.stats["memory_hits"] += 1
+            return self.memory[key]
+
+        if self.db is not None:
+            where = " AND ".join(f"{column} = ?" for column in self.key_columns)
+            try:
+                row = self.db.execute(
+                    f"SELECT {', '.join(self.value_columns)} FROM {self.table} "
+                    f"WHERE {where}",
+                    key,
+                ).fetchone()
+            except sqlite3.Error as e:
+                self.disk_failed(e)
+                row = None
+            if row is not None:
+                self.stats["disk_hits"] += 1
+                self.memory[key] = row
+                return row
+
+        self.stats["misses"] += 1
+        return None
+
+    def put(self, key: tuple, value: tuple):
+        self.memory[key] = value
+        if self.db is None:
+            return
+
+        placeholders = ", ".join("?" * (len(key) + len(value)))
+        try:
+            self.db.execute(
+                f"INSERT OR REPLACE INTO {self.table} VALUES ({placeholders})",
+                (*key, *value),
+            )
+            self.uncommitted += 1
+            if self.uncommitted >= self.commit_every:
+                self.flush()
+        except sqlite3.Error as e:
+            self.disk_failed(e)
+
+    @property
+    def hits(self) -> int:
+        return self.stats["memory_hits"] + self.stats["disk_hits"]
+
+    @property
+    def misses(self) -> int:
+        return self.stats["misses"]
+
+    def flush(self):
+        if self.db is not None and self.uncommitted:
+            try:
+                self.db.commit()
+            except sqlite3.Error as e:
+                self.disk_failed(e)
+            self.uncommitted = 0
+
+    def report(self, label: str):
+        lookups = self.hits + self.misses
+        logger.info(
+            "{} for {}: {} of {} lookups hit ({:.1%}, {} in memory, {} on disk)",
+            self.name,
+            label,
+            self.hits,
+            lookups,
+            self.hits / lookups if lookups else 0.0,
+            self.stats["memory_hits"],
+            self.stats["disk_hits"],
+        )
+        self.stats.clear()
+
+    def close(self):
+        self.flush()
+        if self.db is not None:
+            self.db.close()
+            self.db = None
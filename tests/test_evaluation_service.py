@@ -0,0 +1,278 @@
+import pickle
+
+import pytest
+
+pytest.importorskip("evalplus")
+
+from inference import evaluation_service
+from inference.evaluation_service import (
+    MAX_WORKER_CONTEXTS,
+    EvaluationService,
+    check_solutions,
+    context_path,
+    load_context,
+)
+from shared.structs import SolutionType
+
+PROBLEM = {
+    "task_id": "Mbpp/2",
+    "entry_point": "f",
+    "atol": 0,
+    "base_input": [[1], [2]],
+    "plus_input": [[3]],
+}
+EXPECTED = {
+    "base": [2, 3],
+    "base_time": [0.001, 0.001],
+    "plus": [4],
+    "plus_time": [0.001],
+}
+LIMITS = dict(dataset="mbpp", min_time_limit=0.5, gt_time_limit_factor=2.0)
+
+
+@pytest.fixture
+def context(tmp_path):
+    with open(context_path(str(tmp_path), "Mbpp/2"), "wb") as f:
+        pickle.dump((PROBLEM, EXPECTED), f)
+    evaluation_service.init_worker(str(tmp_path))
+    yield
+    evaluation_service._problem_contexts.clear()
+
+
+def verdicts(solutions, **kwargs):
+    outcomes = check_solutions("Mbpp/2", solutions, **dict(LIMITS, **kwargs))
+    return [verdict for verdict, _, _ in outcomes]
+
+
+def test_full_mode_reports_timeouts(context):
+    solutions = [
+        "def f(x):\n    return x + 1\n",
+        "def f(x):\n    return 0\n",
+        "def f(x):\n    while True:\n        pass\n",
+    ]
+    assert verdicts(solutions, base_only=True) == [
+        SolutionType.PASSED,
+        SolutionType.FAILED,
+        SolutionType.TIMEOUT,
+    ]
+
+
+@pytest.mark.parametrize("fail_fast", [False, True])
+def test_slow_wrong_answer_is_not_a_timeout(context, fail_fast):
+    # Every input takes longer than its ground truth but stays within its limit, and
+    # together they take longer than any one limit
+    solution = (
+        "import time\n\n"
+        "def f(x):\n"
+        "    time.sleep(0.3)\n"
+        "    return x + 1 if x < 2 else 0\n"
+    )
+    order = {"base": [0, 1], "plus": [0]}
+    outcomes = verdicts(
+        [solution], base_only=False, fail_fast=fail_fast, input_order=order
+    )
+    assert outcomes == [SolutionType.FAILED]
+
+
+class StubEvaluation:
+    problem_id = "Mbpp/2"
+
+    def check_kwargs(self):
+        return dict(LIMITS, problem_id=self.problem_id, base_only=True)
+
+
+def test_chunk_size_follows_observed_runtime():
+    service = EvaluationService(max_workers=1, max_chunk_size=8, target_chunk_time=0.5)
+    # Nothing observed yet, every solution may be slow
+    assert service.chunk_size() == 1
+
+    service.observe([(SolutionType.PASSED, 0.1, None)])
+    assert service.chunk_size() == 5
+    service.observe([(SolutionType.PASSED, 0.001, None)] * 50)
+    assert service.chunk_size() == 8
+    # A slow solution shrinks the next chunks right away
+    service.observe([(SolutionType.TIMEOUT, 2.0, None)])
+    assert service.chunk_size() == 2
+    service.close()
+
+
+def test_retry_splits_chunk_into_single_solutions():
+    service = EvaluationService(max_workers=1)
+    evaluation = StubEvaluation()
+    service.retry(evaluation, ["a", "b", "c"], ["x = 1", "x = 2", "x = 3"])
+
+    assert [meta for meta, _ in service.retries] == [
+        (evaluation, ["a"], ["x = 1"]),
+        (evaluation, ["b"], ["x = 2"]),
+        (evaluation, ["c"], ["x = 3"]),
+    ]
+    assert [kwargs["solutions"] for _, kwargs in service.retries] == [
+        ["x = 1"],
+        ["x = 2"],
+        ["x = 3"],
+    ]
+    assert all(kwargs["problem_id"] == "Mbpp/2" for _, kwargs in service.retries)
+    service.close()
+
+
+class FakeEvaluation:
+    """
+    The parts of `StemEvaluator` `EvaluationService.run` drives, over `PROBLEM` with the
+    expected outputs shifted by `offset`, so every problem has its own context.
+    """
+
+    def __init__(self, problem_id, solutions, offset=0, cached=(), **limits):
+        self.problem_id = problem_id
+        self.solutions = solutions
+        self.offset = offset
+        self.cached = set(cached)
+        self.limits = dict(LIMITS, **limits)
+        self.verdicts = {}
+        self.in_flight = 0
+        self.dispatched = False
+        self.finished = False
+
+    def problem_context(self):
+        expected = dict(EXPECTED)
+        for split in ("base", "plus"):
+            expected[split] = [out + self.offset for out in EXPECTED[split]]
+        return dict(PROBLEM, task_id=self.problem_id), expected
+
+    def check_kwargs(self):
+        return dict(self.limits, problem_id=self.problem_id, base_only=True)
+
+    def dispatch(self):
+        for index, solution in enumerate(self.solutions):
+            if index in self.cached:
+                self.verdicts[index] = "cached"
+                continue
+            self.in_flight += 1
+            yield index, solution
+
+    @property
+    def done(self):
+        return self.dispatched and self.in_flight == 0
+
+    def complete(self, metas, future):
+        self.in_flight -= len(metas)
+        try:
+            verdicts = [verdict for verdict, _, _ in future.result()]
+        except TimeoutError:
+            verdicts = ["killed"] * len(metas)
+        self.verdicts.update(zip(metas, verdicts))
+        return len(metas)
+
+    def finish(self):
+        self.finished = True
+
+
+PLUS_ONE = "def f(x):\n    return x + 1\n"
+PLUS_TWO = "def f(x):\n    return x + 2\n"
+LOOP = "def f(x):\n    while True:\n        pass\n"
+
+
+def evaluate(service, evaluations):
+    finished = []
+    try:
+        for evaluation in service.run(evaluations):
+            # Every result of a problem is in by the time it is yielded
+            assert evaluation.finished and evaluation.in_flight == 0
+            finished.append(evaluation)
+    finally:
+        service.close()
+    return finished
+
+
+def test_run_yields_problems_in_order():
+    slow = "import time\n\ndef f(x):\n    time.sleep(0.2)\n    return x + 1\n"
+    evaluations = [
+        FakeEvaluation("Mbpp/1", [slow, PLUS_TWO]),
+        FakeEvaluation("Mbpp/2", [PLUS_ONE, PLUS_TWO], offset=1),
+        FakeEvaluation("Mbpp/3", [PLUS_ONE]),
+    ]
+    finished = evaluate(EvaluationService(max_workers=2), evaluations)
+
+    assert finished == evaluations
+    passed, failed = SolutionType.PASSED, SolutionType.FAILED
+    assert [evaluation.verdicts for evaluation in finished] == [
+        {0: passed, 1: failed},
+        {0: failed, 1: passed},
+        {0: passed},
+    ]
+
+
+def test_run_yields_problems_answered_from_cache():
+    evaluations = [
+        FakeEvaluation("Mbpp/1", [PLUS_ONE, PLUS_TWO], cached=[0, 1]),
+        FakeEvaluation("Mbpp/2", [PLUS_ONE]),
+        FakeEvaluation("Mbpp/3", [PLUS_ONE], cached=[0]),
+    ]
+    finished = evaluate(EvaluationService(max_workers=2), evaluations)
+
+    assert finished == evaluations
+    assert evaluations[0].verdicts == {0: "cached", 1: "cached"}
+    assert evaluations[1].verdicts == {0: SolutionType.PASSED}
+
+    # Nothing reaches the pool at all
+    only_cached = [FakeEvaluation("Mbpp/1", [PLUS_ONE], cached=[0])]
+    assert evaluate(EvaluationService(max_workers=2), only_cached) == only_cached
+
+
+def test_run_restarts_pool_every_restart_size_samples(monkeypatch):
+    service = EvaluationService(max_workers=2, restart_size=2)
+    pools = []
+    create_pool = service.create_pool
+    monkeypatch.setattr(
+        service, "create_pool", lambda: pools.append(create_pool()) or pools[-1]
+    )
+    evaluations = [
+        FakeEvaluation("Mbpp/1", [PLUS_ONE] * 3),
+        FakeEvaluation("Mbpp/2", [PLUS_TWO] * 2, offset=1),
+    ]
+    finished = evaluate(service, evaluations)
+
+    assert finished == evaluations
+    assert len(pools) == 3
+    assert set(evaluations[0].verdicts.values()) == {SolutionType.PASSED}
+    assert set(evaluations[1].verdicts.values()) == {SolutionType.PASSED}
+
+
+def test_run_retries_timed_out_chunk_one_solution_at_a_time():
+    service = EvaluationService(max_workers=2, task_timeout=0.5, max_chunk_size=3)
+    # Cheap solutions observed so far, the first chunk takes all three
+    service.solution_time = 0.001
+    evaluations = [
+        FakeEvaluation("Mbpp/1", [PLUS_ONE, LOOP, PLUS_TWO], min_time_limit=2),
+        FakeEvaluation("Mbpp/2", [PLUS_ONE]),
+    ]
+    finished = evaluate(service, evaluations)
+
+    assert finished == evaluations
+    assert evaluations[0].verdicts == {
+        0: SolutionType.PASSED,
+        1: "killed",
+        2: SolutionType.FAILED,
+    }
+    assert not service.retries
+
+
+def test_worker_keeps_the_last_contexts(tmp_path):
+    service = EvaluationService(max_workers=1)
+    problem_ids = [f"Mbpp/{i}" for i in range(MAX_WORKER_CONTEXTS + 1)]
+    for i, problem_id in enumerate(problem_ids):
+        service.add_context(problem_id, ({"task_id": problem_id}, {"offset": i}))
+
+    evaluation_service.init_worker(service.context_dir)
+    try:
+        for problem_id in problem_ids:
+            assert load_context(problem_id)[0]["task_id"] == problem_id
+        assert list(evaluation_service._problem_contexts) == problem_ids[1:]
+
+        # Loaded contexts are not read again, evicted ones are
+        service.add_context(problem_ids[-1], ({"task_id": "changed"}, {}))
+        assert load_context(problem_ids[-1])[0]["task_id"] == problem_ids[-1]
+        assert load_context(problem_ids[0])[0]["task_id"] == problem_ids[0]
+        assert problem_ids[1] not in evaluation_service._problem_contexts
+    finally:
+        evaluation_service._problem_contexts.clear()
+        service.close()
@@ -0,0 +1,47 @@
+from inference.fail_fast import InputFailures, failed_input, reorder_context
+
+PROBLEM = {"base_input": [[0], [1], [2]], "plus_input": [[3], [4]]}
+EXPECTED = {
+    "base": [0, 10, 20],
+    "base_time": [0.1, 0.2, 0.3],
+    "plus": [30, 40],
+    "plus_time": [0.4, 0.5],
+}
+
+
+def test_most_failed_inputs_run_first():
+    failures = InputFailures()
+    assert failures.order(PROBLEM, base_only=False) == {
+        "base": [0, 1, 2],
+        "plus": [0, 1],
+    }
+
+    for failed in [("base", 2), ("base", 2), ("base", 1), ("plus", 1)]:
+        failures.record(failed)
+    assert failures.order(PROBLEM, base_only=True) == {"base": [2, 1, 0]}
+    assert failures.order(PROBLEM, base_only=False)["plus"] == [1, 0]
+
+
+def test_reorder_context_keeps_inputs_and_outputs_aligned():
+    order = {"base": [2, 0, 1]}
+    problem, expected_output = reorder_context(PROBLEM, EXPECTED, order)
+    assert problem["base_input"] == [[2], [0], [1]]
+    assert expected_output["base"] == [20, 0, 10]
+    assert expected_output["base_time"] == [0.3, 0.1, 0.2]
+    # Splits outside the order, and the originals, are left alone
+    assert expected_output["plus"] == EXPECTED["plus"]
+    assert PROBLEM["base_input"] == [[0], [1], [2]]
+
+
+def test_failed_input_maps_back_to_dataset_order():
+    order = {"base": [2, 0, 1], "plus": [1, 0]}
+    assert failed_input({"base": ("failed", [])}, order) == ("base", 2)
+    assert failed_input({"base": ("failed", [True])}, order) == ("base", 0)
+    passed_base = ("success", [True] * 3)
+    assert failed_input(
+        {"base": passed_base, "plus": ("timed out", [True])}, order
+    ) == ("plus", 0)
+    assert (
+        failed_input({"base": passed_base, "plus": ("success", [True] * 2)}, order)
+        is None
+    )
@@ -0,0 +1,76 @@
+import pytest
+
+from inference.processors import FormatCache, PostprocessingException, Processors
+
+
+@pytest.fixture
+def format_cache(monkeypatch):
+    cache = FormatCache()
+    monkeypatch.setattr(Processors, "format_cache", cache)
+    return cache
+
+
+def test_repeated_postprocessing_hits(format_cache):
+    original = "def f(x):\n  return x+1\n"
+    formatted = Processors.postprocess_mutation(original)
+    for _ in range(3):
+        assert Processors.postprocess_mutation(original) == formatted
+    assert (format_cache.hits, format_cache.misses) == (3, 1)
+
+    # Every function and set of flags is cached apart
+    assert Processors.postprocess_eval(original, direct=True) == formatted
+    Processors.postprocess_eval(original)
+    Processors.postprocess_canonical(original)
+    assert (format_cache.hits, format_cache.misses) == (3, 4)
+
+
+def test_failures_are_cached(format_cache):
+    for _ in range(2):
+        with pytest.raises(PostprocessingException) as info:
+            Processors.postprocess_eval("def g(:\n    pass\n")
+        assert info.value.code == "def g(:\n    pass\n"
+    assert (format_cache.hits, format_cache.misses) == (1, 1)
+
+
+def test_memory_tier_is_bounded():
+    cache = FormatCache(max_size=2)
+    keys = [cache.key("eval", "", f"x = {i}") for i in range(3)]
+    for key in keys:
+        assert cache.get(key) is None
+        cache.put(key, "x = 1\n")
+
+    assert cache.get(keys[0]) is None
+    assert cache.get(keys[2]) == ("x = 1\n", None)
+
+
+def test_disk_tier_persists_across_runs(tmp_path):
+    path = str(tmp_path / "formatted.sqlite")
+    cache = FormatCache(path=path)
+    key = cache.key("eval", "direct=False", "x=1")
+    cache.put(key, "x = 1\n")
+    failed = cache.key("eval", "direct=False", "x=")
+    cache.put(failed, None, "SyntaxError()")
+    cache.close()
+
+    resumed = FormatCache(path=path)
+    assert resumed.get(key) == ("x = 1\n", None)
+    assert resumed.get(key) == ("x = 1\n", None)
+    assert resumed.get(failed) == (None, "SyntaxError()")
+    assert (resumed.stats["disk_hits"], resumed.stats["memory_hits"]) == (2, 1)
+    resumed.close()
+
+
+def test_disk_errors_fall_back_to_memory(tmp_path, monkeypatch):
+    # The cache directory cannot be created where a file is
+    (tmp_path / "file").write_text("")
+    cache = FormatCache(path=str(tmp_path / "file" / "formatted.sqlite"))
+    assert cache.db is None
+
+    cache = FormatCache(path=str(tmp_path / "formatted.sqlite"))
+    monkeypatch.setattr(Processors, "format_cache", cache)
+    cache.db.close()
+    # Writes to the closed database fail, postprocessing carries on in memory
+    formatted = Processors.postprocess_mutation("x=1\n")
+    assert cache.db is None
+    assert Processors.postprocess_mutation("x=1\n") == formatted
+    assert (cache.hits, cache.misses) == (1, 1)
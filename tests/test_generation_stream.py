@@ -0,0 +1,58 @@
+from types import SimpleNamespace
+
+from inference.generation_stream import stream_generate
+
+
+class StandInEngine:
+    """
+    Finishes each request after as many steps as its prompt is long.
+    """
+
+    def __init__(self):
+        self.requests = {}
+        self.aborted = []
+
+    def add_request(self, request_id, prompt, params):
+        self.requests[request_id] = [prompt, len(prompt)]
+
+    def abort_request(self, request_id):
+        self.aborted.extend(request_id)
+        for rid in request_id:
+            del self.requests[rid]
+
+    def has_unfinished_requests(self):
+        return bool(self.requests)
+
+    def step(self):
+        outputs = []
+        for request_id, request in list(self.requests.items()):
+            request[1] -= 1
+            finished = request[1] == 0
+            outputs.append(
+                SimpleNamespace(
+                    request_id=request_id, finished=finished, prompt=request[0]
+                )
+            )
+            if finished:
+                del self.requests[request_id]
+        return outputs
+
+
+def test_outputs_are_yielded_as_they_finish():
+    engine = StandInEngine()
+    prompts = {"slow": "xxxx", "fast": "x", "medium": "xx"}
+    streamed = [
+        (prompt_id, output.prompt)
+        for prompt_id, output in stream_generate(engine, prompts, None)
+    ]
+    assert streamed == [("fast", "x"), ("medium", "xx"), ("slow", "xxxx")]
+    assert engine.aborted == []
+
+
+def test_closing_the_stream_aborts_unfinished_requests():
+    engine = StandInEngine()
+    stream = stream_generate(engine, {"slow": "xxxx", "fast": "x"}, None)
+    assert next(stream)[0] == "fast"
+    stream.close()
+    assert len(engine.aborted) == 1
+    assert not engine.has_unfinished_requests()
@@ -0,0 +1,90 @@
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("evalplus")
+pytest.importorskip("joblib")
+pytest.importorskip("transformers")
+
+from canonical.max_prob_initializer import MaxProbInitializer
+
+
+class FakeDatasetManager:
+    dataset = "mbpp"
+
+    def get_problem(self, problem_id):
+        return {
+            "task_id": problem_id,
+            "entry_point": "f",
+            "atol": 0,
+            "base_input": [[1], [2]],
+            "plus_input": [[3]],
+        }
+
+    def get_correct(self, problem_id):
+        return {
+            "base": [2, 3],
+            "base_time": [0.001, 0.001],
+            "plus": [4],
+            "plus_time": [0.001],
+        }
+
+
+def initializer(min_correct_samples=1, early_stop=True):
+    return MaxProbInitializer(
+        inference_engine=None,
+        dataset_manager=FakeDatasetManager(),
+        problem_id="Mbpp/2",
+        min_correct_samples=min_correct_samples,
+        early_stop=early_stop,
+        max_workers=2,
+    )
+
+
+def test_search_waits_for_higher_ranked_pending_results():
+    search = initializer()
+    # A lower-ranked pass finishes while every solution ranked above it is pending
+    assert not search._search_done({3: 1.0})
+    assert not search._search_done({3: 1.0, 0: 0.5, 1: 0.0})
+    # Solutions that do not load count as failed
+    assert search._search_done({3: 1.0, 0: 0.5, 1: 0.0, 2: None})
+    # A higher-ranked pass settles it, whatever is ranked below
+    assert search._search_done({3: 1.0, 0: 0.5, 1: 1.0})
+
+
+def test_search_needs_min_correct_samples():
+    search = initializer(min_correct_samples=2)
+    assert not search._search_done({0: 1.0})
+    assert search._search_done({0: 1.0, 2: 1.0})
+
+    assert not search._search_done({0: 0.0, 2: 1.0, 3: 1.0})
+    assert search._search_done({0: 0.0, 2: 1.0, 3: 1.0, 1: 0.5})
+    assert not search._search_done({0: 0.0, 1: 0.5, 2: 1.0})
+
+
+def ranked(*codes):
+    return [SimpleNamespace(code=code, failed_tests=None) for code in codes]
+
+
+PLUS_ONE = "def f(x):\n    return x + 1\n"
+WRONG = "def f(x):\n    return x if x > 2 else x + 1\n"
+
+
+def test_evaluate_solutions_in_a_spawned_pool():
+    solutions = ranked(WRONG, PLUS_ONE, "def f(x) return x", PLUS_ONE)
+    assert initializer(early_stop=False)._evaluate_solutions(solutions) == {
+        0: 2 / 3,
+        1: 1.0,
+        2: None,
+        3: 1.0,
+    }
+    assert solutions[0].failed_tests == [2]
+
+
+def test_evaluate_solutions_stops_with_the_search():
+    hanging = "import time\n\ndef f(x):\n    time.sleep(60)\n"
+    search = initializer()
+    # A solution ranked below the first pass is never waited for
+    pass_ratios = search._evaluate_solutions(ranked(WRONG, PLUS_ONE, hanging, hanging))
+    assert pass_ratios[0] == 2 / 3 and pass_ratios[1] == 1.0
+    assert 2 not in pass_ratios or 3 not in pass_ratios
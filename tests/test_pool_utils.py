@@ -0,0 +1,63 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from shared.pool_utils import bounded_submit
+
+
+def test_bounded_submit_yields_every_task():
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        tasks = ((i, {"base": i, "exp": 2}) for i in range(20))
+        completed = bounded_submit(partial(executor.submit, pow), tasks, 3)
+        assert {meta: future.result() for meta, future in completed} == {
+            i: i**2 for i in range(20)
+        }
+
+
+def test_bounded_submit_limits_in_flight_tasks():
+    lock = threading.Lock()
+    in_flight = [0, 0]
+
+    def task(delay):
+        with lock:
+            in_flight[0] += 1
+            in_flight[1] = max(in_flight[1], in_flight[0])
+        time.sleep(delay)
+        with lock:
+            in_flight[0] -= 1
+
+    pulled = []
+
+    def tasks():
+        for i in range(12):
+            pulled.append(i)
+            yield i, {"delay": 0.01 * (i % 3)}
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        completed = bounded_submit(partial(executor.submit, task), tasks(), 3)
+        next(completed)
+        # Tasks are pulled lazily, only as far as the window allows
+        assert len(pulled) <= 4
+        assert len(list(completed)) == 11
+
+    assert in_flight[1] <= 3
+
+
+def test_bounded_submit_runs_requeued_tasks_after_exhaustion():
+    requeue = deque()
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        tasks = ((i, {"base": i, "exp": 2}) for i in range(3))
+        completed = bounded_submit(partial(executor.submit, pow), tasks, 2, requeue)
+        results = {}
+        for meta, future in completed:
+            results[meta] = future.result()
+            # Every task comes back once as a retry, the last ones after the stream ends
+            if isinstance(meta, int):
+                requeue.append((("retry", meta), {"base": meta, "exp": 3}))
+
+    assert results == {
+        **{i: i**2 for i in range(3)},
+        **{("retry", i): i**3 for i in range(3)},
+    }
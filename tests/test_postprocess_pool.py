@@ -0,0 +1,51 @@
+import pytest
+
+from inference.postprocess_pool import PostprocessPool
+from inference.processors import FormatCache, Processors
+
+CODES = [
+    "def f(x):\n  return x+1\n",
+    "",
+    "def g(:\n    pass\n",
+    "def h():\n    # comment\n    return [1,2]\n",
+]
+
+
+@pytest.fixture
+def format_cache(monkeypatch):
+    cache = FormatCache()
+    monkeypatch.setattr(Processors, "format_cache", cache)
+    return cache
+
+
+@pytest.mark.parametrize("max_workers", [0, 2])
+def test_outcomes_keep_submission_order(max_workers, format_cache):
+    pool = PostprocessPool(max_workers=max_workers, chunk_size=3)
+    try:
+        outcomes = pool.submit(CODES).result()
+    finally:
+        pool.close()
+
+    assert [error is None for _, error in outcomes] == [True, False, False, True]
+    assert outcomes[0][0] == Processors.postprocess_eval(CODES[0])
+    assert outcomes[3][0] == Processors.postprocess_eval(CODES[3])
+    assert "PostprocessingException" in outcomes[1][1]
+
+
+def test_worker_outcomes_reach_the_disk_tier(tmp_path, monkeypatch):
+    path = str(tmp_path / "formatted.sqlite")
+    monkeypatch.setattr(Processors, "format_cache", FormatCache(path=path))
+    pool = PostprocessPool(max_workers=2, chunk_size=3)
+    try:
+        outcomes = pool.submit(CODES).result()
+        Processors.format_cache.close()
+
+        # A later run finds every code on disk and sends none of them to the workers
+        resumed = FormatCache(path=path)
+        monkeypatch.setattr(Processors, "format_cache", resumed)
+        job = pool.submit(CODES)
+        assert job.pending == []
+        assert job.result() == outcomes
+        assert resumed.stats["disk_hits"] == len(CODES)
+    finally:
+        pool.close()
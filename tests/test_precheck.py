@@ -0,0 +1,33 @@
+from inference.precheck import precheck_solution
+from shared.structs import SolutionType
+
+
+def test_precheck_rejects_empty_and_uncompilable():
+    assert precheck_solution("", "f") == SolutionType.BAD_SYNTAX
+    assert precheck_solution("  \n", "f") == SolutionType.BAD_SYNTAX
+    assert precheck_solution("def f(:\n    pass", "f") == SolutionType.BAD_SYNTAX
+    # Only caught by the compiler, not the parser
+    assert (
+        precheck_solution("def f():\n    pass\nreturn 1", "f")
+        == SolutionType.BAD_SYNTAX
+    )
+    assert (
+        precheck_solution("def f():\n    return '\0'\n\0", "f")
+        == SolutionType.BAD_SYNTAX
+    )
+
+
+def test_precheck_rejects_missing_entry_point():
+    assert precheck_solution("def g():\n    return 1", "f") == SolutionType.BAD_SYNTAX
+    assert (
+        precheck_solution("def f_helper():\n    return 1", "f")
+        == SolutionType.BAD_SYNTAX
+    )
+
+
+def test_precheck_passes_runnable_solutions():
+    assert precheck_solution("def f():\n    return 1", "f") is None
+    assert precheck_solution("f = lambda: 1", "f") is None
+    assert precheck_solution("from math import sqrt as f", "f") is None
+    # Fails at runtime, which only the worker can tell
+    assert precheck_solution("def f():\n    return x", "f") is None
@@ -0,0 +1,114 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("transformers")
+
+from inference.postprocess_pool import PostprocessPool
+from inference.predict import InferenceEngine
+from inference.prefix_scheduler import PrefixScheduler
+from shared.structs import BenchmarkResult, MutatedStem
+
+COMPLETION = "\n    return y\n"
+
+
+def request_output(prompt, n):
+    outputs = [
+        SimpleNamespace(text=COMPLETION, cumulative_logprob=-1.0, token_ids=[1, 2])
+        for _ in range(n)
+    ]
+    return SimpleNamespace(prompt=prompt, outputs=outputs, finished=True)
+
+
+class FakeLLM:
+    """
+    Completes every prompt with `COMPLETION`, through `generate` or, when streaming, an
+    engine that finishes the requests of each call in reverse order.
+    """
+
+    def __init__(self):
+        self.calls = []
+        self.requests = {}
+        self.llm_engine = self
+
+    def generate(self, prompts, sampling_params):
+        self.calls.append(list(prompts))
+        return [request_output(prompt, sampling_params.n) for prompt in prompts]
+
+    def add_request(self, request_id, prompt, params):
+        if not self.requests:
+            self.calls.append([])
+        self.calls[-1].append(prompt)
+        self.requests[request_id] = request_output(prompt, params.n)
+
+    def abort_request(self, request_id):
+        pass
+
+    def has_unfinished_requests(self):
+        return bool(self.requests)
+
+    def step(self):
+        request_id, output = self.requests.popitem()
+        return [SimpleNamespace(request_id=request_id, **vars(output))]
+
+
+def engine(streaming):
+    # Everything `InferenceEngine.__init__` sets up besides vLLM and the tokenizer
+    inference_engine = InferenceEngine.__new__(InferenceEngine)
+    inference_engine.llm = FakeLLM()
+    inference_engine.direct_completion = True
+    inference_engine.streaming = streaming
+    inference_engine.scheduler = PrefixScheduler()
+    inference_engine.sampling_params = SimpleNamespace()
+    inference_engine.postprocess_pool = PostprocessPool(max_workers=0)
+    inference_engine.postprocess_fast_path = True
+    return inference_engine
+
+
+def stem(i):
+    return MutatedStem(
+        original_stem=f"def f{i}(x):\n    y = x + {i}",
+        mutated_stem=f"def f{i}(x):\n    y = {i} + x",
+    )
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_batched_stems_are_chunked_and_mapped_back(streaming):
+    inference_engine = engine(streaming)
+    stems = {"a": (stem(1), True), "b": (stem(2), False), "c": (stem(3), True)}
+    results = {
+        ident: BenchmarkResult("Mbpp/2", "m", ident, "0", 0.8) for ident in stems
+    }
+
+    completions = inference_engine.sample_stems_solutions(
+        stems, results, temp=0.8, num_samples=2, max_prompts_per_call=2
+    )
+
+    calls = inference_engine.llm.calls
+    # Calls are grouped by shared prefix, none with more than `max_prompts_per_call`
+    assert sorted(len(call) for call in calls) == [1, 2, 2]
+    assert sorted(sum(calls, [])) == sorted(
+        code
+        for stem_, include_original in stems.values()
+        for code in [stem_.original_stem] * include_original + [stem_.mutated_stem]
+    )
+
+    # A stem sampled without its original prompt only gets mutated completions
+    assert completions["b"] == {
+        "mutated": ["def f2(x):\n    y = 2 + x\n    return y\n"] * 2
+    }
+    for ident, i in (("a", 1), ("c", 3)):
+        assert completions[ident] == {
+            "original": [f"def f{i}(x):\n    y = x + {i}\n    return y\n"] * 2,
+            "mutated": [f"def f{i}(x):\n    y = {i} + x\n    return y\n"] * 2,
+        }
+        assert results[ident].original_prefix == stems[ident][0].original_stem
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_throughput_log_survives_instant_calls(streaming, monkeypatch):
+    inference_engine = engine(streaming)
+    monkeypatch.setattr(time, "perf_counter", lambda: 0.0)
+    sequences = inference_engine.generate({"p": "def f():"}, 1, 0.8, logprobs=False)
+    assert sequences == {"p": [{"text": COMPLETION, "cumulative_logprob": -1.0}]}
@@ -0,0 +1,52 @@
+from inference.prefix_scheduler import PrefixScheduler, PrefixTrie
+
+
+def test_trie_insert_returns_shared_prefix():
+    trie = PrefixTrie()
+    assert trie.insert("abcd", 0) == 0
+    assert trie.insert("abxy", 1) == 2
+    assert trie.insert("abcd", 2) == 4
+    assert trie.insert("z", 3) == 0
+
+
+def test_order_groups_shared_prefixes():
+    scheduler = PrefixScheduler()
+    prompts = {
+        "a1": "header\ndef f():\n    a = 1",
+        "b1": "header\ndef g():\n    b = 1",
+        "a2": "header\ndef f():\n    a = 1\n    return a",
+        "b2": "header\ndef g():\n    b = 2",
+        "a3": "header\ndef f():\n    a = 0x1",
+    }
+    calls, _ = scheduler.schedule(prompts)
+    assert len(calls) == 1
+    order = calls[0]
+    assert sorted(order) == sorted(prompts)
+    f_positions = sorted(order.index(i) for i in ("a1", "a2", "a3"))
+    assert f_positions[-1] - f_positions[0] == 2
+    # The prompt extending `a1` follows it directly
+    assert order.index("a2") == order.index("a1") + 1
+
+
+def test_split_cuts_between_groups():
+    scheduler = PrefixScheduler()
+    prompts = {f"f{i}": f"def f():\n    x = {i}" for i in range(3)}
+    prompts.update({f"g{i}": f"def g():\n    y = {i}" for i in range(3)})
+    calls, _ = scheduler.schedule(prompts, max_prompts_per_call=4)
+    assert [sorted(call) for call in calls] == [["f0", "f1", "f2"], ["g0", "g1", "g2"]]
+
+    calls, _ = scheduler.schedule(prompts, max_prompts_per_call=1)
+    assert len(calls) == 6
+
+
+def test_stats_count_cached_blocks():
+    scheduler = PrefixScheduler(block_size=4)
+    prompts = {0: "abcdefgh", 1: "abcdefxy", 2: "abcdefgh"}
+    calls, stats = scheduler.schedule(prompts)
+    # The second prompt shares 6 tokens (one full block), the third all 8 (two blocks)
+    assert (stats.prompts, stats.prompt_tokens, stats.cached_tokens) == (3, 24, 12)
+    assert stats.hit_rate == 0.5
+
+    # Nothing is assumed to be cached across calls
+    _, split_stats = scheduler.schedule(prompts, max_prompts_per_call=1)
+    assert split_stats.cached_tokens == 0
@@ -0,0 +1,52 @@
+from collections import Counter
+
+import black
+import pytest
+from cachetools import LRUCache
+
+from inference.processors import BLACK_MODE, Processors
+
+
+@pytest.fixture(autouse=True)
+def stable_lines(monkeypatch):
+    monkeypatch.setattr(Processors, "stable_lines", LRUCache(maxsize=1000))
+    monkeypatch.setattr(Processors, "fast_path_stats", Counter())
+
+
+def test_fast_path_skips_black_for_known_stable_lines():
+    code = "import math\ndef foo(x):\n    return math.sqrt(x)"
+    expected = "import math\ndef foo(x):\n    return math.sqrt(x)\n"
+    assert Processors.format_stable(code) == expected
+    assert Processors.format_stable(code) == expected
+    assert Processors.fast_path_stats == {"formatted": 1, "skipped": 1}
+
+    # A line black changes is never skipped
+    assert Processors.format_stable("def foo(x):\n    return x+1") == (
+        "def foo(x):\n    return x + 1\n"
+    )
+    assert Processors.format_stable("def foo(x):\n    return x+1") == (
+        "def foo(x):\n    return x + 1\n"
+    )
+    assert Processors.fast_path_stats["formatted"] == 3
+
+
+def test_fast_path_keys_lines_by_their_surroundings():
+    statement = 'def foo():\n    x = 1\n    """  x  """\n    return x'
+    Processors.format_stable(statement)
+    # The same string is a docstring right after the `def`, which black strips
+    docstring = 'def foo():\n    """  x  """\n    x = 1\n    return x'
+    assert Processors.format_stable(docstring) == black.format_str(
+        docstring, mode=BLACK_MODE
+    )
+    assert Processors.fast_path_stats["formatted"] == 2
+
+    # A `...` body is joined to its `def`
+    Processors.format_stable("def foo():\n    return 1")
+    assert Processors.format_stable("def foo():\n    ...") == "def foo(): ...\n"
+
+
+def test_fast_path_formats_wrapped_statements():
+    code = "def foo():\n    return [\n        1]"
+    for _ in range(2):
+        assert Processors.format_stable(code) == "def foo():\n    return [1]\n"
+    assert Processors.fast_path_stats["skipped"] == 0
@@ -1,5 +1,12 @@
 import pytest
-from shared.program_utils import remove_comments_and_docstrings, parse_stem
+from shared.program_utils import (
+    logical_lines,
+    normalize_direct_completion,
+    remove_comments_and_docstrings,
+    parse_stem,
+    stratified_order,
+    stratified_sample,
+)
 
 
 def test_remove_comments():
@@ -492,3 +499,73 @@ def func(x):
     result_old, result_new = parse_stem(old_code, new_code, 1)
     assert result_new.strip() == expected_new.strip(), f"Failed for new code. Expected: {expected_new}, Got: {result_new}"
     assert result_old.strip() == expected_old.strip(), f"Failed for old code. Expected: {expected_old}, Got: {result_old}"
+
+
+def test_stratified_sample():
+    items = list(range(10))
+    assert stratified_sample(items, 2) == [2, 7]
+    assert stratified_sample(items, 5) == [1, 3, 5, 7, 9]
+    assert stratified_sample(items, 1) == [5]
+    assert stratified_sample(items, 20) == items
+    assert stratified_sample(items, 0) == []
+
+
+def test_stratified_order():
+    items = list(range(10))
+    assert stratified_order(items, 2) == [2, 7, 3, 8, 1, 6, 4, 9, 0, 5]
+    assert stratified_order(items, 4)[:4] == stratified_sample(items, 4)
+    assert sorted(stratified_order(items, 3)) == items
+    assert stratified_order(items, 20) == items
+    assert stratified_order(items, 0) == items
+
+
+def test_normalize_direct_completion_truncates_and_reindents():
+    source = """import math
+
+def foo(x):
+\tif x:  # positive
+\t\treturn [
+\t\t  math.sqrt(x)]
+\t# I am a mutation
+\treturn None
+
+# Test cases
+print(foo(4))
+"""
+    expected = """import math
+def foo(x):
+    if x:
+        return [
+    math.sqrt(x)]
+    # I am a mutation
+    return None"""
+    assert normalize_direct_completion(source) == expected
+
+
+def test_normalize_direct_completion_rejects_broken_indentation():
+    assert normalize_direct_completion("def foo():\n    x = 1\n   return x\n") is None
+    assert normalize_direct_completion("def foo():\n    x = 1\n     return x\n") is None
+    assert normalize_direct_completion("def foo(:\n    return 1\n") is None
+
+
+def test_logical_lines():
+    source = """import os
+
+def foo(a,
+        b):
+    \"\"\"Doc
+
+    more\"\"\"
+    # I am a mutation
+    if a: return b  # early
+    for x in a:
+        pass"""
+    assert logical_lines(source) == [
+        ("import os", "line"),
+        ("def foo(a,\n        b):", "wrapped"),
+        ('    """Doc\n\n    more"""', "line"),
+        ("    # I am a mutation", "comment"),
+        ("    if a: return b  # early", "line"),
+        ("    for x in a:", "block"),
+        ("        pass", "line"),
+    ]
@@ -0,0 +1,55 @@
+from inference.stem_deduplicator import StemDeduplicator
+from shared.structs import BenchmarkResult, MutatedStem
+
+
+def test_duplicate_stems_share_source():
+    deduplicator = StemDeduplicator()
+    stem = MutatedStem(original_stem="def f():\n    a = 1", mutated_stem="def f():\n    a = 0x1")
+    same = MutatedStem(original_stem="def f():\n    a = 1\n", mutated_stem="def f():\n    a = 0x1\n")
+    other = MutatedStem(original_stem="def f():\n    a = 1", mutated_stem="def f():\n    a = 0o1")
+
+    assert deduplicator.source_for("p-0-0-T0.3", stem, 0.3) is None
+    assert deduplicator.source_for("p-1-0-T0.3", same, 0.3) == "p-0-0-T0.3"
+    assert deduplicator.source_for("p-2-0-T0.3", other, 0.3) is None
+    # Different temperatures are sampled separately
+    assert deduplicator.source_for("p-1-0-T0.5", same, 0.5) is None
+    assert (deduplicator.total, deduplicator.duplicates) == (4, 1)
+
+
+def test_share_outcomes():
+    source = BenchmarkResult(problem_id="p", mutation="A", mutation_id="0", stem_id="0", temp=0.3)
+    source.add_pass_ats({1: 0.5}, {1: 0.25})
+    source.pass_at_diff = {1: -0.25}
+    source.add_example("x = 1", "passed", mutated=False)
+
+    shared = BenchmarkResult(problem_id="p", mutation="B", mutation_id="1", stem_id="0", temp=0.3)
+    shared.share_outcomes(source)
+    assert shared.pass_at_original == {1: 0.5}
+    assert shared.pass_at_diff == {1: -0.25}
+    assert shared.examples["passed"]["original"] == ["x = 1"]
+    assert shared.examples is not source.examples
+
+
+def test_original_stems_share_source():
+    deduplicator = StemDeduplicator()
+    hex_stem = MutatedStem(original_stem="def f():\n    a = 1", mutated_stem="def f():\n    a = 0x1")
+    oct_stem = MutatedStem(original_stem="def f():\n    a = 1", mutated_stem="def f():\n    a = 0o1")
+
+    assert deduplicator.original_source_for("p-0-0-T0.3", hex_stem, 0.3) is None
+    assert deduplicator.original_source_for("p-1-0-T0.3", oct_stem, 0.3) == "p-0-0-T0.3"
+    assert deduplicator.original_source_for("p-1-0-T0.5", oct_stem, 0.5) is None
+    assert deduplicator.shared_originals == 1
+
+
+def test_share_original():
+    source = BenchmarkResult(problem_id="p", mutation="A", mutation_id="0", stem_id="0", temp=0.3)
+    source.add_pass_ats({1: 0.5}, {1: 0.25})
+    source.add_example("x = 1", "passed", mutated=False)
+    source.add_example("x = 0x1", "passed", mutated=True)
+
+    shared = BenchmarkResult(problem_id="p", mutation="B", mutation_id="1", stem_id="0", temp=0.3)
+    shared.add_example("x = 0o1", "failed", mutated=True)
+    shared.share_original(source)
+    assert shared.pass_at_original == {1: 0.5}
+    assert shared.examples["passed"] == {"original": ["x = 1"], "mutated": []}
+    assert shared.examples["failed"] == {"original": [], "mutated": ["x = 0o1"]}
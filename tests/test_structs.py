@@ -0,0 +1,82 @@
+import json
+import pickle
+import random
+
+from shared.structs import MAX_EXAMPLES, BenchmarkResult, SolutionType, example_hash
+
+
+def make_result():
+    return BenchmarkResult(
+        problem_id="Mbpp/2", mutation="A", mutation_id="0", stem_id="0", temp=0.3
+    )
+
+
+def test_examples_keep_exact_counts_and_a_bounded_sample():
+    result = make_result()
+    solutions = [f"x = {i % 30}" for i in range(200)]
+    for solution in solutions:
+        result.add_example(solution, SolutionType.PASSED, mutated=True)
+
+    assert result.example_counts[SolutionType.PASSED] == {"original": 0, "mutated": 200}
+    hashes = result.example_hashes[SolutionType.PASSED]["mutated"]
+    assert len(hashes) == 30 and sum(hashes.values()) == 200
+
+    examples = result.examples[SolutionType.PASSED]["mutated"]
+    assert len(examples) == MAX_EXAMPLES
+    assert set(examples) <= set(solutions)
+
+    # The sample only depends on which solutions arrived, not on their order
+    assert examples == sorted(set(solutions), key=example_hash)[:MAX_EXAMPLES]
+    random.Random(0).shuffle(solutions)
+    again = make_result()
+    for solution in solutions:
+        again.add_example(solution, SolutionType.PASSED, mutated=True)
+    assert again.examples == result.examples
+
+
+def test_json_keeps_the_examples_schema():
+    result = make_result()
+    result.add_example("x = 1", SolutionType.FAILED, mutated=False)
+    examples = json.loads(json.dumps(result.__dict__))["examples"]
+    assert examples[SolutionType.FAILED] == {"original": ["x = 1"], "mutated": []}
+
+
+def test_results_pickled_with_every_example_are_compacted():
+    result = make_result()
+    del result.example_counts, result.example_hashes
+    result.examples = {
+        SolutionType.PASSED: {
+            "original": [f"x = {i}" for i in range(25)],
+            "mutated": [],
+        }
+    }
+
+    loaded = pickle.loads(pickle.dumps(result))
+    assert loaded.example_counts[SolutionType.PASSED]["original"] == 25
+    assert len(loaded.examples[SolutionType.PASSED]["original"]) == MAX_EXAMPLES
+    assert loaded.example_counts[SolutionType.TIMEOUT] == {"original": 0, "mutated": 0}
+
+
+def test_share_original_copies_counts():
+    source = make_result()
+    for i in range(3):
+        source.add_example(f"x = {i}", SolutionType.PASSED, mutated=False)
+    result = make_result()
+    result.add_example("y = 1", SolutionType.PASSED, mutated=True)
+
+    result.share_original(source)
+    assert result.example_counts[SolutionType.PASSED] == {"original": 3, "mutated": 1}
+    assert result.examples[SolutionType.PASSED]["original"] == [
+        "x = 0",
+        "x = 1",
+        "x = 2",
+    ]
+
+
+def test_levenshtein_is_reported_as_sampled():
+    result = make_result()
+    result.add_example("x = 1", SolutionType.PASSED, mutated=False)
+    result.add_example("x = 12", SolutionType.PASSED, mutated=True)
+    result.compute_metrics()
+    assert result.sampled_average_levenshtein == 1
+    assert "average_levenshtein" not in json.loads(json.dumps(result.__dict__))
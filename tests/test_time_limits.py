@@ -0,0 +1,86 @@
+import pytest
+
+from inference import time_limits
+from inference.time_limits import TimeLimits, measure_runtimes
+
+PROBLEM = {
+    "prompt": "",
+    "canonical_solution": "def f(xs):\n    xs.append(0)\n    return len(xs)\n",
+    "entry_point": "f",
+    "base_input": [[[1]], [[1, 2]]],
+    "plus_input": [[[]]],
+}
+
+
+class FakeDatasetManager:
+    dataset_hash = "hash"
+
+    def get_problem(self, problem_id):
+        return PROBLEM
+
+    def get_correct(self, problem_id):
+        return {
+            "base": [2, 3],
+            "base_time": [9.0, 9.0],
+            "plus": [1],
+            "plus_time": [9.0],
+        }
+
+
+def test_measure_runtimes_covers_every_input():
+    runtimes = measure_runtimes(PROBLEM, repeats=2)
+    assert [len(runtimes["base_time"]), len(runtimes["plus_time"])] == [2, 1]
+    assert all(0 <= t < 1 for t in runtimes["base_time"] + runtimes["plus_time"])
+    # Inputs changed by the canonical solution are measured on copies
+    assert PROBLEM["base_input"] == [[[1]], [[1, 2]]]
+
+
+def test_limits_apply_margin_and_floor(tmp_path):
+    limits = TimeLimits(FakeDatasetManager(), margin=2.0, cache_dir=str(tmp_path))
+    limits.runtimes["Mbpp/2"] = {"base_time": [0.01, 0.5], "plus_time": [2.0]}
+    assert limits.limits("Mbpp/2") == {"base_time": [0.1, 1.0], "plus_time": [4.0]}
+    assert limits.check_kwargs() == {"min_time_limit": 0.1, "gt_time_limit_factor": 2.0}
+
+    expected_output = limits.expected_output("Mbpp/2")
+    assert expected_output["base"] == [2, 3]
+    assert expected_output["base_time"] == [0.01, 0.5]
+
+
+def test_runtimes_are_cached_across_runs(tmp_path, monkeypatch):
+    limits = TimeLimits(FakeDatasetManager(), cache_dir=str(tmp_path))
+    runtimes = limits.runtimes_of("Mbpp/2")
+
+    def measure_again(problem, repeats):
+        pytest.fail("Cached runtimes were measured again")
+
+    monkeypatch.setattr(time_limits, "measure_runtimes", measure_again)
+    resumed = TimeLimits(FakeDatasetManager(), cache_dir=str(tmp_path))
+    assert resumed.runtimes_of("Mbpp/2") == runtimes
+
+
+def test_fingerprint_follows_limits(tmp_path):
+    limits = TimeLimits(FakeDatasetManager(), margin=2.0, cache_dir=str(tmp_path))
+    limits.runtimes["Mbpp/2"] = {"base_time": [0.01, 0.5], "plus_time": [2.0]}
+    fingerprint = limits.fingerprint("Mbpp/2")
+    assert fingerprint == limits.fingerprint("Mbpp/2")
+
+    limits.margin = 3.0
+    assert limits.fingerprint("Mbpp/2") != fingerprint
+    limits.margin = 2.0
+    limits.runtimes["Mbpp/2"]["plus_time"] = [2.5]
+    assert limits.fingerprint("Mbpp/2") != fingerprint
+
+
+def test_hanging_canonical_solution_keeps_evalplus_runtimes(tmp_path, monkeypatch):
+    manager = FakeDatasetManager()
+    hanging = dict(
+        PROBLEM, canonical_solution="def f(xs):\n    while True:\n        pass\n"
+    )
+    monkeypatch.setattr(manager, "get_problem", lambda problem_id: hanging)
+
+    limits = TimeLimits(manager, timeout=0.5, cache_dir=str(tmp_path))
+    limits.calibrate(["Mbpp/2"])
+    assert limits.runtimes_of("Mbpp/2") == {"base_time": [9.0, 9.0], "plus_time": [9.0]}
+
+    # Fallbacks are not cached, the next run measures again
+    assert TimeLimits(manager, cache_dir=str(tmp_path)).runtimes == {}
@@ -0,0 +1,68 @@
+import sqlite3
+
+from inference.verdict_cache import VerdictCache
+
+
+def test_key_normalizes_solution():
+    cache = VerdictCache()
+    key = cache.key("hash", "Mbpp/2", True, "def f():\n    return 1\n")
+    assert key == cache.key("hash", "Mbpp/2", True, "def f():\r\n    return 1  \n\n")
+    assert key != cache.key("hash", "Mbpp/2", False, "def f():\n    return 1\n")
+    assert key != cache.key("hash", "Mbpp/3", True, "def f():\n    return 1\n")
+    assert key != cache.key(
+        "hash", "Mbpp/2", True, "def f():\n    return 1\n", fail_fast=True
+    )
+    # Leading indentation can change whether the solution runs at all
+    assert key != cache.key("hash", "Mbpp/2", True, "  def f():\n    return 1\n")
+
+
+def test_memory_tier_is_bounded():
+    cache = VerdictCache(max_size=2)
+    keys = [cache.key("hash", "Mbpp/2", True, f"x = {i}") for i in range(3)]
+    for key in keys:
+        assert cache.get(key) is None
+        cache.put(key, "passed")
+
+    assert cache.get(keys[0]) is None
+    assert cache.get(keys[2]) == "passed"
+    assert (cache.stats["memory_hits"], cache.stats["misses"]) == (1, 4)
+
+
+def test_disk_tier_persists_across_runs(tmp_path):
+    path = str(tmp_path / "verdicts.sqlite")
+    cache = VerdictCache(path=path)
+    key = cache.key("hash", "Mbpp/2", True, "x = 1")
+    cache.put(key, "failed")
+    cache.close()
+
+    resumed = VerdictCache(path=path)
+    assert resumed.get(key) == "failed"
+    assert resumed.get(key) == "failed"
+    assert (resumed.stats["disk_hits"], resumed.stats["memory_hits"]) == (1, 1)
+    resumed.close()
+
+
+def test_key_separates_time_limits():
+    cache = VerdictCache()
+    key = cache.key("hash", "Mbpp/2", True, "x = 1", limits="calibrated-abc")
+    assert key == cache.key("hash", "Mbpp/2", True, "x = 1", limits="calibrated-abc")
+    assert key != cache.key("hash", "Mbpp/2", True, "x = 1", limits="calibrated-def")
+    assert key != cache.key("hash", "Mbpp/2", True, "x = 1")
+
+
+def test_old_schema_is_dropped(tmp_path):
+    path = str(tmp_path / "verdicts.sqlite")
+    db = sqlite3.connect(path)
+    db.execute(
+        "CREATE TABLE verdicts (dataset_hash TEXT, problem_id TEXT, "
+        "base_only INTEGER, fail_fast INTEGER, solution_hash TEXT, verdict TEXT)"
+    )
+    db.commit()
+    db.close()
+
+    cache = VerdictCache(path=path)
+    key = cache.key("hash", "Mbpp/2", True, "x = 1", limits="calibrated-abc")
+    assert cache.get(key) is None
+    cache.put(key, "passed")
+    cache.close()
+    assert VerdictCache(path=path).get(key) == "passed"
@@ -1,9 +1,18 @@
 import ast
 import copy
+from itertools import chain
 
+from mutations import (
+    OneByOneTransformer,
+    RegisteredTransformation,
+    fused_candidates,
+    fused_transform,
+)
+from mutations.registry import MutationRegistry
 from mutations.visitor import OneByOneVisitor
+from shared.ast_utils import ParsedProgram, StatementGroup
 
-from utils import verify_visitor
+from utils import verify_visitor, normalize
 
 
 class DummyOneByOneVisitor(OneByOneVisitor):
@@ -60,3 +69,194 @@ def test_multi_visitor():
     """
     expected = ["var_0 = 2\nprint(foo)", "var_1 = 2\nprint(foo)", "var_2 = 2\nprint(foo)"]
     verify_visitor(MultiOneByOneVisitor, code, expected)
+
+
+def test_structural_sharing_matches_deep_copy():
+    code = """
+    def foo(a):
+        b = a + 1
+        for i in range(b):
+            c = i
+        return b
+    """
+    code = normalize(code)
+    shared = DummyOneByOneVisitor(code).transform()
+    legacy = DummyOneByOneVisitor(code, structural_sharing=False).transform()
+    assert shared == legacy
+
+
+def test_structural_sharing_leaves_original_tree():
+    code = "a = 1\nif a:\n    b = 2"
+    visitor = DummyOneByOneVisitor(code)
+    visitor.transform()
+    assert ast.unparse(visitor.ast_tree) == code
+    assert len(visitor.transformations) == 2
+    # Untouched subtrees are shared rather than copied
+    first, second = visitor.transformations
+    assert first.body[1] is visitor.ast_tree.body[1]
+    assert second.body[0] is visitor.ast_tree.body[0]
+
+
+class ExpandAssignVisitor(OneByOneVisitor):
+    def is_transformable(self, node):
+        return isinstance(node, ast.Assign)
+
+    def transform_node(self, node) -> list[ast.AST] | ast.AST:
+        return StatementGroup(body=[node, ast.Expr(value=ast.Call(
+            func=ast.Name(id="print", ctx=ast.Load()), args=[node.targets[0]], keywords=[]
+        ))])
+
+
+class NegateCompareVisitor(OneByOneVisitor):
+    def is_transformable(self, node):
+        return isinstance(node, ast.Compare)
+
+    def transform_node(self, node) -> list[ast.AST] | ast.AST:
+        return ast.UnaryOp(op=ast.Not(), operand=node)
+
+
+def test_splice_matches_unparse():
+    code = """
+    def foo(a):
+        b = a * (a + 1)
+        if a > b:
+            c = 1
+        elif a == b and b < 3:
+            c = 2
+        return b
+    """
+    code = normalize(code)
+    for visitor in (DummyOneByOneVisitor, ExpandAssignVisitor, NegateCompareVisitor):
+        spliced = visitor(code).transform()
+        unparsed = visitor(code, splice=False).transform()
+        assert spliced == unparsed
+
+
+def test_splice_indents_statement_groups():
+    code = "if x:\n    a = 1\nb = 2"
+    expected = [
+        "if x:\n    a = 1\n    print(a)\nb = 2",
+        "if x:\n    a = 1\nb = 2\nprint(b)",
+    ]
+    visitor = ExpandAssignVisitor(code)
+    assert visitor.is_normalized()
+    assert visitor.transform() == expected
+
+
+def test_shared_parsed_program():
+    code = "a = 1\nif a > 0:\n    b = a + 1"
+    program = ParsedProgram(code)
+    assert [type(node) for node in program.nodes_of_type(ast.stmt)] == [
+        ast.Assign,
+        ast.If,
+        ast.Assign,
+    ]
+    assert program.nodes_of_type(ast.Compare, ast.BinOp) == [
+        program.tree.body[1].test,
+        program.tree.body[1].body[0].value,
+    ]
+
+    for visitor in (DummyOneByOneVisitor, ExpandAssignVisitor, NegateCompareVisitor):
+        assert visitor(program).transform() == visitor(code).transform()
+    assert ast.unparse(program.tree) == code
+
+
+def test_fused_transform_matches_transformers():
+    code = """
+    def foo(a):
+        b = [a * 2, a + 1]
+        while a > 0:
+            a -= 1
+        return len(b) == 2
+    """
+    code = normalize(code)
+    transformers = [
+        transformer()
+        for transformer in chain.from_iterable(MutationRegistry.get())
+        if issubclass(transformer, OneByOneTransformer)
+        and transformer.__name__ != "IdentifierObfuscateTransformer"
+    ]
+
+    fused = {transformer: [] for transformer in transformers}
+    for transformer, mutant in fused_transform(transformers, ParsedProgram(code)):
+        fused[transformer].append(mutant)
+
+    for transformer in transformers:
+        # Hand every node to `is_transformable`, so `node_types` can't skip any
+        program = ParsedProgram(code)
+        visitor = transformer.visitor(program)
+        expected = [
+            mutant for node in program.nodes for mutant in visitor.visit_node(node)
+        ]
+        assert fused[transformer] == expected, transformer
+
+
+def test_iter_transform_budget():
+    code = "\n".join(f"a{i} = {i}" for i in range(10))
+    visitor = DummyOneByOneVisitor(code)
+    assert list(visitor.iter_transform()) == DummyOneByOneVisitor(code).transform()
+    # Rendered mutants don't keep their trees around
+    assert visitor.transformations == []
+
+    # The budget's first mutants are spread over the program, and the rest follow
+    ordered = list(DummyOneByOneVisitor(code).iter_transform(max_mutants=2))
+    assert ordered[:2] == [
+        code.replace("a2 = 2", "a2 = 42"),
+        code.replace("a7 = 7", "a7 = 42"),
+    ]
+    assert sorted(ordered) == sorted(DummyOneByOneVisitor(code).transform())
+
+    # Every node gives one mutant before any node gives a second
+    multi = list(MultiOneByOneVisitor(code).iter_transform(max_mutants=2))
+    assert len(multi) == 30
+    assert multi[:2] == [
+        code.replace("a2 = 2", "var_0 = 2"),
+        code.replace("a7 = 7", "var_0 = 7"),
+    ]
+    assert all("var_0" in mutant for mutant in multi[:10])
+    assert sorted(multi) == sorted(MultiOneByOneVisitor(code).transform())
+
+
+def test_fused_candidates_match_transformers():
+    code = "\n".join(f"a{i} = {i}" for i in range(10))
+    transformers = [
+        transformer()
+        for transformer in chain.from_iterable(MutationRegistry.get())
+        if issubclass(transformer, OneByOneTransformer)
+        and transformer.__name__ != "IdentifierObfuscateTransformer"
+    ]
+
+    program = ParsedProgram(code)
+    for max_mutants in (None, 3):
+        candidates = fused_candidates(transformers, program, max_mutants=max_mutants)
+        for transformer, mutants in candidates:
+            expected = list(transformer.iter_mutants(program, max_mutants=max_mutants))
+            assert list(mutants) == expected, transformer
+
+
+class RepeatingTransformer(RegisteredTransformation, abstract=True):
+    @property
+    def attack_func(self):
+        # Leading mutants are duplicates or change nothing
+        return lambda program: [
+            program.code,
+            program.code,
+            program.code.replace("1", "2"),
+            program.code.replace("1", "2"),
+            program.code.replace("1", "3"),
+        ]
+
+
+def test_budget_counts_distinct_stems():
+    code = "def foo(a):\n    return a + 1"
+    transformer = RepeatingTransformer()
+    stems = transformer.get_transformations(code, max_mutants=2)
+    assert [stem.mutated_stem for stem in stems] == [
+        "def foo(a):\n    return a + 2",
+        "def foo(a):\n    return a + 3",
+    ]
+
+    mutants = iter(transformer.attack_func(ParsedProgram(code)) + ["unused"])
+    assert transformer.collect_stems(code, mutants, max_mutants=2) == stems
+    # Nothing past the budget's last stem is consumed
+    assert list(mutants) == ["unused"]